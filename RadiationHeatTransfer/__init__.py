@@ -1,4 +1,19 @@
-from . import blackbody
-from . import enclosures
-from . import viewgr
-from . import view3d
+# The submodules are imported on first attribute access, so that
+# `import RadiationHeatTransfer` does not pull in scipy, matplotlib or plotly
+import importlib
+
+__all__ = ['blackbody', 'enclosures', 'viewgr', 'view3d', 'zonal', 'cache', 'viewfactors', 'raytrace',
+           'instrument', 'sweep',
+           'hierarchical', 'outofcore']
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module('.' + name, __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
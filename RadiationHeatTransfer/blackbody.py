@@ -6,17 +6,64 @@ Blackbody Radiation:
 This file will include all functions associated with black body radiation
 """
 
-from math import pi, exp
-from scipy.integrate import quad
+import os
+from fractions import Fraction
+from math import pi, exp, factorial, comb
 import numpy as np
-np.warnings.filterwarnings('ignore')
-from scipy.interpolate import interp1d
 from itertools import count
 from itertools import takewhile
-from scipy.integrate import cumtrapz
 
-
-def Eblambda(lmbda: float, T: float, n: float = 1):
+from . import instrument
+
+# Constants
+# c_0: the speed of light in a vacuum
+c_0: float = 2.9979 * 10**8  # (m/s)
+# k: Boltzmann's constant
+k: float = 1.38065 * 10**(-23)  # (J/K)
+# h: Planck's constant
+h: float = 6.626 * 10**(-34)  # (J.s)
+
+# Radiation constants derived from the above
+C_1: float = 2 * pi * h * c_0**2  # (W.m^2)
+C_2: float = h * c_0 / k  # (m.K)
+# the same constants with lengths in micrometers
+C_1_um: float = C_1 * 10**24  # (W.micrometer^4/m^2)
+C_2_um: float = C_2 * 10**6  # (micrometer.K)
+# sigma: Stefan-Boltzmann constant, consistent with the Planck constants above
+sigma: float = 2 * pi**5 * k**4 / (15 * h**3 * c_0**2)  # (W/m^2.K^4)
+
+# Series coefficients for the blackbody fraction f(lambda T), see _f_zeta.
+# For zeta = C_2 / (lambda T) >= _ZETA_SPLIT the exponential series
+#   f = 15/pi^4 sum_{n=1}^{N} e^{-n zeta}/n (zeta^3 + 3 zeta^2/n + 6 zeta/n^2 + 6/n^3)
+# is used, with N chosen so that the neglected terms are below machine
+# precision. Below the split the Bernoulli expansion of the complementary
+# integral int_0^zeta x^3/(e^x - 1) dx converges faster.
+_ZETA_SPLIT: float = 2.
+_N_EXP_TERMS: int = 20
+_N_BERNOULLI_TERMS: int = 24
+
+
+def _bernoulli(n: int):
+    # the Bernoulli numbers B_0 ... B_n (B_1 = -1/2) from sum_{k=0}^{m} C(m+1, k) B_k = 0
+    B = [Fraction(1)]
+    for m in range(1, n + 1):
+        B.append(-sum(comb(m + 1, k) * B[k] for k in range(m)) / (m + 1))
+    return B
+
+
+_BERNOULLI_COEFFS = np.array(
+    [float(B / (factorial(j) * (j + 3))) for j, B in enumerate(_bernoulli(_N_BERNOULLI_TERMS))])
+
+# Tabulated blackbody fraction f(lambda T), see f_lambdaT_table. The table is
+# uniform in u = ln(lambda T) so that a lookup is an O(1) index computation.
+_LT_MIN: float = 100.  # (micrometer.K), f < 1e-60 below this
+_LT_MAX: float = 1.e6  # (micrometer.K)
+_N_TABLE: int = 8192
+_F_TABLE = None
+
+
+def Eblambda(lmbda: float, T: float, n: float = 1, out: np.ndarray = None, dtype=np.float64,
+             grid: bool = False):
     """
     The relatiion for the spectral blackbody emissive power Eb,lambda was developed by Max Planck in
     1901. This formulation is also referred to as Planck's law.
@@ -25,51 +72,102 @@ def Eblambda(lmbda: float, T: float, n: float = 1):
 
     E_{b\lambda}(\lambda,T) = \dfrac{C_1}{\lambda^5[exp(C_2/\lambda T)-1]}\;\;\;(W/m^2\cdot\mu m)
 
-    :param T: the temperature of the surface (K)
-    :param lmbda: the wavelength of the radiation emitted (micrometers)
+    The exponential is evaluated as e^{-x} / (1 - e^{-x}) with x = C_2 / (n lambda T), which
+    underflows to zero instead of overflowing at short wavelengths and low temperatures.
+    Wavelengths are kept in micrometers so that float32 grids stay in range.
+
+    :param T: the temperature of the surface (K), a float or an array
+    :param lmbda: the wavelength of the radiation emitted (micrometers), a float or an array
     :param n: refractive index, assumed to be 1 (air)
+    :param out: optional array to store the result in, it must have the broadcast shape
+    :param dtype: the floating point type of the computation, e.g. np.float32 for large grids
+    :param grid: if True, evaluate on the full grid of every lmbda with every T, the result
+        then has the shape lmbda.shape + T.shape. Otherwise lmbda and T are broadcast.
     :return: the spectral black body emissive power at some temperature and wavelength (W/m^2/micrometer)
     """
-    # Constants
-    # c_0: the speed of light in a vacuum
-    c_0: float = 2.9979 * 10**8  # (m/s)
-    # k: Boltzmann's constant
-    k: float = 1.38065 * 10**(-23)  # (J/K)
-    # h: Planck's constant
-    h: float = 6.626 * 10**(-34)
+    lmbda = np.asarray(lmbda, dtype=dtype)
+    T = np.asarray(T, dtype=dtype)
+    if grid:
+        lmbda = lmbda.reshape(lmbda.shape + (1,) * T.ndim)
+    shape = np.broadcast_shapes(lmbda.shape, T.shape)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    scratch = np.empty(shape, dtype=out.dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the coefficient only depends on the wavelength, evaluate it on the smaller array
+        coeff = n**2 * C_1_um / lmbda**5
+        # out = -x
+        np.multiply(lmbda, T, out=out)
+        np.divide(-C_2_um / n, out, out=out)
+        np.expm1(out, out=scratch)
+        np.exp(out, out=out)
+        # e^{-x} / (1 - e^{-x})
+        np.divide(out, scratch, out=out)
+        np.negative(out, out=out)
+        np.multiply(out, coeff, out=out)
+    # the limit at lambda = 0 is zero, although the coefficient is infinite there
+    if np.any(lmbda == 0):
+        out[np.broadcast_to(lmbda == 0, shape)] = 0.
+
+    return out if out.ndim else out[()]
+
+
+def _f_zeta(zeta: np.ndarray):
+    """
+    The blackbody fraction expressed in terms of zeta = C_2 / (lambda T), evaluated
+    element-wise with the series in the module header. The truncation error of
+    either branch is below 1e-14.
 
-    # Convert micrometers to meters, for every one million micrometers there is one meter
-    mm_to_m: float = 10 ** 6
-    lmbda /= mm_to_m
+    :param zeta: array of C_2 / (lambda T) values (dimensionless), 0 <= zeta <= inf
+    :return: f(lambda T) with the same shape as zeta, NaN where zeta is NaN or negative
+    """
+    zeta = np.asarray(zeta, dtype=np.float64)
+    # NaN and negative input, i.e. lambda T < 0, fall in neither branch below and stay NaN
+    f = np.full(zeta.shape, np.nan)
 
-    # Compute additional constants
-    C_1: float = 2 * pi * h * c_0**2
-    C_2: float = h * c_0 / k
+    # lambda = 0 gives zeta = inf, where the fraction is exactly zero
+    f[zeta == np.inf] = 0.
 
-    numerator: float = C_1
+    large = (zeta >= _ZETA_SPLIT) & (zeta < np.inf)
+    z = zeta[large]
+    total = np.zeros_like(z)
+    for n in range(1, _N_EXP_TERMS + 1):
+        total += np.exp(-n * z) / n * (z**3 + 3 * z**2 / n + 6 * z / n**2 + 6 / n**3)
+    f[large] = 15 / pi**4 * total
 
-    # Theres some floating point issues with this function at some values
-    denominator: float = lmbda**5 / n**2 * (np.exp(C_2/(n * lmbda * T))-1)
+    small = (zeta >= 0.) & (zeta < _ZETA_SPLIT)
+    z = zeta[small]
+    # Horner evaluation of sum_j B_j / (j! (j + 3)) z^j
+    poly = np.zeros_like(z)
+    for coeff in _BERNOULLI_COEFFS[::-1]:
+        poly = poly * z + coeff
+    f[small] = 1. - 15 / pi**4 * z**3 * poly
 
-    return numerator / denominator / mm_to_m
+    return f
 
 
 def Eb(T: float):
     """
     Equation 12-6 on page 722.
 
-    The total black body emissive power integrated over the whole range
-    :param T: the temperature of the surface (K)
-    :return: the total black body emissive power (W/m^2)
+    The total black body emissive power integrated over the whole range, given
+    in closed form by the Stefan-Boltzmann law Eb = sigma T^4.
+
+    :param T: the temperature of the surface (K), a float or an array of any shape
+    :return: the total black body emissive power (W/m^2) and an error estimate, which
+        is zero since the result is exact. Both have the shape of T.
     """
-    y, erf = quad(Eblambda, 0, np.inf, args=(T,))
-    return y, erf
+    T = np.asarray(T, dtype=np.float64)
+    y = sigma * T**4
+    erf = np.zeros_like(y)
+    return y[()], erf[()]
 
 
 def Eb_vectorized(T: np.ndarray):
     """
-    The Eb(T) function specifically takes in one temperature float value.
-    To make use of the function by passing a numpy array, the function must be vectorized.
+    The black body emissive power for every temperature in an array. Eb(T) accepts
+    arrays directly, this function is kept for callers that only want the values.
 
 
     Parameters
@@ -81,13 +179,8 @@ def Eb_vectorized(T: np.ndarray):
     -------
     The black body emissive power matrix that is the same size as the input T matrix
     """
-
-    def call_Eb(Temp):
-        y, erf = Eb(Temp)
-        return y
-
-    _Eb = np.vectorize(call_Eb)
-    return _Eb(T)
+    y, _ = Eb(T)
+    return y
 
 
 def Eb_0_lambda(lmbda: float, T: float):
@@ -98,9 +191,12 @@ def Eb_0_lambda(lmbda: float, T: float):
 
     :param lmbda: the wavelength of the radiation emitted (micrometers)
     :param T: the temperature of the surface (K)
-    :return: the black body emissive power over some band (W/m^2)
+    :return: the black body emissive power over some band (W/m^2) and an upper
+        bound on the absolute error. lmbda and T broadcast against each other.
     """
-    return quad(Eblambda, 0, lmbda, args=(T,))
+    y_num = f_lambda(lmbda, T) * Eb_vectorized(T)
+    erf = np.abs(y_num) * 1e-14
+    return y_num, erf
 
 
 def f_lambda(lmbda: float, T: float):
@@ -112,15 +208,136 @@ def f_lambda(lmbda: float, T: float):
 
     :param lmbda: the wavelength of the radiation emitted (micrometers)
     :param T: the temperature of the surface (K)
-    :return: The blackbody radiation function
+    :return: The blackbody radiation function, broadcast over lmbda and T, NaN where
+        lambda T is negative
     """
-    y_num, _ = Eb_0_lambda(lmbda, T)
-    y_den, _ = Eb(T)
+    lmbda = np.asarray(lmbda, dtype=np.float64)
+    T = np.asarray(T, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        zeta = C_2_um / (lmbda * T)
+
+    return _f_zeta(zeta)[()]
+
+
+def _dfdu_zeta(zeta: np.ndarray):
+    """
+    The derivative of the blackbody fraction with respect to u = ln(lambda T),
+    df/du = 15/pi^4 zeta^4 / (e^zeta - 1).
+
+    :param zeta: array of C_2 / (lambda T) values (dimensionless)
+    :return: df/du with the same shape as zeta
+    """
+    zeta = np.asarray(zeta, dtype=np.float64)
+    with np.errstate(over='ignore', invalid='ignore'):
+        dfdu = 15 / pi**4 * zeta**4 / np.expm1(zeta)
+    return np.where(np.isinf(zeta) | np.isnan(dfdu), 0., dfdu)
+
+
+def f_lambdaT_table(path: str = None):
+    """
+    The module level table of the blackbody fraction f as a function of the product
+    lambda T. The table is built from the series of f_lambda on first use and then
+    reused for every lookup. It holds f and df/du on a grid uniform in
+    u = ln(lambda T) between 100 and 1e6 micrometer.K with 8192 points.
+
+    :param path: optional .npz file. If it exists and matches the grid it is loaded,
+        otherwise the table is built and saved there so later processes skip the build.
+    :return: a tuple (lmbdaT, f, dfdu) of arrays
+    """
+    global _F_TABLE
+    if _F_TABLE is not None and path is None:
+        return _F_TABLE
+
+    lmbdaT = np.geomspace(_LT_MIN, _LT_MAX, _N_TABLE)
+
+    if path is not None and os.path.isfile(path):
+        data = np.load(path)
+        if data['lmbdaT'].shape == lmbdaT.shape and np.allclose(data['lmbdaT'], lmbdaT):
+            _F_TABLE = (data['lmbdaT'], data['f'], data['dfdu'])
+            return _F_TABLE
+
+    if _F_TABLE is None:
+        with instrument.timer('blackbody.f_lambdaT_table'):
+            zeta = C_2_um / lmbdaT
+            _F_TABLE = (lmbdaT, _f_zeta(zeta), _dfdu_zeta(zeta))
+
+    if path is not None:
+        lmbdaT, f, dfdu = _F_TABLE
+        np.savez(path, lmbdaT=lmbdaT, f=f, dfdu=dfdu)
+
+    return _F_TABLE
+
+
+def f_lambdaT(lmbdaT: float):
+    """
+    The blackbody fraction f(lambda T) looked up from the table of f_lambdaT_table
+    with cubic Hermite interpolation in ln(lambda T). Outside the table range the
+    series of f_lambda is evaluated directly.
+
+    The absolute interpolation error is below 1e-13 over the whole table range.
+
+    :param lmbdaT: the product of wavelength and temperature (micrometer.K), a float or
+        an array of any shape
+    :return: the blackbody radiation function with the shape of lmbdaT, NaN where
+        lmbdaT is NaN or negative
+    """
+    lmbdaT = np.asarray(lmbdaT, dtype=np.float64)
+    _lmbdaT, f, dfdu = f_lambdaT_table()
+
+    inside = (lmbdaT >= _LT_MIN) & (lmbdaT <= _LT_MAX)
+    out = np.empty(lmbdaT.shape)
+
+    # position in the table, uniform spacing in u = ln(lambda T)
+    du = np.log(_LT_MAX / _LT_MIN) / (_N_TABLE - 1)
+    u = np.log(lmbdaT[inside] / _LT_MIN) / du
+    i = np.minimum(u.astype(np.intp), _N_TABLE - 2)
+    t = u - i
+
+    # cubic Hermite basis functions
+    t2 = t * t
+    t3 = t2 * t
+    h00 = 2 * t3 - 3 * t2 + 1
+    h10 = t3 - 2 * t2 + t
+    h01 = -2 * t3 + 3 * t2
+    h11 = t3 - t2
+    out[inside] = h00 * f[i] + h10 * du * dfdu[i] + h01 * f[i + 1] + h11 * du * dfdu[i + 1]
+
+    with np.errstate(divide='ignore'):
+        out[~inside] = _f_zeta(C_2_um / lmbdaT[~inside])
 
-    return y_num / y_den
+    return out[()]
 
 
-def effective_spectral(lmbda_1: float, lmbda_2: float, T: float, f: interp1d, step: float=.01):
+def f_lambda_fast(lmbda: float, T: float):
+    """
+    The fraction of radiation emitted from a blackbody at temperature T in the
+    wavelength band from lambda = 0 to lambda, from the tabulated f(lambda T).
+
+    :param lmbda: the wavelength of the radiation emitted (micrometers)
+    :param T: the temperature of the surface (K)
+    :return: The blackbody radiation function, broadcast over lmbda and T
+    """
+    return f_lambdaT(np.multiply(lmbda, T, dtype=np.float64))
+
+
+def _trapezoid_weights(x: np.ndarray):
+    """
+    The weights of the composite trapezoidal rule on the points x, so that the
+    integral of y(x) is np.dot(weights, y).
+
+    :param x: the increasing integration points, shape (m,)
+    :return: the weights, shape (m,)
+    """
+    w = np.zeros_like(x, dtype=np.float64)
+    if len(x) > 1:
+        dx = np.diff(x)
+        w[:-1] += dx / 2
+        w[1:] += dx / 2
+    return w
+
+
+@instrument.timed('blackbody.effective_spectral')
+def effective_spectral(lmbda_1: float, lmbda_2: float, T: float, f: 'interp1d', step: float=.01):
     """
     Find the effective or average
     Parameters
@@ -153,9 +370,151 @@ def effective_spectral(lmbda_1: float, lmbda_2: float, T: float, f: interp1d, st
         Eblambdas.append(Eblmda)
 
     # integrate over y(x) using the composite trapezoidal rule
-    y = cumtrapz(eff_Eblambdas, wavelengths)
-    y_num = y.tolist()[-1]  # take the last value as the total integral
+    y_num = float(np.dot(_trapezoid_weights(np.array(wavelengths)), np.array(eff_Eblambdas, dtype=np.float64)))
 
     eff = y_num / y_den
+    if instrument.enabled:
+        instrument.count('blackbody.integrand_evaluations', len(wavelengths))
 
     return eff, wavelengths, eff_Eblambdas, Eblambdas
+
+
+@instrument.timed('blackbody.effective_spectral_batch')
+def effective_spectral_batch(lmbda_1, lmbda_2, T, f, step: float = .01):
+    """
+    The effective (average) spectral property for many bands, temperatures and
+    property curves at once. Every band is integrated with a fixed step trapezoidal
+    rule like effective_spectral, but the Planck function is evaluated once on the
+    wavelength x temperature grid and each property curve once on the wavelength grid.
+
+    Unlike effective_spectral, whose grid stops at the last step below lmbda_2, the grid
+    of every band is closed at lmbda_2, so the last partial step of the band is
+    integrated too. The two differ by at most the contribution of that one step.
+
+    Parameters
+    ----------
+    lmbda_1: float or np.ndarray
+        The $\\lambda_1$ of each band in micrometers, shape (n_bands,)
+    lmbda_2: float or np.ndarray
+        The $\\lambda_2$ of each band in micrometers, shape (n_bands,)
+    T: float or np.ndarray
+        Temperatures of the blackbody, shape (n_T,)
+    f: interp1d or list
+        A scipy interpolation of the $\\alpha$, $\\rho$ or $\\tau$ curves. An interp1d built
+        on stacked values of shape (n_curves, m) evaluates every curve in one call. A list
+        of n_curves 1d interpolations (or any callables) is also accepted.
+    step: float
+        The wavelength step of the integration in micrometers
+
+    Returns
+    -------
+    The effective property for every curve, band and temperature as an array of
+    shape (n_curves, n_bands, n_T)
+    """
+    lmbda_1 = np.atleast_1d(np.asarray(lmbda_1, dtype=np.float64))
+    lmbda_2 = np.atleast_1d(np.asarray(lmbda_2, dtype=np.float64))
+    lmbda_1, lmbda_2 = np.broadcast_arrays(lmbda_1, lmbda_2)
+    T = np.atleast_1d(np.asarray(T, dtype=np.float64))
+
+    # the wavelengths of every band, closed at lmbda_2, are concatenated into one grid
+    grids = [np.append(lmbda_1[b] + step * np.arange(np.ceil((lmbda_2[b] - lmbda_1[b]) / step)), lmbda_2[b])
+             for b in range(len(lmbda_1))]
+    ends = np.cumsum([0] + [len(g) for g in grids])
+    wavelengths = np.concatenate(grids)
+
+    # evaluate the property curves once on the whole grid, shape (n_curves, n_wavelengths)
+    if callable(f):
+        props = np.atleast_2d(f(wavelengths))
+    else:
+        props = np.stack([np.asarray(_f(wavelengths), dtype=np.float64) for _f in f])
+
+    Eblambdas = Eblambda(wavelengths, T, grid=True)  # (n_wavelengths, n_T)
+    if instrument.enabled:
+        instrument.count('blackbody.integrand_evaluations', Eblambdas.size)
+
+    y_num = np.empty((props.shape[0], len(grids), len(T)))
+    for b in range(len(grids)):
+        band = slice(ends[b], ends[b + 1])
+        weighted = props[:, band] * _trapezoid_weights(wavelengths[band])
+        y_num[:, b, :] = weighted @ Eblambdas[band]
+
+    return y_num / Eb_vectorized(T)
+
+
+@instrument.timed('blackbody.effective_spectral_adaptive')
+def effective_spectral_adaptive(lmbda_1: float, lmbda_2: float, T: float, f: 'interp1d', rtol: float = 1e-8,
+                                n: int = 8, max_panels: int = 10000):
+    """
+    The effective (average) spectral property integrated to a requested relative
+    tolerance instead of on a fixed wavelength step. The band is split into panels
+    at the data points of f (the kinks of a piecewise linear interp1d), every panel
+    is integrated with n and 2n point Gauss-Legendre rules and the panels with the
+    largest error estimate are bisected until the summed estimate meets rtol. The
+    denominator is the closed form Eb(T).
+
+    Parameters
+    ----------
+    lmbda_1: float
+        The $\\lambda_1$ in micrometers
+    lmbda_2: float
+        The $\\lambda_2$ in micrometers
+    T: float
+        Temperature of the surface of the blackbody
+    f: interp1d
+        A 1d scipy interpolation of the $\\alpha$, $\\rho$, $\\tau$
+    rtol: float
+        The requested relative tolerance of the effective property
+    n: int
+        The order of the lower Gauss-Legendre rule, the error estimate compares it to 2n
+    max_panels: int
+        The maximum number of panels before giving up on rtol
+
+    Returns
+    -------
+    A tuple (eff, n_points, err) of the effective property, the number of Planck
+    function evaluations used and the estimated absolute error of eff
+    """
+    x_n, w_n = np.polynomial.legendre.leggauss(n)
+    x_2n, w_2n = np.polynomial.legendre.leggauss(2 * n)
+
+    def integrate(a, b):
+        # both rules on every panel at once, panels along the first axis
+        half = ((b - a) / 2)[:, np.newaxis]
+        mid = ((b + a) / 2)[:, np.newaxis]
+        lmbdas = np.concatenate((mid + half * x_n, mid + half * x_2n), axis=1)
+        y = f(lmbdas) * Eblambda(lmbdas, T)
+        I_n = (y[:, :n] * w_n).sum(axis=1) * half[:, 0]
+        I_2n = (y[:, n:] * w_2n).sum(axis=1) * half[:, 0]
+        return I_2n, np.abs(I_2n - I_n), lmbdas.size
+
+    # break the band at the data points of the interpolation
+    breaks = np.asarray(getattr(f, 'x', []), dtype=np.float64)
+    breaks = np.unique(np.concatenate(([lmbda_1], breaks[(breaks > lmbda_1) & (breaks < lmbda_2)], [lmbda_2])))
+    a, b = breaks[:-1], breaks[1:]
+
+    I, err, n_points = integrate(a, b)
+    while len(a) < max_panels:
+        tol = rtol * abs(I.sum())
+        if err.sum() <= tol:
+            break
+        # bisect every panel carrying more than its share of the tolerance
+        split = err > tol / len(a)
+        a_s, b_s = a[split], b[split]
+        # panels far from zero are bisected geometrically since Eb,lambda spans decades
+        m = np.where(a_s > 0, np.sqrt(a_s * b_s), (a_s + b_s) / 2)
+        a_new = np.concatenate((a_s, m))
+        b_new = np.concatenate((m, b_s))
+        I_new, err_new, n_new = integrate(a_new, b_new)
+        a = np.concatenate((a[~split], a_new))
+        b = np.concatenate((b[~split], b_new))
+        I = np.concatenate((I[~split], I_new))
+        err = np.concatenate((err[~split], err_new))
+        n_points += n_new
+
+    y_den = Eb_vectorized(T)
+    eff = I.sum() / y_den
+    if instrument.enabled:
+        instrument.count('blackbody.integrand_evaluations', n_points)
+        instrument.event('blackbody.effective_spectral_adaptive', panels=len(a), n_points=n_points,
+                         err=float(err.sum() / y_den))
+    return eff, n_points, err.sum() / y_den
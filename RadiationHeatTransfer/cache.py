@@ -0,0 +1,230 @@
+"""
+cache.py
+An opt-in on-disk cache of parsed View3D output and VS3 geometry files. Entries are
+keyed on a hash of the contents of the source file and the parser options, so a changed
+source file is simply a cache miss. The arrays are stored as .npy files and loaded back as
+read-only memory maps, so a warm start does not copy the view factor matrix into memory.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def file_hash(path, block_size=2**20):
+    """
+    The sha256 hex digest of the contents of a file, read block_size bytes at a time.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_cache_dir():
+    """
+    The directory in the RHT_CACHE_DIR environment variable, or
+    ~/.cache/RadiationHeatTransfer.
+    """
+    return os.environ.get('RHT_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'RadiationHeatTransfer'))
+
+
+class ArrayCache:
+    """
+    A directory of cache entries, each a directory of .npy files. The least recently
+    used entries are evicted when the total size exceeds max_bytes.
+
+    Parameters
+    ----------
+    cache_dir: str
+        The cache directory, defaults to default_cache_dir()
+    max_bytes: int
+        The size limit of the cache in bytes
+    """
+    def __init__(self, cache_dir=None, max_bytes=4 * 2**30):
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.cache_dir, 'stat'), exist_ok=True)
+
+    def key(self, path, **params):
+        """
+        The cache key of a source file parsed with some options. The content hash is
+        remembered per (path, size, modification time), so an unchanged file is not
+        hashed again.
+        """
+        st = os.stat(path)
+        options = json.dumps(params, sort_keys=True, default=str)
+        stat_key = hashlib.sha256('{}:{}:{}:{}'.format(
+            os.path.abspath(path), st.st_size, st.st_mtime_ns, options).encode()).hexdigest()
+        stat_file = os.path.join(self.cache_dir, 'stat', stat_key)
+        if os.path.isfile(stat_file):
+            with open(stat_file) as file:
+                return file.read()
+
+        key = hashlib.sha256('{}:{}'.format(file_hash(path), options).encode()).hexdigest()
+        with open(stat_file, 'w') as file:
+            file.write(key)
+        return key
+
+    def load(self, key):
+        """
+        The arrays of an entry as read-only memory maps, or None on a cache miss.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        # the modification time of the entry orders the eviction
+        os.utime(entry)
+        return {name[:-4]: np.load(os.path.join(entry, name), mmap_mode='r')
+                for name in os.listdir(entry) if name.endswith('.npy')}
+
+    def store(self, key, arrays):
+        """
+        Write a dict of arrays as an entry, then evict old entries above max_bytes. The
+        entry just written is never evicted, even when it alone is above max_bytes.
+        """
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+        try:
+            os.rename(tmp, os.path.join(self.cache_dir, key))
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is below max_bytes, or
+        only the entry keep is left.
+        """
+        def size(entry):
+            return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+        total, entries = 0, []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if name == 'stat' or name.startswith('.tmp-') or not os.path.isdir(entry):
+                continue
+            entries.append((os.path.getmtime(entry), size(entry), entry, name == keep))
+            total += entries[-1][1]
+
+        for _, entry_size, entry, kept in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if not kept:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= entry_size
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(os.path.join(self.cache_dir, 'stat'), exist_ok=True)
+
+
+def read_output(path_to_file, delimiter=' ', dtype=np.float64, cache=None):
+    """
+    view3d.read_output through the cache. On a hit the view factor matrix is a read-only
+    np.memmap.
+
+    Parameters
+    ----------
+    path_to_file: str
+        The path to the View3D output file
+    delimiter: str
+        The delimiter between the values of a row
+    dtype:
+        The floating point type of the returned arrays
+    cache: ArrayCache
+        The cache to use, defaults to ArrayCache()
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix and the emissivities (column vector)
+    """
+    from . import view3d
+
+    cache = ArrayCache() if cache is None else cache
+    key = cache.key(path_to_file, parser='view3d.read_output', delimiter=delimiter, dtype=np.dtype(dtype).str)
+    arrays = cache.load(key)
+    if arrays is None:
+        A, Fij, eps = view3d.read_output(path_to_file, delimiter=delimiter, dtype=dtype)
+        cache.store(key, {'A': A, 'Fij': Fij, 'eps': eps})
+        arrays = cache.load(key)
+
+    return arrays['A'], arrays['Fij'], arrays['eps']
+
+
+def read_vs3_geometry(path_to_vs3, delimiter=None, cache=None):
+    """
+    viewgr.VS3Geometry.from_file through the cache. The arrays of the geometry are
+    stored as they are, the connectivity padded with -1 for triangles, so files mixing
+    triangles and quadrilaterals are cached like any other.
+
+    Parameters
+    ----------
+    path_to_vs3: str
+        The path to the .vs3 file
+    delimiter: str
+        The delimiter between the values of a line, None splits on any run of spaces
+        and tabs
+    cache: ArrayCache
+        The cache to use, defaults to ArrayCache()
+
+    Returns
+    -------
+    A viewgr.VS3Geometry
+    """
+    from . import viewgr
+
+    cache = ArrayCache() if cache is None else cache
+    key = cache.key(path_to_vs3, parser='viewgr.VS3Geometry.from_file', delimiter=delimiter)
+    arrays = cache.load(key)
+    if arrays is None:
+        geometry = viewgr.VS3Geometry.from_file(path_to_vs3, delimiter=delimiter)
+        cache.store(key, {
+            'vertex_numbers': geometry.vertex_numbers,
+            'vertices': geometry.vertices,
+            'surface_numbers': geometry.surface_numbers,
+            'connectivity': geometry.connectivity,
+            'base': geometry.base,
+            'cmb': geometry.cmb,
+            'emissivity': geometry.emissivity,
+            'names': geometry.names,
+            'header': np.array(json.dumps({'title': geometry.title, 'control': geometry.control,
+                                           'format': geometry.format})),
+        })
+        arrays = cache.load(key)
+
+    header = json.loads(str(arrays.pop('header')))
+    return viewgr.VS3Geometry(**arrays, **header)
+
+
+def read_vs3_file(path_to_vs3, delimiter='\t', cache=None):
+    """
+    viewgr.read_vs3_file through the cache, the dictionaries built from the cached
+    arrays of read_vs3_geometry.
+
+    Parameters
+    ----------
+    path_to_vs3: str
+        The path to the .vs3 file
+    delimiter: str
+        The delimiter between the values of a line
+    cache: ArrayCache
+        The cache to use, defaults to ArrayCache()
+
+    Returns
+    -------
+    The vertices and shapes dictionaries of viewgr.read_vs3_file
+    """
+    geometry = read_vs3_geometry(path_to_vs3, delimiter=None if not delimiter.strip() else delimiter, cache=cache)
+    return geometry.to_dicts()
@@ -1,15 +1,37 @@
 # Jack C. Cook
 # Sunday, February 28, 2021
 
+import sys
+
 import numpy as np
 
+from . import instrument
+
+
+def _issparse(x):
+    # a scipy.sparse matrix can only exist once scipy.sparse has been imported, so
+    # dense callers never pay for importing it
+    sparse = sys.modules.get('scipy.sparse')
+    return sparse is not None and sparse.issparse(x)
+
+
+def _isblocked(x):
+    # an outofcore.BlockedMatrix, likewise without importing the module
+    outofcore = sys.modules.get(__package__ + '.outofcore')
+    return outofcore is not None and isinstance(x, outofcore.BlockedMatrix)
 
+
+@instrument.timed('enclosures.F_matrix')
 def F_matrix(Fij: np.ndarray, eps: np.ndarray):
     """
     Using the view factors and the epsilon values, compute the F_matrix
 
     F_i = 1 / eps_i + (eps_i - 1) / eps_1 * summation_{j=1}{N}(Fij)
 
+    Leading dimensions are broadcast, so stacks of scenarios of shape (..., N, N)
+    and (..., N, 1) are built in one pass. A scipy.sparse Fij gives a sparse CSR
+    F matrix.
+
     Parameters
     ----------
     Fij: np.ndarray
@@ -23,9 +45,12 @@ def F_matrix(Fij: np.ndarray, eps: np.ndarray):
     """
     # each position in the view factor matrix is multiplied by (eps_i - 1) / eps_i
     eps_frac = (eps - 1) / eps
+    if _issparse(Fij):
+        from scipy import sparse
+        return (sparse.diags(eps_frac.ravel()) @ Fij + sparse.diags(1 / eps.ravel())).tocsr()
     F = Fij * eps_frac
     # the diagonal (i==j) has an additional 1 / eps_i term
-    m, n = eps.shape
+    m = eps.shape[-2]
     eye = np.identity(m)
     eps_inv = 1 / eps
     eps_diag = eye * eps_inv
@@ -58,13 +83,35 @@ def heat_flux(J: np.ndarray, Eb: np.ndarray, eps: np.ndarray):
     return flux
 
 
+@instrument.timed('enclosures.T_matrix')
 def T_matrix(Fij, eps, A):
+    """
+    The left hand side of the zonal method, T SS = S.
+
+    Parameters
+    ----------
+    Fij: np.ndarray
+        View factor matrix, shape (..., N, N), or a scipy.sparse matrix
+    eps: np.ndarray
+        The emissivity of each surface, shape (..., N, 1)
+    A: np.ndarray
+        The area of each surface, shape (..., N, 1)
+
+    Returns
+    -------
+    The T matrix, shape (..., N, N)
+    """
     # Calculate the reflectivity's for convenience
     rho = 1 - eps
 
-    T = -rho.T * A * Fij / eps.T / A.T
+    if _issparse(Fij):
+        from scipy import sparse
+        T = -sparse.diags(A.ravel()) @ Fij @ sparse.diags((rho / eps / A).ravel())
+        return (T + sparse.diags(1 / eps.ravel())).tocsr()
 
-    m, n = eps.shape
+    T = -_row(rho) * A * Fij / _row(eps) / _row(A)
+
+    m = eps.shape[-2]
     eye = np.identity(m)
     eps_inv = 1 / eps
     eps_diag = eye * eps_inv
@@ -73,13 +120,513 @@ def T_matrix(Fij, eps, A):
     return T
 
 
+@instrument.timed('enclosures.S_matrix')
 def S_matrix(Fij, eps, A):
-    return Fij * A * eps.T
+    """
+    The right hand side of the zonal method, T SS = S.
 
+    Parameters
+    ----------
+    Fij: np.ndarray
+        View factor matrix, shape (..., N, N), or a scipy.sparse matrix
+    eps: np.ndarray
+        The emissivity of each surface, shape (..., N, 1)
+    A: np.ndarray
+        The area of each surface, shape (..., N, 1)
 
+    Returns
+    -------
+    The S matrix, shape (..., N, N)
+    """
+    if _issparse(Fij):
+        from scipy import sparse
+        return (sparse.diags(A.ravel()) @ Fij @ sparse.diags(eps.ravel())).tocsr()
+    return Fij * A * _row(eps)
+
+
+@instrument.timed('enclosures.heat_flow')
 def heat_flow(SS, eb):
-    Q = np.zeros_like(eb)
-    for i in range(4):
-        for j in range(4):
-            Q[i] += SS[i, j] * (eb[i] - eb[j])
-    return Q
+    """
+    The net heat flow leaving each surface, Q_i = sum_j SS_ij (eb_i - eb_j).
+
+    Parameters
+    ----------
+    SS: np.ndarray
+        The radiative exchange matrix, shape (..., N, N), or a scipy.sparse matrix
+    eb: np.ndarray
+        The blackbody emissive power of each surface, shape (..., N, 1) or one column
+        per case, shape (..., N, k)
+
+    Returns
+    -------
+    The heat flow (W) with the broadcast shape of eb
+    """
+    if _issparse(SS):
+        return np.asarray(SS.sum(axis=1)).reshape(-1, 1) * eb - SS @ eb
+    return SS.sum(axis=-1, keepdims=True) * eb - SS @ eb
+
+
+def _row(x):
+    # the transpose of the last two axes, a column vector (..., N, 1) becomes a row (..., 1, N)
+    return np.swapaxes(x, -1, -2)
+
+
+
+@instrument.timed('enclosures.solve_radiosity')
+def solve_radiosity(Fij, eps: np.ndarray, eb: np.ndarray, method: str = 'gmres', tol: float = 1e-8,
+                    J0: np.ndarray = None, maxiter: int = 1000, precondition: bool = True):
+    """
+    Solve F J = Eb for the radiosity iteratively, for large enclosures where a dense
+    factorization does not fit. Only matrix-vector products with Fij are needed, so a
+    scipy.sparse Fij keeps the cost proportional to the number of nonzero view factors,
+    and an outofcore.BlockedMatrix Fij is solved out of core, reading the memory mapped
+    matrix a block of rows at a time for every product. Fij may also be a
+    scipy.sparse.linalg.LinearOperator of the products, e.g. of a hierarchical
+    approximation; its diagonal is taken as 0, planar surfaces, for the preconditioner.
+
+    Parameters
+    ----------
+    Fij: np.ndarray, scipy.sparse matrix, outofcore.BlockedMatrix or LinearOperator
+        View factor matrix
+    eps: np.ndarray
+        The emissivity of each surface (column vector)
+    eb: np.ndarray
+        The blackbody emissive power of each surface (column vector)
+    method: str
+        'gmres' or 'bicgstab' (Krylov methods of scipy.sparse.linalg), or 'jacobi' for
+        the radiosity iteration J = eps Eb + (1 - eps) Fij J
+    tol: float
+        The relative residual ||Eb - F J|| / ||Eb|| to stop at
+    J0: np.ndarray
+        An initial guess, e.g. the radiosity of a previous solve. Defaults to eps Eb.
+    maxiter: int
+        The maximum number of iterations
+    precondition: bool
+        Use the diagonal of F as a (Jacobi) preconditioner of the Krylov methods
+
+    Returns
+    -------
+    The radiosity J (column vector) and a dict with the number of iterations, the final
+    relative residual and whether tol was met
+    """
+    from scipy.sparse import linalg as splinalg
+
+    eps = np.asarray(eps, dtype=np.float64).reshape(-1)
+    b = np.asarray(eb, dtype=np.float64).reshape(-1)
+    x0 = eps * b if J0 is None else np.asarray(J0, dtype=np.float64).reshape(-1)
+    b_norm = np.linalg.norm(b) or 1.
+
+    if _isblocked(Fij) or isinstance(Fij, splinalg.LinearOperator):
+        # F J = (eps - 1) / eps Fij J + J / eps, without assembling F
+        eps_frac = (eps - 1) / eps
+        F = splinalg.LinearOperator(Fij.shape, matvec=lambda v: eps_frac * (Fij @ v.ravel()) + v.ravel() / eps,
+                                    dtype=np.float64)
+        if _isblocked(Fij):
+            diagonal = lambda: eps_frac * Fij.diagonal() + 1 / eps
+        else:
+            diagonal = lambda: 1 / eps
+    else:
+        F = F_matrix(Fij, eps[:, np.newaxis])
+        if not _issparse(F):
+            F = np.asarray(F)
+        diagonal = F.diagonal
+
+    iterations = 0
+    if method == 'jacobi':
+        rho = 1 - eps
+        x = x0
+        for iterations in range(1, maxiter + 1):
+            x_next = eps * b + rho * (Fij @ x)
+            # F x = (x - rho Fij x) / eps, so the residual of x comes from the same product
+            converged = np.linalg.norm((x_next - x) / eps) <= tol * b_norm
+            x = x_next
+            if converged:
+                break
+    elif method in ('gmres', 'bicgstab'):
+        solver = getattr(splinalg, method)
+        M = None
+        if precondition:
+            diag = diagonal()
+            M = splinalg.LinearOperator(F.shape, matvec=lambda v: v.ravel() / diag, dtype=np.float64)
+
+        def count(_):
+            nonlocal iterations
+            iterations += 1
+
+        kwargs = dict(x0=x0, maxiter=maxiter, M=M, callback=count, atol=0.)
+        if method == 'gmres':
+            kwargs['callback_type'] = 'pr_norm'
+        try:
+            x, _ = solver(F, b, rtol=tol, **kwargs)
+        except TypeError:
+            # scipy < 1.12 calls the relative tolerance tol
+            x, _ = solver(F, b, tol=tol, **kwargs)
+    else:
+        raise ValueError('Unknown method: {}'.format(method))
+
+    residual = float(np.linalg.norm(b - F @ x) / b_norm)
+    info = {'iterations': iterations, 'residual': residual, 'converged': residual <= tol}
+    if instrument.enabled:
+        instrument.count('enclosures.iterative_solves')
+        instrument.event('enclosures.solve_radiosity', method=method, **info)
+
+    return x[:, np.newaxis], info
+
+
+class Enclosure:
+    """
+    A gray enclosure whose radiosity system is factorized once. The matrices only
+    depend on the geometry and the emissivities, so any number of blackbody emissive
+    power vectors (e.g. new temperatures) can then be solved for at the cost of a
+    triangular solve.
+
+    Changing the emissivity of k surfaces changes k rows of F, F' = F + E_K V, which
+    update_eps applies as a Sherman-Morrison-Woodbury correction of the existing
+    factorization instead of refactorizing: a solve then costs the triangular solve
+    plus O(N k). Once more than max_rank surfaces differ from the factorized
+    emissivities, or the correction is ill-conditioned, F is refactorized.
+
+    Parameters
+    ----------
+    Fij: np.ndarray
+        View factor matrix
+    A: np.ndarray
+        The area of each surface (column vector)
+    eps: np.ndarray
+        The emissivity of each surface (column vector)
+    max_rank: int
+        The largest number of changed surfaces kept as a low-rank correction
+    """
+    def __init__(self, Fij: np.ndarray, A: np.ndarray, eps: np.ndarray, max_rank: int = 64):
+        self.Fij = np.asarray(Fij, dtype=np.float64)
+        self.A = np.asarray(A, dtype=np.float64).reshape(-1, 1)
+        self.eps = np.asarray(eps, dtype=np.float64).reshape(-1, 1).copy()
+        self.max_rank = max_rank
+        self.n_factorizations = 0
+        self._SS = None
+        self._factorize()
+
+    @instrument.timed('enclosures.Enclosure.factorize')
+    def _factorize(self):
+        from scipy.linalg import lu_factor
+
+        # F J = Eb, factorized for the current emissivities
+        self.lu = lu_factor(F_matrix(self.Fij, self.eps))
+        self._eps_factorized = self.eps.copy()
+        # the low-rank correction: the changed surfaces K, Z = F^-1 E_K, the changed rows
+        # V of F and the factorized capacitance matrix I + V Z
+        self._K = np.zeros(0, dtype=np.intp)
+        self._Z = np.zeros((len(self.eps), 0))
+        self._V = np.zeros((0, len(self.eps)))
+        self._C = None
+        self.n_factorizations += 1
+        if instrument.enabled:
+            instrument.count('enclosures.factorizations')
+
+    def _rows(self, K: np.ndarray, eps: np.ndarray):
+        # the rows K of F_matrix for the emissivities eps (column vector) of those surfaces
+        rows = (eps - 1) * self.Fij[K]
+        rows[np.arange(len(K)), K] += 1
+        return rows / eps
+
+    def update_eps(self, indices, eps):
+        """
+        Change the emissivity of some surfaces. The factorization is updated with a
+        rank-k correction, k being the number of surfaces whose emissivity differs from
+        the factorized one, or F is refactorized when k exceeds max_rank.
+
+        Parameters
+        ----------
+        indices: int or np.ndarray
+            The indices of the surfaces to change
+        eps: float or np.ndarray
+            The new emissivity of each of those surfaces
+
+        Returns
+        -------
+        A dict with whether F was refactorized, the rank of the correction in use
+        afterwards and the reason for a refactorization (None otherwise)
+        """
+        from scipy.linalg import lu_factor, lu_solve
+
+        indices = np.atleast_1d(indices)
+        self.eps[indices, 0] = eps
+        self._SS = None
+
+        K = np.flatnonzero(self.eps[:, 0] != self._eps_factorized[:, 0])
+        reason = None
+        if len(K) > self.max_rank:
+            reason = '{} changed surfaces exceed max_rank = {}'.format(len(K), self.max_rank)
+        else:
+            # reuse the columns of Z of surfaces already in the correction
+            known = np.isin(K, self._K)
+            Z = np.empty((len(self.eps), len(K)))
+            Z[:, known] = self._Z[:, np.searchsorted(self._K, K[known])]
+            new = K[~known]
+            if len(new):
+                E = np.zeros((len(self.eps), len(new)))
+                E[new, np.arange(len(new))] = 1.
+                Z[:, ~known] = lu_solve(self.lu, E)
+            V = self._rows(K, self.eps[K]) - self._rows(K, self._eps_factorized[K])
+            C = np.identity(len(K)) + V @ Z
+            if len(K) and np.linalg.cond(C) > 1e12:
+                reason = 'the rank-{} correction is ill-conditioned'.format(len(K))
+            else:
+                self._K, self._Z, self._V = K, Z, V
+                self._C = lu_factor(C) if len(K) else None
+
+        if reason is not None:
+            self._factorize()
+        if instrument.enabled:
+            instrument.count('enclosures.rank_updates')
+            instrument.event('enclosures.update_eps', refactorized=reason is not None, rank=len(self._K))
+
+        return {'refactorized': reason is not None, 'rank': len(self._K), 'reason': reason}
+
+    @property
+    def SS(self):
+        """
+        The radiative exchange matrix of the zonal method, T SS = S, computed on first use.
+        """
+        if self._SS is None:
+            T = T_matrix(self.Fij, self.eps, self.A)
+            S = S_matrix(self.Fij, self.eps, self.A)
+            with instrument.timer('enclosures.Enclosure.SS'):
+                self._SS = np.linalg.solve(T, S)
+            if instrument.enabled:
+                instrument.count('enclosures.linear_solves')
+        return self._SS
+
+    def radiosity(self, eb: np.ndarray):
+        """
+        The radiosity leaving each surface.
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface, a column vector of shape (N, 1)
+            or one column per case, shape (N, k)
+
+        Returns
+        -------
+        The radiosity J with the shape of eb
+        """
+        return self._solve(eb)
+
+    def _solve(self, b: np.ndarray, trans: int = 0):
+        # F x = b, or F^T x = b with trans=1, including the low-rank correction
+        from scipy.linalg import lu_solve
+
+        if instrument.enabled:
+            instrument.count('enclosures.lu_solves')
+        x = lu_solve(self.lu, b, trans=trans)
+        if self._C is None:
+            return x
+        if trans:
+            # (F + E_K V)^-T b = y - F^-T V^T (I + V Z)^-T y_K with y = F^-T b
+            w = lu_solve(self._C, x[self._K], trans=1)
+            return x - lu_solve(self.lu, self._V.T @ w, trans=1)
+        # Woodbury: (F + E_K V)^-1 b = y - Z (I + V Z)^-1 V y with y = F^-1 b
+        return x - self._Z @ lu_solve(self._C, self._V @ x)
+
+    def heat_flux(self, eb: np.ndarray):
+        """
+        The net heat flux leaving each surface, q_i = J_i - sum_j Fij J_j. Unlike
+        heat_flux(J, Eb, eps) this also holds for black surfaces.
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface, shape (N, 1) or (N, k)
+
+        Returns
+        -------
+        The heat flux (W/m^2) with the shape of eb
+        """
+        J = self.radiosity(eb)
+        return J - self.Fij @ J
+
+    def heat_flow(self, eb: np.ndarray):
+        """
+        The net heat flow leaving each surface, Q = q A.
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface, shape (N, 1) or (N, k)
+
+        Returns
+        -------
+        The heat flow (W) with the shape of eb
+        """
+        q = self.heat_flux(eb)
+        return q * self.A if q.ndim == 2 else q * self.A[:, 0]
+
+    def gradient(self, eb: np.ndarray, dQ: np.ndarray):
+        """
+        The gradient of an objective f(Q) of the heat flows with respect to the
+        emissivities and the blackbody emissive powers. One adjoint solve, F^T lambda =
+        dQ/dJ^T df/dQ, with the existing factorization gives all of them, instead of one
+        solve per parameter with finite differences:
+
+            df/dEb = lambda, df/deps_i = lambda_i q_i / eps_i^2
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface (column vector)
+        dQ: np.ndarray
+            The derivative df/dQ of the objective with respect to the heat flow of each
+            surface, shape (N, 1), or one column per objective, shape (N, m)
+
+        Returns
+        -------
+        A dict of the gradients with respect to 'eb', 'T' (through Eb = sigma T^4) and
+        'eps', each of shape (N, m)
+        """
+        from .blackbody import sigma
+
+        eb = np.asarray(eb, dtype=np.float64).reshape(-1, 1)
+        dQ = np.asarray(dQ, dtype=np.float64).reshape(len(self.A), -1)
+        J = self.radiosity(eb)
+        q = J - self.Fij @ J
+        # Q = A (I - Fij) J
+        AdQ = self.A * dQ
+        lmbda = self._solve(AdQ - self.Fij.T @ AdQ, trans=1)
+        T = (eb / sigma) ** 0.25
+        return {'eb': lmbda, 'T': lmbda * 4 * sigma * T**3, 'eps': lmbda * q / self.eps**2}
+
+    def jacobian(self, eb: np.ndarray):
+        """
+        The Jacobian of the heat flows with respect to the emissivities and the blackbody
+        emissive powers, the gradient of every Q_i at the cost of N adjoint solves with
+        the existing factorization.
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface (column vector)
+
+        Returns
+        -------
+        A dict of dQ_i/dp_j at [i, j] for the parameters p 'eb', 'T' and 'eps', each of
+        shape (N, N)
+        """
+        gradients = self.gradient(eb, np.identity(len(self.A)))
+        return {name: g.T for name, g in gradients.items()}
+
+
+@instrument.timed('enclosures.band_emissivities')
+def _spectral_emissivity(eps, lmbdas: np.ndarray):
+    # the spectral emissivity of every surface at lmbdas, shape (N, len(lmbdas))
+    if callable(eps):
+        return np.atleast_2d(eps(lmbdas))
+    if isinstance(eps, tuple):
+        # a table (lambda, eps), linear interpolation held constant past its ends
+        table_lmbdas = np.asarray(eps[0], dtype=np.float64)
+        table_eps = np.atleast_2d(np.asarray(eps[1], dtype=np.float64))
+        i = np.clip(np.searchsorted(table_lmbdas, lmbdas), 1, len(table_lmbdas) - 1)
+        w = np.clip((lmbdas - table_lmbdas[i - 1]) / (table_lmbdas[i] - table_lmbdas[i - 1]), 0., 1.)
+        return table_eps[:, i - 1] * (1 - w) + table_eps[:, i] * w
+    return np.concatenate([_spectral_emissivity(_eps, lmbdas) for _eps in eps])
+
+
+def band_emissivities(eps, T: np.ndarray, bands: np.ndarray, n_points: int = 200):
+    """
+    The emissivity of every surface in every wavelength band, averaged over the band
+    with the blackbody spectrum at the temperature of the surface as the weight.
+
+    Parameters
+    ----------
+    eps: interp1d, tuple or list
+        The spectral emissivity of the surfaces as a function of wavelength (micrometers).
+        Either an interp1d built on stacked values of shape (N, m), a table
+        (lmbda, eps) of increasing wavelengths of shape (m,) and emissivities of shape
+        (N, m), interpolated linearly, or a list of N 1d interpolations, tables or any
+        callables.
+    T: np.ndarray
+        The temperature of each surface (column vector)
+    bands: np.ndarray
+        The band edges in micrometers, shape (n_bands + 1,). The first edge may be 0
+        and the last np.inf.
+    n_points: int
+        The number of wavelengths per band of the averaging grid
+
+    Returns
+    -------
+    The band emissivities, shape (n_bands, N, 1)
+    """
+    from .blackbody import Eblambda, _trapezoid_weights
+
+    T = np.asarray(T, dtype=np.float64).reshape(-1)
+    bands = np.asarray(bands, dtype=np.float64)
+    # outside of 100 < lambda T < 1e6 (micrometer.K) the blackbody emits nothing of note
+    lmbda_min = 100. / T.max()
+    lmbda_max = 1.e6 / T.min()
+
+    eps_bands = np.empty((len(bands) - 1, len(T), 1))
+    for k in range(len(bands) - 1):
+        # the part of the band with emission, or its nearest edge for a band without
+        lo = min(max(bands[k], lmbda_min), bands[k + 1])
+        hi = max(min(bands[k + 1], lmbda_max), bands[k])
+        lmbdas = np.geomspace(lo, hi, n_points) if hi > lo else np.array([lo])
+        eps_lmbdas = np.asarray(_spectral_emissivity(eps, lmbdas), dtype=np.float64)
+        weights = Eblambda(lmbdas, T, grid=True).T * _trapezoid_weights(lmbdas)  # (N, n_points)
+        total = weights.sum(axis=1)
+        # a band without emission at the surface temperature uses the plain average
+        weights[total == 0] = 1.
+        eps_bands[k, :, 0] = (weights * eps_lmbdas).sum(axis=1) / weights.sum(axis=1)
+
+    return eps_bands
+
+
+@instrument.timed('enclosures.band_heat_flux')
+def band_heat_flux(Fij: np.ndarray, eps, T: np.ndarray, bands: np.ndarray, n_points: int = 200):
+    """
+    The net heat flux of a non-gray enclosure with the band approximation: within each
+    wavelength band the surfaces are gray with the band emissivity, and the blackbody
+    emissive power of the band is the band fraction of sigma T^4. The radiosity systems
+    of all bands are stacked to (n_bands, N, N) and solved in one call.
+
+    Parameters
+    ----------
+    Fij: np.ndarray
+        View factor matrix
+    eps: interp1d, tuple or list
+        The spectral emissivity of the surfaces, see band_emissivities
+    T: np.ndarray
+        The temperature of each surface (column vector)
+    bands: np.ndarray
+        The band edges in micrometers, shape (n_bands + 1,). Use 0 and np.inf as the
+        outer edges to cover the whole spectrum.
+    n_points: int
+        The number of wavelengths per band used to average the emissivity
+
+    Returns
+    -------
+    The total heat flux of each surface (column vector) and the heat flux of each
+    surface in each band, shape (n_bands, N, 1)
+    """
+    from .blackbody import Eb_vectorized, f_lambdaT
+
+    T = np.asarray(T, dtype=np.float64).reshape(-1, 1)
+    bands = np.asarray(bands, dtype=np.float64)
+
+    eps_bands = band_emissivities(eps, T, bands, n_points=n_points)
+
+    # blackbody emissive power of every band, shape (n_bands, N, 1)
+    with np.errstate(invalid='ignore'):
+        fractions = f_lambdaT(bands[:, np.newaxis, np.newaxis] * T)
+    eb_bands = np.diff(fractions, axis=0) * Eb_vectorized(T)
+
+    # F_matrix of every band, stacked
+    F = F_matrix(Fij, eps_bands)
+
+    J = np.linalg.solve(F, eb_bands)
+    if instrument.enabled:
+        instrument.count('enclosures.linear_solves', len(F))
+    # the net flux as radiosity minus irradiation, which unlike heat_flux(J, Eb, eps)
+    # also holds for black surfaces
+    flux_bands = J - Fij @ J
+
+    return flux_bands.sum(axis=0), flux_bands
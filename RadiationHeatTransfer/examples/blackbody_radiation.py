@@ -11,7 +11,6 @@ from scipy.optimize import fminbound
 from itertools import count
 from itertools import takewhile
 import matplotlib.pyplot as plt
-from scipy.integrate import cumtrapz
 from scipy.interpolate import interp1d
 
 
@@ -30,10 +29,13 @@ def main():
 
     wavelengths: list = list(any_range(.01, 1000, .01))
 
-    for _, T in enumerate(several_temperatures):
+    # the spectra of every temperature on the wavelength grid, shape (wavelengths, temperatures)
+    Eblambda_grid = RHT.blackbody.Eblambda(wavelengths, several_temperatures, grid=True)
+
+    for j, T in enumerate(several_temperatures):
         # T = several_temperatures[-1]  # the current temperature
 
-        Eblambdas: list = [RHT.blackbody.Eblambda(wavelength, T) for _, wavelength in enumerate(wavelengths)]
+        Eblambdas = Eblambda_grid[:, j]
 
         # Find the maximum value over the range of 0.01-1000 micrometers
         # Source: https://stackoverflow.com/a/16781456/11637415
@@ -58,6 +58,23 @@ def main():
     print('Q: ')
     print(Q)
 
+    # The Enclosure object factorizes F once and can then be reused for many
+    # emissive power vectors, here one column per operating point
+    enclosure = RHT.enclosures.Enclosure(Fij, A, eps)
+    temperatures = np.array([[1000., 1100., 1200.],
+                             [600., 600., 600.],
+                             [1000., 1100., 1200.],
+                             [600., 600., 600.]])
+    Q = enclosure.heat_flow(RHT.blackbody.Eb_vectorized(temperatures))
+    print('Q for three operating points: ')
+    print(Q)
+
+    # Changing the emissivity of a few surfaces updates the factorization with a
+    # low-rank correction instead of factorizing F again
+    info = enclosure.update_eps([1, 3], 0.5)
+    print('Refactorized: {}, rank of the correction: {}'.format(info['refactorized'], info['rank']))
+    print(enclosure.heat_flow(RHT.blackbody.Eb_vectorized(temperatures)))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,34 @@
+# A parameter sweep of the oven: heater input, convection coefficient and the emissivity
+# of the walls, solved with the zonal method on every core
+
+import numpy as np
+import RadiationHeatTransfer as rht
+
+
+def main():
+    path_to_output = 'oven_output.txt'
+
+    A, Fij, eps = rht.view3d.read_output(path_to_output)
+    s = len(A)
+
+    n = 1000
+    rng = np.random.default_rng(0)
+    qf_heater = rng.uniform(50., 400., n)  # W/m^2 on the first surface
+    qf_in = np.zeros((n, s))
+    qf_in[:, 0] = qf_heater
+    scenarios = {'qf_in': qf_in,
+                 'h': rng.uniform(5., 20., n),  # the same on every surface
+                 'eps': rng.uniform(0.1, 0.9, (n, s))}
+
+    def progress(done, total):
+        print('{} / {} cases'.format(done, total), end='\r')
+
+    results = rht.sweep.sweep(Fij, A, scenarios, model='zonal', U=.15, TOS=300., progress=progress)
+    print()
+
+    print('All converged: {}'.format(results['converged'].all()))
+    print('Heater temperature: {:.1f} to {:.1f} K'.format(results['Ts'][:, 0].min(), results['Ts'][:, 0].max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,14 @@ def main():
     fig = rht.viewgr.i_plot_vs3_shape(vertices, shapes)
     fig.write_html('file.html')
 
+    # large geometries are drawn as one collection or one mesh, colored by a result
+    geometry = rht.viewgr.VS3Geometry.from_file(vs3file)
+    fig, ax = rht.viewgr.plot_vs3_geometry(geometry, values=geometry.centroids[:, 2])
+    fig.savefig('vs3_faces.pdf')
+
+    fig = rht.viewgr.i_plot_vs3_geometry(geometry, values=geometry.centroids[:, 2])
+    fig.write_html('mesh.html')
+
 
 if __name__ == '__main__':
     main()
@@ -5,9 +5,6 @@
 
 import numpy as np
 import RadiationHeatTransfer as rht
-from copy import deepcopy
-from numpy.linalg import inv
-from numpy.linalg import solve
 
 
 def main():
@@ -39,61 +36,25 @@ def main():
     # T SS = S, Ax=b,  SS = inv(T) S
     SS = np.linalg.solve(T, S)
 
-    sigma = 5.67e-08
-
-    diff = 99999999
-    count = 0
-
-    # Begin while loop here
-    while diff > 1.0E-06:
-
-        Tsold = deepcopy(Ts)  # store Ts for convergence check
-
-        UA = np.zeros_like(SS)
-        for i in range(s):
-            for j in range(s):
-                UA[i, j] = SS[i, j] * sigma * (Ts[i]**2 + Ts[j]**2) \
-                           * (Ts[i] + Ts[j])
-
-        # initialize terms used in filling matrices
-        UAjsum = np.zeros_like(A)
-        RHS = np.zeros((s+1, r))
-        for j in range(s):
-            for i in range(s):
-                UAjsum[j] = UAjsum[j] + UA[i, j]
-        # fill conductance array, rows 1-N, columns 1-N
-        UCA = np.zeros((s+1, s+1))
-        for i in range(s):
-            for j in range(s):
-                UCA[i, j] = UA[i, j]
-        # Correct diagonal through N
-        for j in range(s):
-            UCA[j, j] = UCA[j, j] - h[j] * A[j] - U[j] * A[j] - UAjsum[j]
-        # fill in the N+1th row and N+1th column
-        SumhA = 0
-        for j in range(s):
-            UCA[s, j] = h[j] * A[j]  # row
-            UCA[j, s] = h[j] * A[j]  # column
-            SumhA += h[j] * A[j]
-        UCA[s, s] = -SumhA
-        # Fill in RHS array
-        for j in range(s):
-            RHS[j] = -U[j] * A[j] * TOS - qf_in[j] * A[j]
-        RHS[s] = 0.
-
-        Tsnext = solve(UCA, RHS)
-        Ts_n = Tsnext[0:s, :]
-
-        diff = np.sqrt(np.mean((Ts_n - Tsold)**2))  # rmse
-
-        Ts = deepcopy(Ts_n)
-
-        count += 1
+    # The fixed point iteration of the zonal method, now in RHT.zonal, solved with
+    # Newton-Raphson. Use method='picard' for the original fixed point iteration.
+    Ts, Ta, info = rht.zonal.solve(SS, A, h=h, U=U, TOS=TOS, qf_in=qf_in, Ts=Ts, method='newton')
+    count = info['iterations']
 
     print('Number of iterations: {}'.format(count))
 
     print(Ts)
 
+    # The sensitivity of the temperature of the heated surface to the heat input and the
+    # emissivity of every surface, from one adjoint solve instead of one solve per surface
+    dTs = np.zeros((s, 1))
+    dTs[0] = 1.
+    gradients = rht.zonal.gradient(SS, A, Ts, Ta, dTs, h=h, U=U, TOS=TOS, Fij=Fij, eps=eps)
+    print('d(Ts_1)/d(qf_in): ')
+    print(gradients['qf_in'])
+    print('d(Ts_1)/d(eps): ')
+    print(gradients['eps'])
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,446 @@
+"""
+hierarchical.py
+Hierarchical (clustered) radiosity of a VS3 geometry, for enclosures too large for a
+dense view factor matrix. The surfaces are grouped into a binary cluster tree. Pairs of
+clusters R and S that are far apart compared to their size exchange radiation through
+one link, using the point to point form factor
+
+    F_ij ~ A_j (n_i . d)(-n_j . d) / (pi |d|^4),  d = x_j - x_i
+
+expanded to first order about the cluster centers on both sides. The sending cluster
+enters through its moment sum_j A_j J_j n_j and its dipole, the receiving surfaces
+through a field that is linear in their position, so a link costs the same whatever
+the size of the clusters and the error is of the order ((r_R + r_S) / D)^2 for cluster
+radii r_R, r_S at a distance D. A link is only made when every surface of both
+clusters faces the other cluster and that estimate is below tol, otherwise the larger
+cluster is split. Pairs of single surfaces that are still too close are computed
+exactly with the contour integrals of viewfactors. Clusters that are behind each other
+(e.g. coplanar surfaces) do not exchange radiation and get no link, so the number of
+links grows roughly as N log N instead of N^2. Obstructions are not considered.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from math import pi
+
+import numpy as np
+
+from . import instrument
+from . import viewfactors
+
+
+def _angle(a, b):
+    # the angle between unit vectors, accurate for nearly parallel vectors
+    return 2 * np.arcsin(np.clip(np.linalg.norm(a - b, axis=-1) / 2, 0., 1.))
+
+
+class ClusterTree:
+    """
+    A binary tree over the surfaces, stored as flat arrays in level order. Every node
+    holds the surfaces order[first:last], so sums over a node are differences of prefix
+    sums over order.
+
+    Parameters
+    ----------
+    P: np.ndarray
+        The padded polygon vertices of viewfactors.polygons, shape (N, m, 3)
+    """
+    def __init__(self, P: np.ndarray):
+        N = len(P)
+        A, normals = viewfactors._areas_normals(P)
+        # area centroids from a fan of triangles, the padded vertices add empty triangles
+        v0 = P[:, :1]
+        tri_area = 0.5 * np.einsum('nkj,nj->nk', np.cross(P[:, 1:-1] - v0, P[:, 2:] - v0), normals)
+        tri_centroid = (v0 + P[:, 1:-1] + P[:, 2:]) / 3
+        centroids = np.einsum('nk,nkj->nj', tri_area, tri_centroid) / A[:, np.newaxis]
+
+        order = np.arange(N)
+        first = [np.array([0])]
+        last = [np.array([N])]
+        left = []
+        right = []
+        n_nodes = 1
+        current = np.array([0])
+        levels = [current]
+        while True:
+            f, l = np.concatenate(first), np.concatenate(last)
+            split = current[l[current] - f[current] > 1]
+            left.append(np.full(len(current), -1))
+            right.append(np.full(len(current), -1))
+            if not len(split):
+                break
+            sizes = l[split] - f[split]
+            seg = np.repeat(np.arange(len(split)), sizes)
+            pos = np.repeat(f[split], sizes) + np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            pts = centroids[order[pos]]
+            offsets = np.cumsum(sizes) - sizes
+            extent = np.maximum.reduceat(pts, offsets) - np.minimum.reduceat(pts, offsets)
+            # sort every node along the longest axis of its centroids and split at the median
+            axis = np.argmax(extent, axis=1)
+            key = pts[np.arange(len(pos)), axis[seg]]
+            order[pos] = order[pos][np.lexsort((key, seg))]
+
+            mid = f[split] + sizes // 2
+            children = n_nodes + np.arange(2 * len(split))
+            is_split = np.isin(current, split)
+            left[-1][is_split] = children[0::2]
+            right[-1][is_split] = children[1::2]
+            first.append(np.stack((f[split], mid), axis=1).ravel())
+            last.append(np.stack((mid, l[split]), axis=1).ravel())
+            n_nodes += len(children)
+            current = children
+            levels.append(current)
+
+        self.order = order
+        self.first = np.concatenate(first)
+        self.last = np.concatenate(last)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.leaf = self.left < 0
+        self.A = A
+        self.normals = normals
+        self.centroids = centroids
+
+        # the area, centroid and summed vector area of every node from prefix sums
+        def node_sum(x):
+            cs = np.concatenate((np.zeros((1,) + x.shape[1:]), np.cumsum(x[order], axis=0)))
+            return cs[self.last] - cs[self.first]
+
+        self.area = node_sum(A)
+        self.center = node_sum(A[:, np.newaxis] * centroids) / self.area[:, np.newaxis]
+        vector_area = node_sum(A[:, np.newaxis] * normals)
+        norm = np.linalg.norm(vector_area, axis=1)
+        self.axis = vector_area / np.where(norm > 0, norm, 1.)[:, np.newaxis]
+
+        # the bounding sphere, bounding box, normal cone half angle and, for nodes whose
+        # surfaces all have the same normal, the range of their plane offsets
+        # (the padding of P repeats the first vertex, so it does not change any of them)
+        patch = order[self.first]
+        self.radius = np.linalg.norm(P - centroids[:, np.newaxis], axis=2).max(axis=1)[patch]
+        self.bmin = P.min(axis=1)[patch]
+        self.bmax = P.max(axis=1)[patch]
+        self.theta = np.zeros(n_nodes)
+        offsets = np.einsum('nmk,nk->nm', P, normals)
+        self.pmin = offsets.min(axis=1)[patch]
+        self.pmax = offsets.max(axis=1)[patch]
+
+        for nodes in reversed(levels):
+            nodes = nodes[~self.leaf[nodes]]
+            if not len(nodes):
+                continue
+            children = (self.left[nodes], self.right[nodes])
+            self.radius[nodes] = np.max([np.linalg.norm(self.center[c] - self.center[nodes], axis=1) + self.radius[c]
+                                         for c in children], axis=0)
+            self.bmin[nodes] = np.minimum(self.bmin[children[0]], self.bmin[children[1]])
+            self.bmax[nodes] = np.maximum(self.bmax[children[0]], self.bmax[children[1]])
+            theta = np.max([_angle(self.axis[nodes], self.axis[c]) + self.theta[c] for c in children], axis=0)
+            self.theta[nodes] = np.where(norm[nodes] > 1e-12 * self.area[nodes], np.minimum(theta, pi), pi)
+            self.pmin[nodes] = np.minimum(self.pmin[children[0]], self.pmin[children[1]])
+            self.pmax[nodes] = np.maximum(self.pmax[children[0]], self.pmax[children[1]])
+
+        # plane offsets are only meaningful for a single normal direction
+        self.planar = self.theta < 1e-9
+        self.patch = np.where(self.leaf, patch, -1)
+
+    def _offsets(self, X: np.ndarray, Y: np.ndarray):
+        # the smallest and largest offset of node Y along the axis of node X, for arrays of
+        # node pairs, from the bounding box of Y and exactly for a planar Y (anti)parallel to X
+        n = self.axis[X]
+        mid = np.einsum('pk,pk->p', n, (self.bmax[Y] + self.bmin[Y]) / 2)
+        half = np.einsum('pk,pk->p', np.abs(n), (self.bmax[Y] - self.bmin[Y]) / 2)
+        lo, hi = mid - half, mid + half
+        dot = np.einsum('pk,pk->p', n, self.axis[Y])
+        parallel = self.planar[Y] & (dot > 1 - 1e-12)
+        antiparallel = self.planar[Y] & (dot < -1 + 1e-12)
+        lo = np.where(parallel, np.maximum(lo, self.pmin[Y]), np.where(antiparallel, np.maximum(lo, -self.pmax[Y]), lo))
+        hi = np.where(parallel, np.minimum(hi, self.pmax[Y]), np.where(antiparallel, np.minimum(hi, -self.pmin[Y]), hi))
+        return lo, hi
+
+    def behind(self, X: np.ndarray, Y: np.ndarray, tol: float):
+        """
+        Whether all of node Y is behind (or in) the planes of every surface of node X, for
+        arrays of node pairs. Only decided for nodes X whose surfaces share one normal.
+        """
+        _, hi = self._offsets(X, Y)
+        return self.planar[X] & (hi <= self.pmin[X] + tol)
+
+    def in_front(self, X: np.ndarray, Y: np.ndarray, tol: float):
+        """
+        Whether all of node Y is in front of (or in) the planes of every surface of node X,
+        for arrays of node pairs. Only decided for nodes X whose surfaces share one normal.
+        """
+        lo, _ = self._offsets(X, Y)
+        return self.planar[X] & (lo >= self.pmax[X] - tol)
+
+
+def _links(tree: ClusterTree, tol: float, batch_size: int = 2**20):
+    """
+    Refine the pairs of clusters, starting from (root, root), into far links between
+    clusters and near pairs of single surfaces. The pairs still to refine are kept on a
+    stack and refined batch_size at a time, so memory stays bounded by the links.
+
+    Returns
+    -------
+    The receiving and sending nodes of the far links and the surface pairs (i, j) of
+    the near pairs, i receiving
+    """
+    length_tol = 1e-9 * np.sqrt(tree.A.max())
+    stack = [(np.array([0]), np.array([0]))]
+    far = ([], [])
+    near = ([], [])
+    while stack:
+        R, S = stack.pop()
+        if len(R) > batch_size:
+            stack.append((R[batch_size:], S[batch_size:]))
+            R, S = R[:batch_size], S[:batch_size]
+        same = R == S
+        d = tree.center[S] - tree.center[R]
+        D = np.linalg.norm(d, axis=1)
+        separated = D > tree.radius[R] + tree.radius[S]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d_hat = d / D[:, np.newaxis]
+            # the largest angle between d and the direction between any two points of R and S
+            beta = np.where(separated, np.arcsin(np.clip((tree.radius[R] + tree.radius[S]) / D, 0., 1.)), pi)
+            # the far field is exact to first order in the cluster sizes
+            error = ((tree.radius[R] + tree.radius[S]) / D)**2
+        # the angles between the normal cones and the directions from R to S
+        alpha_R = _angle(tree.axis[R], d_hat)
+        alpha_S = _angle(tree.axis[S], -d_hat)
+        spread_R = tree.theta[R] + beta
+        spread_S = tree.theta[S] + beta
+
+        # no surface of one cluster faces the other
+        culled = (tree.behind(R, S, length_tol) | tree.behind(S, R, length_tol)
+                  | (separated & ((alpha_R - spread_R >= pi / 2) | (alpha_S - spread_S >= pi / 2))))
+        culled |= same & tree.leaf[R]
+        # every surface of both clusters faces the other one
+        facing = (((alpha_R + spread_R < pi / 2) | tree.in_front(R, S, length_tol))
+                  & ((alpha_S + spread_S < pi / 2) | tree.in_front(S, R, length_tol)))
+        admissible = ~culled & ~same & separated & facing & (error <= tol)
+        pair = ~culled & ~admissible & ~same & tree.leaf[R] & tree.leaf[S]
+        rest = ~culled & ~admissible & ~pair
+
+        far[0].append(R[admissible])
+        far[1].append(S[admissible])
+        near[0].append(tree.patch[R[pair]])
+        near[1].append(tree.patch[S[pair]])
+
+        R, S, same = R[rest], S[rest], same[rest]
+        # a cluster paired with itself splits into the four pairs of its children
+        Rs, Ss = R[same], S[same]
+        R, S = R[~same], S[~same]
+        split_R = ~tree.leaf[R] & (tree.leaf[S] | (tree.radius[R] >= tree.radius[S]))
+        R_next = [tree.left[Rs], tree.left[Rs], tree.right[Rs], tree.right[Rs],
+                  tree.left[R[split_R]], tree.right[R[split_R]], R[~split_R], R[~split_R]]
+        S_next = [tree.left[Ss], tree.right[Ss], tree.left[Ss], tree.right[Ss],
+                  S[split_R], S[split_R], tree.left[S[~split_R]], tree.right[S[~split_R]]]
+        if sum(len(x) for x in R_next):
+            stack.append((np.concatenate(R_next), np.concatenate(S_next)))
+
+    return np.concatenate(far[0]), np.concatenate(far[1]), np.concatenate(near[0]), np.concatenate(near[1])
+
+
+class HierarchicalEnclosure:
+    """
+    A gray enclosure of a VS3 geometry whose view factors are represented by the links
+    of a cluster tree instead of a dense matrix.
+
+    Parameters
+    ----------
+    vertices: dict
+        The vertex number: (x, y, z) dictionary of viewgr.read_vs3_file
+    shapes: dict
+        The shape number: (v1, v2, ..., v1) dictionary of viewgr.read_vs3_file
+    tol: float
+        The largest estimated relative error ((r_R + r_S) / D)^2 of a far link between
+        clusters of radii r_R and r_S at a distance D. Smaller values refine more pairs
+        and make more links.
+    n_gauss: int
+        The number of Gauss-Legendre points of the contour integrals of the near pairs
+    n_workers: int
+        The number of processes computing the near pairs
+    chunk_size: int
+        The number of near pairs per task
+    """
+    def __init__(self, vertices, shapes, tol: float = 0.05, n_gauss: int = 10, n_workers: int = 1,
+                 chunk_size: int = 4096):
+        P, n_vertices = viewfactors.polygons(vertices, shapes)
+        self.tree = tree = ClusterTree(P)
+        self.A = tree.A[:, np.newaxis]
+        self.N = len(P)
+        self.eps = None
+        self._batch_size = 2**16
+
+        R, S, i, j = _links(tree, tol)
+        # the far links sorted by receiving cluster, so that their coefficients are summed
+        # per cluster with one reduceat
+        by_R = np.argsort(R, kind='stable')
+        self.far_R = R[by_R].astype(np.int32)
+        self.far_S = S[by_R].astype(np.int32)
+
+        # the exact A_i F_ij of each near pair is computed once for (i, j) and (j, i)
+        keys, inverse = np.unique(np.stack((np.minimum(i, j), np.maximum(i, j)), axis=1), axis=0,
+                                  return_inverse=True)
+        start, edge = viewfactors._edges(P, n_vertices)
+        args = (start, edge, P, n_vertices, tree.A, tree.normals, n_gauss)
+        chunks = [keys[k:k + chunk_size] for k in range(0, len(keys), chunk_size)]
+        if n_workers == 1:
+            viewfactors._init_worker(*args)
+            results = [viewfactors._pair_chunk(c) for c in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=viewfactors._init_worker,
+                                     initargs=args) as pool:
+                results = list(pool.map(viewfactors._pair_chunk, chunks))
+        AF = np.concatenate(results) if results else np.zeros(0)
+        self.near_i = i.astype(np.int32)
+        self.near_j = j.astype(np.int32)
+        self.near_F = AF[inverse.reshape(-1)] / tree.A[i]
+
+        if instrument.enabled:
+            instrument.count('hierarchical.far_links', len(R))
+            instrument.count('hierarchical.near_pairs', len(keys))
+
+    @classmethod
+    def from_file(cls, path_to_vs3: str, delimiter: str = None, **kwargs):
+        """
+        The enclosure of a VS3 file, with the emissivities of the file as eps.
+
+        Parameters
+        ----------
+        path_to_vs3: str
+            The path to the .vs3 file
+        delimiter: str
+            The delimiter between the values of a line, None splits on any whitespace
+        kwargs:
+            Passed on to HierarchicalEnclosure
+
+        Returns
+        -------
+        A HierarchicalEnclosure
+        """
+        from .viewgr import VS3Geometry
+
+        geometry = VS3Geometry.from_file(path_to_vs3, delimiter=delimiter)
+        vertices, shapes = geometry.to_dicts()
+        enclosure = cls(vertices, shapes, **kwargs)
+        # the surfaces are in the order of their shape numbers, see viewfactors.polygons
+        enclosure.eps = geometry.emissivity[np.argsort(geometry.surface_numbers)][:, np.newaxis]
+        return enclosure
+
+    def matvec(self, J: np.ndarray):
+        """
+        The irradiation H = Fij J of every surface, without forming Fij.
+
+        Parameters
+        ----------
+        J: np.ndarray
+            The radiosity of each surface, shape (N,) or (N, 1)
+
+        Returns
+        -------
+        Fij J with the shape of J
+        """
+        tree = self.tree
+        shape = np.shape(J)
+        J = np.asarray(J, dtype=np.float64).reshape(-1)
+
+        H = np.bincount(self.near_i, weights=self.near_F * J[self.near_j], minlength=self.N).astype(np.float64)
+
+        if len(self.far_R):
+            order = tree.order
+            x = tree.centroids[order]
+            # upward: the moment M = sum_j m_j, m_j = A_j J_j n_j, and the dipole
+            # Q = sum_j m_j (x_j - c_S)^T of every sending cluster, from prefix sums over order
+            m = (tree.A * J)[order, np.newaxis] * tree.normals[order]
+            cs_m = np.concatenate((np.zeros((1, 3)), np.cumsum(m, axis=0)))
+            cs_mx = np.concatenate((np.zeros((1, 3, 3)), np.cumsum(m[:, :, np.newaxis] * x[:, np.newaxis], axis=0)))
+
+            # the irradiation of a receiver at x in R is n . (a + W x), the link field
+            # expanded to first order about c_R; a and W of all the links of all the
+            # clusters holding a surface add up
+            node_acc = np.zeros((len(tree.first), 12))
+            for k in range(0, len(self.far_R), self._batch_size):
+                R = self.far_R[k:k + self._batch_size]
+                S = self.far_S[k:k + self._batch_size]
+                M = cs_m[tree.last[S]] - cs_m[tree.first[S]]
+                Q = cs_mx[tree.last[S]] - cs_mx[tree.first[S]] - M[:, :, np.newaxis] * tree.center[S][:, np.newaxis]
+                d = tree.center[S] - tree.center[R]
+                D2 = np.einsum('lk,lk->l', d, d)
+                c4 = 1 / (pi * D2**2)
+                dM = np.einsum('lk,lk->l', d, M)
+                dQd = np.einsum('la,lab,lb->l', d, Q, d)
+                Qd = np.einsum('lba,lb->la', Q, d)
+                trQ = np.trace(Q, axis1=1, axis2=2)
+                # g = -d (d . M) / (pi D^4), plus the dipole term of the sender
+                g = (-d * dM[:, np.newaxis] - Qd - d * trQ[:, np.newaxis]
+                     + 4 * d * (dQd / D2)[:, np.newaxis]) * c4[:, np.newaxis]
+                # dg/dx at c_R
+                W = (dM[:, np.newaxis, np.newaxis] * np.eye(3) + d[:, :, np.newaxis] * M[:, np.newaxis]
+                     - 4 * (dM / D2)[:, np.newaxis, np.newaxis] * d[:, :, np.newaxis] * d[:, np.newaxis]) \
+                    * c4[:, np.newaxis, np.newaxis]
+                a = g - np.einsum('lab,lb->la', W, tree.center[R])
+                coefficients = np.concatenate((a, W.reshape(-1, 9)), axis=1)
+                starts = np.flatnonzero(np.diff(R, prepend=-1))
+                node_acc[R[starts]] += np.add.reduceat(coefficients, starts, axis=0)
+            # downward: every cluster adds its coefficients to the positions first to last of
+            # order, a running sum of the differences gives every surface the sum over its clusters
+            acc = np.zeros((self.N + 1, 12))
+            for c in range(12):
+                acc[:, c] = (np.bincount(tree.first, weights=node_acc[:, c], minlength=self.N + 1)
+                             - np.bincount(tree.last, weights=node_acc[:, c], minlength=self.N + 1))
+            acc = np.cumsum(acc, axis=0)[:self.N]
+            field = acc[:, :3] + np.einsum('nab,nb->na', acc[:, 3:].reshape(-1, 3, 3), x)
+            H[order] += np.einsum('nk,nk->n', tree.normals[order], field)
+
+        return H.reshape(shape)
+
+    def row_sums(self):
+        """
+        sum_j F_ij of every surface (column vector), 1 for a closed enclosure up to the
+        error of the links.
+        """
+        return self.matvec(np.ones((self.N, 1)))
+
+    def solve(self, eb: np.ndarray, eps: np.ndarray = None, method: str = 'gmres', tol: float = 1e-8,
+              J0: np.ndarray = None, maxiter: int = 1000):
+        """
+        Solve J = eps Eb + (1 - eps) Fij J for the radiosity with
+        enclosures.solve_radiosity, Fij applied by matvec.
+
+        Parameters
+        ----------
+        eb: np.ndarray
+            The blackbody emissive power of each surface (column vector)
+        eps: np.ndarray
+            The emissivity of each surface (column vector), defaults to the emissivities of
+            the VS3 file for an enclosure made by from_file
+        method: str
+            'gmres' or 'bicgstab' (Krylov methods of scipy.sparse.linalg), or 'jacobi' for
+            the radiosity iteration
+        tol: float
+            The relative residual ||Eb - F J|| / ||Eb|| to stop at
+        J0: np.ndarray
+            An initial guess, defaults to eps Eb
+        maxiter: int
+            The maximum number of iterations
+
+        Returns
+        -------
+        The radiosity J, the net heat flux leaving each surface q = J - Fij J (W/m^2) and
+        the net heat flow Q = q A (W) as column vectors, and a dict with the number of
+        iterations, the final relative residual and whether tol was met
+        """
+        from scipy.sparse.linalg import LinearOperator
+
+        from .enclosures import solve_radiosity
+
+        if eps is None:
+            if self.eps is None:
+                raise ValueError('eps is required for an enclosure not read from a file')
+            eps = self.eps
+        eps = np.broadcast_to(np.asarray(eps, dtype=np.float64).reshape(-1, 1), (self.N, 1))
+
+        Fij = LinearOperator((self.N, self.N), matvec=lambda v: self.matvec(v.ravel()), dtype=np.float64)
+        J, info = solve_radiosity(Fij, eps, eb, method=method, tol=tol, J0=J0, maxiter=maxiter)
+
+        q = J - self.matvec(J)
+        return J, q, q * self.A, info
@@ -0,0 +1,202 @@
+"""
+instrument.py
+Opt-in counters, timers and events of the solvers and integrators, to see where the time
+of a run goes. Nothing is recorded unless a Recorder is active or a callback is
+registered: every hook in the other modules first checks the module level flag
+`enabled`, and the timed functions only read the clock when it is set.
+
+    with rht.instrument.record() as recorder:
+        Ts, Ta, info = rht.zonal.solve(SS, A, qf_in=qf_in)
+    recorder.to_dict()
+
+The names are '<module>.<what>'. Timers carry the name of the timed function, e.g.
+'zonal.solve'. Among the counters, 'enclosures.factorizations' counts LU factorizations
+and 'enclosures.lu_solves' the solves done with them, so their difference is the
+number of times a factorization was reused; 'enclosures.rank_updates' counts the
+emissivity changes applied as low-rank corrections or refactorizations.
+"""
+
+import functools
+import json
+import time
+from contextlib import contextmanager
+
+enabled = False
+_recorders = []
+_callbacks = []
+
+
+class Recorder:
+    """
+    Collects the counters, timers and events emitted while it is active.
+
+    Attributes
+    ----------
+    counters: dict
+        name: total count
+    timers: dict
+        name: {'calls': number of calls, 'total': seconds, 'max': longest call in seconds}
+    events: dict
+        name: list of the event dicts in the order they were emitted, e.g. the iteration
+        number, change and residual of every iteration of a solver
+    """
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.events = {}
+
+    def count(self, name: str, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name: str, seconds: float):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = {'calls': 1, 'total': seconds, 'max': seconds}
+        else:
+            timer['calls'] += 1
+            timer['total'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+
+    def event(self, name: str, data: dict):
+        self.events.setdefault(name, []).append(data)
+
+    def clear(self):
+        self.counters.clear()
+        self.timers.clear()
+        self.events.clear()
+
+    def to_dict(self):
+        """
+        A copy of the counters, timers and events as plain dicts and lists.
+        """
+        return {'counters': dict(self.counters),
+                'timers': {name: dict(timer) for name, timer in self.timers.items()},
+                'events': {name: [dict(data) for data in events] for name, events in self.events.items()}}
+
+    def to_json(self, path: str = None, **kwargs):
+        """
+        The recorded data as a JSON string, also written to path when given.
+
+        Parameters
+        ----------
+        path: str
+            The file to write to
+        kwargs:
+            Passed on to json.dumps, e.g. indent=1
+
+        Returns
+        -------
+        The JSON string
+        """
+        text = json.dumps(self.to_dict(), default=_to_builtin, **kwargs)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+
+def _to_builtin(x):
+    # numpy scalars and arrays in the event data
+    if hasattr(x, 'tolist'):
+        return x.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(x).__name__))
+
+
+def _update():
+    global enabled
+    enabled = bool(_recorders or _callbacks)
+
+
+@contextmanager
+def record(recorder: Recorder = None):
+    """
+    Record everything emitted inside the with block.
+
+    Parameters
+    ----------
+    recorder: Recorder
+        The recorder to add to, e.g. to accumulate over several blocks. A new one by default.
+
+    Returns
+    -------
+    The active Recorder
+    """
+    recorder = Recorder() if recorder is None else recorder
+    _recorders.append(recorder)
+    _update()
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+        _update()
+
+
+def register(callback):
+    """
+    Call callback(kind, name, value) for everything emitted until it is unregistered,
+    e.g. to forward the data to a metrics service. kind is 'count' (value is the
+    increment), 'time' (seconds) or 'event' (a dict).
+    """
+    _callbacks.append(callback)
+    _update()
+    return callback
+
+
+def unregister(callback):
+    _callbacks.remove(callback)
+    _update()
+
+
+def count(name: str, n=1):
+    for recorder in _recorders:
+        recorder.count(name, n)
+    for callback in _callbacks:
+        callback('count', name, n)
+
+
+def add_time(name: str, seconds: float):
+    for recorder in _recorders:
+        recorder.add_time(name, seconds)
+    for callback in _callbacks:
+        callback('time', name, seconds)
+
+
+def event(name: str, **data):
+    for recorder in _recorders:
+        recorder.event(name, data)
+    for callback in _callbacks:
+        callback('event', name, data)
+
+
+@contextmanager
+def timer(name: str):
+    """
+    Time the with block under name when instrumentation is enabled.
+    """
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """
+    A decorator timing every call of the function under name when instrumentation is
+    enabled. Disabled, the only cost is the check of the flag.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,376 @@
+"""
+outofcore.py
+Block by block operations on view factor matrices larger than memory. The matrix lives
+in a .npy file opened as a memory map, and every operation reads a block of rows (or a
+pair of tiles) at a time, sized so that the temporaries stay within a memory budget:
+
+    A, Fij, eps = rht.outofcore.read_output('output.txt', 'Fij.npy', memory=2**30)
+    Fij.row_sums()                             # the summation rule
+    rht.outofcore.check_reciprocity(Fij, A)    # A_i F_ij = A_j F_ji
+    J, info = rht.enclosures.solve_radiosity(Fij, eps, eb)
+
+The budget of a BlockedMatrix defaults to the module level memory_budget (bytes).
+"""
+
+import os
+
+import numpy as np
+
+from . import instrument
+
+memory_budget = 2**28
+
+
+def _budget(memory):
+    return memory_budget if memory is None else int(memory)
+
+
+def open_npy(path, shape=None, dtype=np.float64):
+    """
+    Open a .npy file as a memory map, read-only, or create it with shape and dtype.
+
+    Parameters
+    ----------
+    path: str
+        The .npy file
+    shape: tuple
+        The shape of a new file. None opens an existing file read-only.
+    dtype:
+        The floating point type of a new file
+
+    Returns
+    -------
+    The np.memmap
+    """
+    if shape is None:
+        return np.load(path, mmap_mode='r')
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
+class BlockedMatrix:
+    """
+    A square matrix operated on by blocks of rows, so that at most about `memory` bytes
+    of temporaries exist at a time. Wraps any array, typically a np.memmap of a .npy
+    file, which is only read block by block. Products with it work wherever a matrix
+    does: `Fij @ J`, scipy.sparse.linalg and enclosures.solve_radiosity.
+
+    Parameters
+    ----------
+    a: np.ndarray or str
+        The matrix, or the path to a .npy file to memory map read-only
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+    """
+    def __init__(self, a, memory: int = None):
+        self.a = open_npy(a) if isinstance(a, str) else a
+        if self.a.ndim != 2 or self.a.shape[0] != self.a.shape[1]:
+            raise ValueError('A BlockedMatrix must be square, not of shape {}'.format(self.a.shape))
+        self.memory = memory
+        self.shape = self.a.shape
+        self.dtype = np.dtype(np.float64)
+        self.N = self.a.shape[0]
+
+    def __len__(self):
+        return self.N
+
+    def block_rows(self, n_temporaries: int = 2, n_columns: int = 1):
+        """
+        The number of rows per block such that n_temporaries float64 arrays of shape
+        (rows, N) and the (N, n_columns) vectors fit in the memory budget, at least one.
+        """
+        free = _budget(self.memory) - 2 * 8 * self.N * n_columns
+        return int(min(self.N, max(1, free // (8 * n_temporaries * self.N))))
+
+    def blocks(self, n_temporaries: int = 2, n_columns: int = 1):
+        """
+        Read the matrix block of rows by block of rows.
+
+        Returns
+        -------
+        A generator of (start, stop, block) with the rows of the block and the block as
+        float64, shape (stop - start, N)
+        """
+        rows = self.block_rows(n_temporaries, n_columns)
+        for start in range(0, self.N, rows):
+            stop = min(start + rows, self.N)
+            if instrument.enabled:
+                instrument.count('outofcore.blocks')
+            yield start, stop, np.asarray(self.a[start:stop], dtype=np.float64)
+
+    @instrument.timed('outofcore.matvec')
+    def matvec(self, x: np.ndarray):
+        """
+        The product with a vector of length N or a matrix of shape (N, k).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        columns = x.reshape(self.N, -1)
+        y = np.empty(columns.shape)
+        for start, stop, block in self.blocks(n_columns=columns.shape[1]):
+            y[start:stop] = block @ columns
+        return y.reshape(x.shape)
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+    @instrument.timed('outofcore.rmatvec')
+    def rmatvec(self, x: np.ndarray):
+        """
+        The product of the transpose with a vector of length N or a matrix of shape
+        (N, k), accumulated over the blocks of rows without forming the transpose.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        columns = x.reshape(self.N, -1)
+        y = np.zeros(columns.shape)
+        for start, stop, block in self.blocks(n_columns=columns.shape[1]):
+            y += block.T @ columns[start:stop]
+        return y.reshape(x.shape)
+
+    def row_sums(self):
+        """
+        The sum of every row (column vector), e.g. the summation rule of view factors.
+        """
+        sums = np.empty((self.N, 1))
+        for start, stop, block in self.blocks(n_temporaries=1):
+            sums[start:stop, 0] = block.sum(axis=1)
+        return sums
+
+    def diagonal(self):
+        diagonal = np.empty(self.N)
+        for start, stop, block in self.blocks(n_temporaries=1):
+            diagonal[start:stop] = block[np.arange(stop - start), np.arange(start, stop)]
+        return diagonal
+
+    def aslinearoperator(self):
+        """
+        The matrix as a scipy.sparse.linalg.LinearOperator.
+        """
+        from scipy.sparse.linalg import LinearOperator
+
+        return LinearOperator(self.shape, matvec=self.matvec, rmatvec=self.rmatvec, matmat=self.matvec,
+                              dtype=np.float64)
+
+
+def _blocked(a, memory):
+    return a if isinstance(a, BlockedMatrix) else BlockedMatrix(a, memory=memory)
+
+
+@instrument.timed('outofcore.read_output')
+def read_output(path_to_file, path_to_npy, delimiter=' ', dtype=np.float64, memory: int = None):
+    """
+    Parse a View3D output file straight into a .npy file, a block of rows at a time,
+    without holding the view factor matrix in memory.
+
+    Parameters
+    ----------
+    path_to_file: str
+        The path to the View3D output file
+    path_to_npy: str
+        The .npy file the view factor matrix is written to
+    delimiter: str
+        The delimiter between the values of a row
+    dtype:
+        The floating point type of the stored matrix, e.g. np.float32 to halve the size
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix as a BlockedMatrix of the .npy
+    file and the emissivities (column vector)
+    """
+    from .view3d import View3DOutput
+
+    output = View3DOutput(path_to_file, delimiter=delimiter, dtype=dtype)
+    out = open_npy(path_to_npy, shape=(output.N, output.N), dtype=dtype)
+    # a block holds about 3 times its text in temporaries
+    output.read(chunk_bytes=_budget(memory) // 4, out=out)
+    out.flush()
+    del out
+
+    return output.A, BlockedMatrix(path_to_npy, memory=memory), output.eps
+
+
+@instrument.timed('outofcore.allclose_transpose')
+def allclose_transpose(a, scale: np.ndarray = None, rtol=1e-05, atol=1e-08, memory: int = None):
+    """
+    np.allclose(s_i a_ij, s_j a_ji) for all i, j, compared tile by tile so that the
+    transpose is never formed.
+
+    Parameters
+    ----------
+    a: np.ndarray or BlockedMatrix
+        The square matrix
+    scale: np.ndarray
+        The row scale s, e.g. the areas to check the reciprocity of view factors. None
+        checks the symmetry of a.
+    rtol: float
+        The relative tolerance of np.allclose
+    atol: float
+        The absolute tolerance of np.allclose
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    True when every pair agrees within the tolerances
+    """
+    a = _blocked(a, memory)
+    s = None if scale is None else np.asarray(scale, dtype=np.float64).reshape(-1, 1)
+    # two tiles and their comparison temporaries
+    tile = int(min(a.N, max(1, np.sqrt(_budget(a.memory) // (8 * 8)))))
+    for i in range(0, a.N, tile):
+        I = slice(i, min(i + tile, a.N))
+        for j in range(i, a.N, tile):
+            J = slice(j, min(j + tile, a.N))
+            upper = np.asarray(a.a[I, J], dtype=np.float64)
+            lower = np.asarray(a.a[J, I], dtype=np.float64).T
+            if s is not None:
+                upper = upper * s[I]
+                lower = lower * s[J].T
+            # np.allclose is not symmetric in its arguments, both orders as for a and a.T
+            if not (np.allclose(upper, lower, rtol=rtol, atol=atol)
+                    and np.allclose(lower, upper, rtol=rtol, atol=atol)):
+                return False
+    return True
+
+
+def check_reciprocity(Fij, A: np.ndarray, rtol=1e-05, atol=1e-08, memory: int = None):
+    """
+    Check the reciprocity of view factors, A_i F_ij = A_j F_ji, tile by tile.
+
+    Parameters
+    ----------
+    Fij: np.ndarray or BlockedMatrix
+        View factor matrix
+    A: np.ndarray
+        The area of each surface (column vector)
+    rtol: float
+        The relative tolerance of np.allclose
+    atol: float
+        The absolute tolerance of np.allclose
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    True when A Fij is symmetric within the tolerances
+    """
+    return allclose_transpose(Fij, scale=A, rtol=rtol, atol=atol, memory=memory)
+
+
+def _assemble(Fij, out, memory, row_block):
+    # fill out (an array or the path of a new .npy file) with row_block(start, stop, block)
+    Fij = _blocked(Fij, memory)
+    if isinstance(out, str):
+        path = out
+        out = open_npy(path, shape=Fij.shape)
+    else:
+        path = None
+        out = np.empty(Fij.shape) if out is None else out
+    for start, stop, block in Fij.blocks():
+        out[start:stop] = row_block(start, stop, block)
+    if path is None:
+        return out
+    out.flush()
+    del out
+    return BlockedMatrix(path, memory=memory)
+
+
+def _with_diagonal(block, start, stop, diagonal):
+    # add diagonal[start:stop] to the diagonal entries of the rows start to stop
+    block[np.arange(stop - start), np.arange(start, stop)] += diagonal[start:stop]
+    return block
+
+
+@instrument.timed('outofcore.F_matrix')
+def F_matrix(Fij, eps: np.ndarray, out=None, memory: int = None):
+    """
+    enclosures.F_matrix a block of rows at a time.
+
+    Parameters
+    ----------
+    Fij: np.ndarray or BlockedMatrix
+        View factor matrix
+    eps: np.ndarray
+        The emissivity of each surface (column vector)
+    out: np.ndarray or str
+        The array to fill, or the path of a .npy file to create
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    The F matrix, a BlockedMatrix of the .npy file when out is a path
+    """
+    eps = np.asarray(eps, dtype=np.float64).reshape(-1)
+    eps_frac = ((eps - 1) / eps)[:, np.newaxis]
+
+    def row_block(start, stop, block):
+        return _with_diagonal(block * eps_frac[start:stop], start, stop, 1 / eps)
+
+    return _assemble(Fij, out, memory, row_block)
+
+
+@instrument.timed('outofcore.T_matrix')
+def T_matrix(Fij, eps: np.ndarray, A: np.ndarray, out=None, memory: int = None):
+    """
+    enclosures.T_matrix a block of rows at a time.
+
+    Parameters
+    ----------
+    Fij: np.ndarray or BlockedMatrix
+        View factor matrix
+    eps: np.ndarray
+        The emissivity of each surface (column vector)
+    A: np.ndarray
+        The area of each surface (column vector)
+    out: np.ndarray or str
+        The array to fill, or the path of a .npy file to create
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    The T matrix, a BlockedMatrix of the .npy file when out is a path
+    """
+    eps = np.asarray(eps, dtype=np.float64).reshape(-1)
+    A = np.asarray(A, dtype=np.float64).reshape(-1, 1)
+    column = (1 - eps) / eps / A[:, 0]
+
+    def row_block(start, stop, block):
+        return _with_diagonal(-A[start:stop] * block * column, start, stop, 1 / eps)
+
+    return _assemble(Fij, out, memory, row_block)
+
+
+@instrument.timed('outofcore.S_matrix')
+def S_matrix(Fij, eps: np.ndarray, A: np.ndarray, out=None, memory: int = None):
+    """
+    enclosures.S_matrix a block of rows at a time.
+
+    Parameters
+    ----------
+    Fij: np.ndarray or BlockedMatrix
+        View factor matrix
+    eps: np.ndarray
+        The emissivity of each surface (column vector)
+    A: np.ndarray
+        The area of each surface (column vector)
+    out: np.ndarray or str
+        The array to fill, or the path of a .npy file to create
+    memory: int
+        The memory budget in bytes, defaults to memory_budget
+
+    Returns
+    -------
+    The S matrix, a BlockedMatrix of the .npy file when out is a path
+    """
+    eps = np.asarray(eps, dtype=np.float64).reshape(-1)
+    A = np.asarray(A, dtype=np.float64).reshape(-1, 1)
+
+    def row_block(start, stop, block):
+        return block * A[start:stop] * eps
+
+    return _assemble(Fij, out, memory, row_block)
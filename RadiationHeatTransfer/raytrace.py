@@ -0,0 +1,377 @@
+"""
+raytrace.py
+Obstructed view factors of a VS3 geometry by Monte Carlo ray tracing. Rays leave each
+surface from uniformly distributed points in cosine weighted directions, and F_ij is the
+fraction of them whose first hit is the front side of surface j. Every surface can
+obstruct every other, and the nearest hit is found with a bounding volume hierarchy
+(BVH) over the triangles of the surfaces. All rays of a batch walk the hierarchy
+together, one level per step.
+
+The base and cmb columns of a VS3 file are applied by read_vs3_view_factors: the
+surfaces with a nonzero cmb are combined into the surface they name, as in the View3D
+output. Subsurfaces (a nonzero base) are not supported and raise a ValueError.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import instrument
+from .viewfactors import polygons, _areas_normals
+
+
+class BVH:
+    """
+    A bounding volume hierarchy over triangles, stored as flat arrays. Leaves hold the
+    triangles start to start + count of the reordered triangle arrays.
+
+    Parameters
+    ----------
+    triangles: np.ndarray
+        The triangle vertices, shape (n_triangles, 3, 3)
+    leaf_size: int
+        The largest number of triangles in a leaf
+    """
+    def __init__(self, triangles: np.ndarray, leaf_size: int = 4):
+        centroids = triangles.mean(axis=1)
+        lo_tri = triangles.min(axis=1)
+        hi_tri = triangles.max(axis=1)
+
+        order = np.arange(len(triangles))
+        # a binary tree with n leaves or fewer has at most 2n - 1 nodes
+        size = 2 * len(triangles)
+        bmin = np.empty((size, 3))
+        bmax = np.empty((size, 3))
+        left = np.full(size, -1)
+        right = np.full(size, -1)
+        start = np.zeros(size, dtype=np.intp)
+        count = np.zeros(size, dtype=np.intp)
+
+        # (node, first, last) ranges of order still to be split
+        stack = [(0, 0, len(triangles))]
+        n_nodes = 1
+        while stack:
+            node, first, last = stack.pop()
+            idx = order[first:last]
+            bmin[node] = lo_tri[idx].min(axis=0)
+            bmax[node] = hi_tri[idx].max(axis=0)
+            if last - first <= leaf_size:
+                start[node], count[node] = first, last - first
+                continue
+            # split at the median centroid along the longest axis
+            axis = np.argmax(centroids[idx].max(axis=0) - centroids[idx].min(axis=0))
+            order[first:last] = idx[np.argsort(centroids[idx, axis], kind='stable')]
+            mid = (first + last) // 2
+            left[node], right[node] = n_nodes, n_nodes + 1
+            n_nodes += 2
+            stack.append((left[node], first, mid))
+            stack.append((right[node], mid, last))
+
+        self.order = order
+        self.triangles = triangles[order]
+        self.bmin = bmin[:n_nodes]
+        self.bmax = bmax[:n_nodes]
+        self.left = left[:n_nodes]
+        self.right = right[:n_nodes]
+        self.start = start[:n_nodes]
+        self.count = count[:n_nodes]
+
+    def intersect(self, origins: np.ndarray, directions: np.ndarray, t_min: float = 0.):
+        """
+        The nearest triangle hit by every ray.
+
+        Parameters
+        ----------
+        origins: np.ndarray
+            The ray origins, shape (n_rays, 3)
+        directions: np.ndarray
+            The ray directions, shape (n_rays, 3)
+        t_min: float
+            Hits closer than t_min are ignored
+
+        Returns
+        -------
+        The distance to the hit (inf for a miss) and the index of the triangle hit in the
+        original order (-1 for a miss)
+        """
+        n = len(origins)
+        best_t = np.full(n, np.inf)
+        best_tri = np.full(n, -1)
+        with np.errstate(divide='ignore'):
+            inv = 1 / directions
+
+        rays = np.arange(n)
+        nodes = np.zeros(n, dtype=np.intp)
+        while len(rays):
+            # slab test of the boxes, fmin and fmax skip the nan of 0 * inf
+            with np.errstate(invalid='ignore'):
+                lo = (self.bmin[nodes] - origins[rays]) * inv[rays]
+                hi = (self.bmax[nodes] - origins[rays]) * inv[rays]
+            t_near = np.fmax.reduce(np.fmin(lo, hi), axis=1)
+            t_far = np.fmin.reduce(np.fmax(lo, hi), axis=1)
+            hit = (t_far >= np.maximum(t_near, t_min)) & (t_near < best_t[rays])
+            rays, nodes = rays[hit], nodes[hit]
+
+            leaf = self.count[nodes] > 0
+            if leaf.any():
+                leaf_rays, leaf_nodes = rays[leaf], nodes[leaf]
+                counts = self.count[leaf_nodes]
+                r = np.repeat(leaf_rays, counts)
+                # the triangle indices of every leaf, start, start + 1, ..., start + count - 1
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                tri = np.repeat(self.start[leaf_nodes], counts) + offsets
+                t = _moller_trumbore(origins[r], directions[r], self.triangles[tri])
+                valid = (t > t_min) & np.isfinite(t)
+                r, tri, t = r[valid], tri[valid], t[valid]
+                np.minimum.at(best_t, r, t)
+                winner = t == best_t[r]
+                best_tri[r[winner]] = tri[winner]
+
+            rays, nodes = rays[~leaf], nodes[~leaf]
+            rays = np.concatenate((rays, rays))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+
+        hit = best_tri >= 0
+        best_tri[hit] = self.order[best_tri[hit]]
+        return best_t, best_tri
+
+
+def _moller_trumbore(origins, directions, triangles):
+    # the distance along each ray to its triangle, inf when it misses
+    v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    e1 = v1 - v0
+    e2 = v2 - v0
+    p = np.cross(directions, e2)
+    det = np.einsum('ki,ki->k', e1, p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_det = 1 / det
+        s = origins - v0
+        u = np.einsum('ki,ki->k', s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum('ki,ki->k', directions, q) * inv_det
+        t = np.einsum('ki,ki->k', e2, q) * inv_det
+    miss = (np.abs(det) < 1e-14) | (u < 0) | (v < 0) | (u + v > 1)
+    t[miss] = np.inf
+    return t
+
+
+def triangulate(P, n_vertices):
+    """
+    Fan triangulation of the (convex) polygons of viewfactors.polygons.
+
+    Returns
+    -------
+    The triangles, shape (n_triangles, 3, 3), and the surface of each triangle
+    """
+    triangles = []
+    owner = []
+    for i, n in enumerate(n_vertices):
+        for k in range(1, n - 1):
+            triangles.append((P[i, 0], P[i, k], P[i, k + 1]))
+            owner.append(i)
+    return np.array(triangles), np.array(owner)
+
+
+_shared = {}
+
+
+def _init_worker(bvh, triangles, owner, normals, scale):
+    _shared.update(bvh=bvh, triangles=triangles, owner=owner, normals=normals, scale=scale)
+
+
+def _trace_row(args):
+    """
+    Shoot rays from surface i until the standard error of every F_ij is below tol.
+    """
+    i, seed, tol, batch_size, min_rays, max_rays = args
+    bvh, triangles, owner = _shared['bvh'], _shared['triangles'], _shared['owner']
+    normals, scale = _shared['normals'], _shared['scale']
+    N = len(normals)
+    rng = np.random.default_rng(seed)
+
+    own = triangles[owner == i]
+    e1 = own[:, 1] - own[:, 0]
+    e2 = own[:, 2] - own[:, 0]
+    tri_areas = 0.5 * np.linalg.norm(np.cross(e1, e2), axis=1)
+    n = normals[i]
+    # an orthonormal basis (t1, t2, n) for the directions
+    t1 = np.cross(n, [1., 0., 0.] if abs(n[0]) < 0.9 else [0., 1., 0.])
+    t1 /= np.linalg.norm(t1)
+    t2 = np.cross(n, t1)
+
+    hits = np.zeros(N)
+    n_rays = 0
+    F = hits
+    se = np.full(N, np.inf)
+    while n_rays < max_rays:
+        # uniform points on the surface
+        k = rng.choice(len(own), size=batch_size, p=tri_areas / tri_areas.sum())
+        a, b = rng.random(batch_size), rng.random(batch_size)
+        flip = a + b > 1
+        a[flip], b[flip] = 1 - a[flip], 1 - b[flip]
+        origins = own[k, 0] + a[:, np.newaxis] * e1[k] + b[:, np.newaxis] * e2[k]
+
+        # cosine weighted directions about the normal
+        r = np.sqrt(rng.random(batch_size))
+        phi = 2 * np.pi * rng.random(batch_size)
+        directions = (r * np.cos(phi))[:, np.newaxis] * t1 + (r * np.sin(phi))[:, np.newaxis] * t2 \
+            + np.sqrt(1 - r**2)[:, np.newaxis] * n
+
+        _, tri = bvh.intersect(origins + 1e-9 * scale * n, directions, t_min=1e-9 * scale)
+        surface = owner[tri[tri >= 0]]
+        # a hit on the back of a surface is absorbed by the obstruction, not counted
+        front = np.einsum('ki,ki->k', directions[tri >= 0], normals[surface]) < 0
+        hits += np.bincount(surface[front], minlength=N)
+        n_rays += batch_size
+
+        F = hits / n_rays
+        se = np.sqrt(F * (1 - F) / n_rays)
+        if n_rays >= min_rays and se.max() <= tol:
+            break
+
+    return F, se, n_rays
+
+
+@instrument.timed('raytrace.obstructed_view_factors')
+def obstructed_view_factors(vertices, shapes, tol=1e-3, batch_size=10000, min_rays=10000, max_rays=10**7,
+                            seed=0, n_workers=1, leaf_size=4):
+    """
+    The view factor matrix of the surfaces of a VS3 geometry with obstructions, by
+    Monte Carlo ray tracing. Every row is traced until the standard error of all of its
+    view factors is below tol. Row i uses the random stream np.random.SeedSequence(seed)
+    spawned for i, so the result does not depend on n_workers.
+
+    Parameters
+    ----------
+    vertices: dict
+        The vertex number: (x, y, z) dictionary of viewgr.read_vs3_file
+    shapes: dict
+        The shape number: (v1, v2, ..., v1) dictionary of viewgr.read_vs3_file
+    tol: float
+        The target standard error of every view factor
+    batch_size: int
+        The number of rays traced per vectorized batch
+    min_rays: int
+        The minimum number of rays per surface
+    max_rays: int
+        The maximum number of rays per surface, even if tol is not met
+    seed: int
+        The seed of the random streams
+    n_workers: int
+        The number of worker processes, 1 traces in this process
+    leaf_size: int
+        The largest number of triangles in a BVH leaf
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix, the standard error of every view
+    factor and the number of rays traced from every surface. The dictionaries carry no
+    base and cmb columns, every surface is a row; see read_vs3_view_factors.
+    """
+    P, n_vertices = polygons(vertices, shapes)
+    return _trace(P, n_vertices, tol, batch_size, min_rays, max_rays, seed, n_workers, leaf_size)
+
+
+def _trace(P, n_vertices, tol, batch_size, min_rays, max_rays, seed, n_workers, leaf_size):
+    # obstructed_view_factors of the padded polygons P, shape (N, m, 3)
+    A, normals = _areas_normals(P)
+    triangles, owner = triangulate(P, n_vertices)
+    bvh = BVH(triangles, leaf_size=leaf_size)
+    scale = np.linalg.norm(bvh.bmax[0] - bvh.bmin[0])
+    args = (bvh, triangles, owner, normals, scale)
+
+    N = len(A)
+    seeds = np.random.SeedSequence(seed).spawn(N)
+    tasks = [(i, seeds[i], tol, batch_size, min_rays, max_rays) for i in range(N)]
+    if n_workers == 1:
+        _init_worker(*args)
+        results = [_trace_row(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=args) as pool:
+            results = list(pool.map(_trace_row, tasks))
+
+    Fij = np.array([F for F, _, _ in results])
+    error = np.array([se for _, se, _ in results])
+    n_rays = np.array([n for _, _, n in results])
+    if instrument.enabled:
+        instrument.count('raytrace.rays', int(n_rays.sum()))
+
+    return A[:, np.newaxis], Fij, error, n_rays
+
+
+def _combine(A, Fij, error, n_rays, into):
+    """
+    Combine the surfaces into the surfaces into[i] (the identity for those kept): the
+    view factors to a combined surface are summed, those from it are averaged with the
+    areas as weights, and the standard errors follow.
+    """
+    kept, group = np.unique(into, return_inverse=True)
+    M = np.zeros((len(into), len(kept)))
+    M[np.arange(len(into)), group] = 1.
+    A_kept = M.T @ A
+
+    # the hits on the surfaces of a group are counted together
+    F = Fij @ M
+    se = np.sqrt(F * (1 - F) / n_rays[:, np.newaxis])
+    # the rows of a group are independent estimates, weighted by area
+    W = (M * A).T / A_kept
+    return A_kept, W @ F, np.sqrt((W**2) @ se**2), M.T @ n_rays
+
+
+@instrument.timed('raytrace.read_vs3_view_factors')
+def read_vs3_view_factors(path_to_vs3, delimiter=None, tol=1e-3, batch_size=10000, min_rays=10000,
+                          max_rays=10**7, seed=0, n_workers=1, leaf_size=4):
+    """
+    The (A, Fij, eps) triple of view3d.read_output traced from a .vs3 file, with the
+    obstructions. The surfaces with a nonzero cmb are combined into the surface numbered
+    cmb and have no row or column of their own, as in the View3D output.
+
+    Parameters
+    ----------
+    path_to_vs3: str
+        The path to the .vs3 file
+    delimiter: str
+        The delimiter between the values of a line, None splits on any run of spaces
+        and tabs
+    tol, batch_size, min_rays, max_rays, seed, n_workers, leaf_size:
+        The options of obstructed_view_factors
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix, the emissivities (column
+    vector), the standard error of every view factor and the number of rays traced
+    from every surface, all in increasing surface number of the surfaces kept
+    """
+    from .viewgr import VS3Geometry
+
+    geometry = VS3Geometry.from_file(path_to_vs3, delimiter=delimiter)
+    order = np.argsort(geometry.surface_numbers)
+    numbers = geometry.surface_numbers[order]
+    base, cmb = geometry.base[order], geometry.cmb[order]
+    if np.any(base != 0):
+        raise ValueError('{}: surface {} is a subsurface (base = {}), which the ray tracer does not support'.format(
+            path_to_vs3, numbers[base != 0][0], base[base != 0][0]))
+
+    # the surface each surface is combined into, following chains of cmb
+    index = {number: k for k, number in enumerate(numbers)}
+    into = np.arange(len(numbers))
+    for k in np.flatnonzero(cmb):
+        seen = {k}
+        target = k
+        while cmb[target] != 0:
+            if cmb[target] not in index:
+                raise ValueError('{}: surface {} is combined with the unknown surface {}'.format(
+                    path_to_vs3, numbers[target], cmb[target]))
+            target = index[cmb[target]]
+            if target in seen:
+                raise ValueError('{}: the cmb column of surface {} forms a cycle'.format(path_to_vs3, numbers[k]))
+            seen.add(target)
+        into[k] = target
+
+    n_vertices = (geometry.connectivity[order] >= 0).sum(axis=1)
+    A, Fij, error, n_rays = _trace(geometry.polygons()[order], n_vertices, tol, batch_size, min_rays, max_rays,
+                                   seed, n_workers, leaf_size)
+    A, Fij, error, n_rays = _combine(A, Fij, error, n_rays, into)
+    eps = geometry.emissivity[order][np.unique(into)][:, np.newaxis]
+
+    return A, Fij, eps, error, n_rays
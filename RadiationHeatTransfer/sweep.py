@@ -0,0 +1,358 @@
+"""
+sweep.py
+Parameter sweeps over one fixed enclosure geometry: many emissivity, temperature,
+heat input and convection scenarios for the same view factor matrix. The view factor
+matrix, the areas, the scenario table and the outputs are placed in shared memory (or
+in .npy files, for resumable sweeps) once, and the worker processes only receive the
+(start, stop) case ranges of their chunks, so the N x N matrix is never pickled per
+task. Every chunk writes its rows of the preallocated outputs, so the results are in
+case order however the chunks complete.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import instrument
+
+# the per case inputs of each model and the outputs: name: (dtype, per surface)
+_INPUTS = {'gray': ('eps', 'T'),
+           'zonal': ('eps', 'qf_in', 'h', 'U', 'TOS', 'Ts')}
+_OUTPUTS = {'gray': {'Q': (np.float64, True)},
+            'zonal': {'Ts': (np.float64, True), 'Ta': (np.float64, False),
+                      'iterations': (np.int64, False), 'converged': (np.bool_, False)}}
+
+
+def _share(array: np.ndarray, blocks: list):
+    """
+    Copy an array into a new shared memory block, return its spec and the shared view.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(shm)
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return ('shm', shm.name, array.shape, array.dtype.str), view
+
+
+def _attach(spec, blocks: list):
+    """
+    The array of a spec made by _share, or of a ('npy', path) spec, opened in place.
+    """
+    if spec[0] == 'npy':
+        return np.load(spec[1], mmap_mode='r+')
+    _, name, shape, dtype = spec
+    try:
+        # the creating process owns the block, do not let this one unlink it at exit
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+    blocks.append(shm)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _cases(scenarios: dict, model: str, N: int):
+    """
+    The scenario table as arrays of shape (n_cases, 1) (same value on every surface) or
+    (n_cases, N), and the number of cases.
+    """
+    unknown = set(scenarios) - set(_INPUTS[model])
+    if unknown:
+        raise ValueError('Unknown scenario columns for the {} model: {}'.format(model, sorted(unknown)))
+    columns = {}
+    n_cases = None
+    for name, values in scenarios.items():
+        values = np.asarray(values, dtype=np.float64)
+        values = values.reshape(len(values), -1)
+        if values.shape[1] not in (1, N):
+            raise ValueError('Scenario column {} has {} values per case, expected 1 or {}'.format(
+                name, values.shape[1], N))
+        if n_cases is not None and len(values) != n_cases:
+            raise ValueError('Scenario column {} has {} cases, expected {}'.format(name, len(values), n_cases))
+        n_cases = len(values)
+        columns[name] = np.ascontiguousarray(values)
+    if n_cases is None:
+        raise ValueError('The scenario table is empty')
+    return columns, n_cases
+
+
+_shared = {}
+
+
+def _init_worker(specs: dict, fixed: dict, model: str, solver_kwargs: dict):
+    blocks = []
+    arrays = {name: _attach(spec, blocks) for name, spec in specs.items()}
+    _shared.clear()
+    _shared.update(arrays=arrays, blocks=blocks, fixed=fixed, model=model, solver_kwargs=solver_kwargs)
+
+
+def _fixed_factorization():
+    # the LU factorization (gray) or exchange matrix (zonal) of a fixed eps, once per worker
+    if 'fixed_matrix' not in _shared:
+        from .enclosures import Enclosure
+        arrays = _shared['arrays']
+        enclosure = Enclosure(arrays['Fij'], arrays['A'], _shared['fixed']['eps'])
+        _shared['fixed_matrix'] = enclosure.lu if _shared['model'] == 'gray' else enclosure.SS
+    return _shared['fixed_matrix']
+
+
+def _value(name: str, start: int, stop: int):
+    # the per case values of an input, shape (stop - start, 1) or (stop - start, N), or None if fixed
+    column = _shared['arrays'].get('case_' + name)
+    return None if column is None else column[start:stop]
+
+
+def _run_gray(start: int, stop: int):
+    from scipy.linalg import lu_solve
+    from .blackbody import Eb_vectorized
+    from .enclosures import F_matrix, _row
+
+    arrays = _shared['arrays']
+    Fij = arrays['Fij']
+    A = arrays['A']
+    N = len(A)
+    k = stop - start
+
+    T = _value('T', start, stop)
+    T = np.broadcast_to(_shared['fixed']['T'].reshape(1, -1) if T is None else T, (k, N))
+    eb = Eb_vectorized(T)  # (k, N)
+
+    eps = _value('eps', start, stop)
+    if eps is None:
+        J = lu_solve(_fixed_factorization(), eb.T).T
+    else:
+        # one F_matrix per case, solved as a stack
+        eps = np.broadcast_to(eps, (k, N))[:, :, np.newaxis]
+        J = np.linalg.solve(F_matrix(Fij, eps), eb[:, :, np.newaxis])[:, :, 0]
+    q = J - J @ _row(Fij)
+    arrays['Q'][start:stop] = q * A[:, 0]
+
+
+def _run_zonal(start: int, stop: int):
+    from .enclosures import T_matrix, S_matrix
+    from .zonal import solve
+
+    arrays = _shared['arrays']
+    Fij = arrays['Fij']
+    A = arrays['A']
+    N = len(A)
+    k = stop - start
+    fixed = _shared['fixed']
+
+    eps = _value('eps', start, stop)
+    if eps is None:
+        SS = np.broadcast_to(_fixed_factorization(), (k, N, N))
+    else:
+        eps = np.broadcast_to(eps, (k, N))[:, :, np.newaxis]
+        SS = np.linalg.solve(T_matrix(Fij, eps, A), S_matrix(Fij, eps, A))
+
+    inputs = {}
+    for name in ('qf_in', 'h', 'U', 'Ts'):
+        values = _value(name, start, stop)
+        inputs[name] = [fixed[name]] * k if values is None else values
+    TOS = _value('TOS', start, stop)
+    # a back side temperature per case, or per case and surface
+    TOS = [fixed['TOS']] * k if TOS is None else TOS[:, 0] if TOS.shape[1] == 1 else TOS
+
+    for c in range(k):
+        Ts, Ta, info = solve(SS[c], A, h=inputs['h'][c], U=inputs['U'][c], TOS=TOS[c],
+                             qf_in=inputs['qf_in'][c], Ts=inputs['Ts'][c], **_shared['solver_kwargs'])
+        arrays['Ts'][start + c] = Ts[:, 0]
+        arrays['Ta'][start + c] = Ta
+        arrays['iterations'][start + c] = info['iterations']
+        arrays['converged'][start + c] = info['converged']
+
+
+def _run_chunk(bounds):
+    start, stop = bounds
+    if _shared['model'] == 'gray':
+        _run_gray(start, stop)
+    else:
+        _run_zonal(start, stop)
+    return bounds
+
+
+def _inputs_hash(enclosure: dict, columns: dict, fixed: dict, solver_kwargs: dict):
+    """
+    The sha256 hex digest of the view factors and areas, the scenario table, the fixed
+    inputs and the solver options, so that a resumed sweep can tell whether its chunks
+    were done for the same inputs.
+    """
+    digest = hashlib.sha256()
+    for group in (enclosure, columns, fixed):
+        for name in sorted(group):
+            value = np.ascontiguousarray(group[name], dtype=np.float64)
+            digest.update('{}{}'.format(name, value.shape).encode())
+            digest.update(value.tobytes())
+    digest.update(json.dumps(solver_kwargs, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _open_outputs(path: str, model: str, n_cases: int, N: int, chunk_size: int, n_chunks: int, inputs: str):
+    """
+    Create the .npy outputs of a resumable sweep, or reopen them if they belong to the
+    same sweep, i.e. the same inputs hash. Returns the output specs and the memory
+    mapped done flag of every chunk.
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {'model': model, 'n_cases': n_cases, 'N': N, 'chunk_size': chunk_size, 'inputs': inputs}
+    meta_path = os.path.join(path, 'sweep.json')
+    done_path = os.path.join(path, 'done.npy')
+    if os.path.isfile(meta_path):
+        with open(meta_path) as file:
+            existing = json.load(file)
+        if existing != meta:
+            raise ValueError('{} holds a different sweep: {}'.format(path, existing))
+        done = np.load(done_path, mmap_mode='r+')
+    else:
+        for name, (dtype, per_surface) in _OUTPUTS[model].items():
+            shape = (n_cases, N) if per_surface else (n_cases,)
+            np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+        done = np.lib.format.open_memmap(done_path, mode='w+', dtype=np.bool_, shape=(n_chunks,))
+        done.flush()
+        # written last, so an interrupted setup is not mistaken for a sweep to resume
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+    specs = {name: ('npy', os.path.join(path, name + '.npy')) for name in _OUTPUTS[model]}
+    return specs, done
+
+
+def sweep(Fij: np.ndarray, A: np.ndarray, scenarios: dict, model: str = 'zonal', eps=0.9, T=300., qf_in=0.,
+          h=10., U=.15, TOS: float = 300., Ts=300., n_workers: int = None, chunk_size: int = None,
+          path: str = None, progress=None, **solver_kwargs):
+    """
+    Solve one enclosure for every scenario of a table, in parallel.
+
+    The scenario table is a dict of columns with one row per case. A column of shape
+    (n_cases,) sets the same value on every surface, a column of shape (n_cases, N) one
+    value per surface, e.g. the back side temperature TOS of every surface. The inputs
+    without a column take the fixed values of the keyword arguments. When eps is fixed,
+    the enclosure is factorized once per worker and every case only costs a triangular
+    solve (gray) or a Newton iteration (zonal).
+
+    Parameters
+    ----------
+    Fij: np.ndarray
+        View factor matrix, shape (N, N)
+    A: np.ndarray
+        The area of each surface (column vector)
+    scenarios: dict
+        The per case inputs. 'eps' and 'T' for the gray model, 'eps', 'qf_in', 'h', 'U',
+        'TOS' and 'Ts' (the initial guess) for the zonal model.
+    model: str
+        'gray' for the net heat flow of a gray enclosure at given surface temperatures,
+        or 'zonal' for the steady state temperatures of zonal.solve
+    eps, T, qf_in, h, U, TOS, Ts: float or np.ndarray
+        The fixed inputs, as for enclosures.Enclosure and zonal.solve
+    n_workers: int
+        The number of worker processes, defaults to the number of cores. With 1 the
+        sweep runs in this process.
+    chunk_size: int
+        The number of cases per task, defaults to the number that keeps the stacked
+        N x N matrices of a chunk near 64 MB
+    path: str
+        A directory for the outputs as .npy files. If it holds the outputs of the same
+        sweep, the chunks already done are skipped, so an interrupted sweep resumes. A
+        directory of a sweep with other view factors, areas, scenarios, fixed inputs or
+        solver options raises a ValueError.
+    progress: callable
+        Called as progress(n_done, n_cases) in this process as chunks complete
+    solver_kwargs:
+        Passed on to zonal.solve, e.g. method, tol and maxiter
+
+    Returns
+    -------
+    A dict of the outputs in case order. 'Q', the heat flow leaving each surface (W),
+    shape (n_cases, N), for the gray model. 'Ts' (n_cases, N), 'Ta', 'iterations' and
+    'converged' (n_cases,) for the zonal model. With path the arrays are read-only
+    memory maps of the files.
+    """
+    if model not in _INPUTS:
+        raise ValueError('Unknown model: {}'.format(model))
+
+    Fij = np.ascontiguousarray(Fij, dtype=np.float64)
+    A = np.ascontiguousarray(np.asarray(A, dtype=np.float64).reshape(-1, 1))
+    N = len(A)
+    columns, n_cases = _cases(scenarios, model, N)
+    fixed = {'eps': np.broadcast_to(np.asarray(eps, dtype=np.float64).reshape(-1, 1), (N, 1)).copy(),
+             'T': np.broadcast_to(np.asarray(T, dtype=np.float64).reshape(-1), (N,)).copy(),
+             'qf_in': qf_in, 'h': h, 'U': U, 'TOS': TOS, 'Ts': Ts}
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = int(np.clip(2**23 // N**2, 1, 1024))
+    starts = range(0, n_cases, chunk_size)
+    chunks = [(start, min(start + chunk_size, n_cases)) for start in starts]
+
+    blocks = []
+    outputs = {}
+    try:
+        specs = {}
+        if n_workers > 1:
+            for name, array in [('Fij', Fij), ('A', A)] + [('case_' + c, v) for c, v in columns.items()]:
+                specs[name] = _share(array, blocks)[0]
+        else:
+            specs = None
+            arrays = dict(Fij=Fij, A=A, **{'case_' + c: v for c, v in columns.items()})
+
+        if path is not None:
+            output_specs, done = _open_outputs(path, model, n_cases, N, chunk_size, len(chunks),
+                                               _inputs_hash({'Fij': Fij, 'A': A}, columns, fixed, solver_kwargs))
+            outputs = {name: _attach(spec, []) for name, spec in output_specs.items()}
+        else:
+            done = np.zeros(len(chunks), dtype=np.bool_)
+            output_specs = {}
+            for name, (dtype, per_surface) in _OUTPUTS[model].items():
+                empty = np.zeros((n_cases, N) if per_surface else (n_cases,), dtype=dtype)
+                if n_workers > 1:
+                    output_specs[name], outputs[name] = _share(empty, blocks)
+                else:
+                    outputs[name] = empty
+
+        todo = [chunk for chunk, finished in zip(chunks, done) if not finished]
+        n_done = n_cases - sum(stop - start for start, stop in todo)
+        if progress is not None:
+            progress(n_done, n_cases)
+
+        def finished(bounds):
+            nonlocal n_done
+            done[bounds[0] // chunk_size] = True
+            if path is not None:
+                done.flush()
+            n_done += bounds[1] - bounds[0]
+            if instrument.enabled:
+                instrument.count('sweep.cases', bounds[1] - bounds[0])
+            if progress is not None:
+                progress(n_done, n_cases)
+
+        if n_workers > 1:
+            specs.update(output_specs)
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(specs, fixed, model, solver_kwargs)) as pool:
+                futures = [pool.submit(_run_chunk, chunk) for chunk in todo]
+                for future in as_completed(futures):
+                    finished(future.result())
+        else:
+            _shared.clear()
+            arrays.update(outputs)
+            _shared.update(arrays=arrays, blocks=[], fixed=fixed, model=model, solver_kwargs=solver_kwargs)
+            for chunk in todo:
+                finished(_run_chunk(chunk))
+            _shared.clear()
+
+        if path is not None:
+            for array in outputs.values():
+                array.flush()
+            return {name: np.load(spec[1], mmap_mode='r') for name, spec in output_specs.items()}
+        # copy out of shared memory before it is released
+        return {name: np.array(array) for name, array in outputs.items()}
+    finally:
+        # the views into the blocks have to be gone before the blocks can be closed
+        outputs = None
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
@@ -3,34 +3,219 @@
 
 import numpy as np
 
+from . import instrument
 
-def read_output(path_to_file, delimiter=' '):
 
-    file = open(path_to_file, 'r+')
-    data = file.read().split('\n')
-    file.close()
-    # remove blank lines
-    data = [data[i] for i in range(len(data)) if data[i] != '']
+class View3DOutput:
+    """
+    Lazy access to a View3D output file. Opening the file reads the header, the areas
+    and the emissivities and records where each view factor row starts, so that rows or
+    blocks of rows are parsed straight into arrays only when they are asked for.
 
-    areas = data[1].split(delimiter)  # make a list of areas by splittingby the delimiter
-    _view_factors = data[2:len(data)-1]
-    view_factors = []
-    for i in range(len(_view_factors)):  # loop through the list and build a 2D list by splitting by delimiter
-        vf = _view_factors[i].split(delimiter)
-        view_factors.append(vf)
-    emissivities = data[-1].split(delimiter)
+    The file is laid out as
 
-    areas = np.array(areas, dtype=np.float64)
-    view_factors = np.array(view_factors, dtype=np.float64)
-    emissivities = np.array(emissivities, dtype=np.float64)
+        View3D 4.0.0 0 1 0 N
+        A_1 ... A_N
+        F_11 ... F_1N
+        ...
+        F_N1 ... F_NN
+        eps_1 ... eps_N
 
-    areas = areas[:, np.newaxis]  # correspond to the ith surface
-    emissivities = emissivities[:, np.newaxis]
+    Parameters
+    ----------
+    path_to_file: str
+        The path to the View3D output file
+    delimiter: str
+        The delimiter between the values of a row
+    dtype:
+        The floating point type of the returned arrays
+    """
+    def __init__(self, path_to_file, delimiter=' ', dtype=np.float64):
+        self.path_to_file = path_to_file
+        self.delimiter = delimiter
+        self.dtype = dtype
 
-    return areas, view_factors, emissivities
+        offsets = []
+        with open(path_to_file, 'rb') as file:
+            header = file.readline()
+            pos = len(header)
+            self.header = header.decode().split()
+            self.N = self._validate_header(self.header)
 
+            for line in file:
+                if line.strip():
+                    offsets.append((pos, len(line)))
+                pos += len(line)
 
-def check_symmetric(a, rtol=1e-05, atol=1e-08):
-    # Check the symmetry of a matrix
+        if len(offsets) != self.N + 2:
+            raise ValueError('{}: expected {} lines after the header for N = {}, found {}'.format(
+                path_to_file, self.N + 2, self.N, len(offsets)))
+        # the areas and emissivities bracket the view factor rows
+        self._offsets = offsets[1:-1]
+        self.A = self._parse_lines([offsets[0]], 1)[0][:, np.newaxis]
+        self.eps = self._parse_lines([offsets[-1]], 1)[0][:, np.newaxis]
+
+    @staticmethod
+    def _validate_header(fields):
+        # View3D 4.0.0 0 1 0 N
+        if len(fields) != 6 or fields[0] != 'View3D':
+            raise ValueError('Not a View3D output header: {}'.format(' '.join(fields)))
+        try:
+            N = int(fields[5])
+        except ValueError:
+            raise ValueError('The number of surfaces in the View3D header is not an integer: {}'.format(fields[5]))
+        if N <= 0:
+            raise ValueError('The number of surfaces in the View3D header must be positive: {}'.format(N))
+        return N
+
+    def _parse_lines(self, offsets, n_rows, out=None):
+        # read the byte ranges of consecutive lines and parse them in one call
+        if out is None:
+            out = np.empty((n_rows, self.N), dtype=self.dtype)
+        start = offsets[0][0]
+        stop = offsets[-1][0] + offsets[-1][1]
+        with open(self.path_to_file, 'rb') as file:
+            file.seek(start)
+            text = file.read(stop - start).decode()
+        if self.delimiter.strip():
+            text = text.replace(self.delimiter, ' ')
+        # whitespace in sep matches any run of spaces and newlines
+        values = np.fromstring(text, dtype=self.dtype, sep=' ')
+        if values.size != out.size:
+            raise ValueError('{}: expected {} values per row, found {} in {} rows'.format(
+                self.path_to_file, self.N, values.size, n_rows))
+        out.reshape(-1)[:] = values
+        return out
+
+    def rows(self, start, stop, out=None):
+        """
+        Parse the view factor rows start to stop (exclusive).
+
+        Parameters
+        ----------
+        start: int
+            The first row
+        stop: int
+            One past the last row
+        out: np.ndarray
+            Optional array of shape (stop - start, N) to parse into
+
+        Returns
+        -------
+        The view factors of the rows, shape (stop - start, N)
+        """
+        start, stop, _ = slice(start, stop).indices(self.N)
+        if stop <= start:
+            return np.empty((0, self.N), dtype=self.dtype)
+        return self._parse_lines(self._offsets[start:stop], stop - start, out=out)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                raise IndexError('Only contiguous blocks of rows can be read')
+            return self.rows(item.start, item.stop)
+        i = range(self.N)[item]
+        return self.rows(i, i + 1)[0]
+
+    def __len__(self):
+        return self.N
+
+    def chunks(self, chunk_bytes=2**24):
+        """
+        Split the view factor rows into blocks of consecutive rows whose text takes about
+        chunk_bytes, at least one row each. Parsing a block holds about 3 times its text
+        in temporaries, the bytes read, the decoded text and the parsed values.
+
+        Parameters
+        ----------
+        chunk_bytes: int
+            The size in bytes of the text of each block
+
+        Returns
+        -------
+        A generator of (start, stop) row ranges
+        """
+        ends = np.cumsum([length for _, length in self._offsets])
+        start = 0
+        while start < self.N:
+            done = ends[start - 1] if start else 0
+            stop = max(start + 1, int(np.searchsorted(ends, done + chunk_bytes, side='right')))
+            yield start, stop
+            start = stop
+
+    def iter_rows(self, chunk_bytes=2**24):
+        """
+        Stream the view factor matrix in blocks of rows.
+
+        Parameters
+        ----------
+        chunk_bytes: int
+            The size in bytes of the text of each block, see chunks
+
+        Returns
+        -------
+        A generator of (start, block) with the first row of the block and the block of
+        view factors, shape (rows, N)
+        """
+        for start, stop in self.chunks(chunk_bytes):
+            yield start, self.rows(start, stop)
+
+    def read(self, chunk_bytes=2**24, out=None):
+        """
+        Parse the whole view factor matrix into a preallocated array, a block of about
+        chunk_bytes of text at a time, so the temporaries do not grow with N.
+
+        Parameters
+        ----------
+        chunk_bytes: int
+            The size in bytes of the text parsed per call, see chunks
+        out: np.ndarray
+            Optional array of shape (N, N) to parse into, e.g. a np.memmap
+
+        Returns
+        -------
+        The view factor matrix, shape (N, N)
+        """
+        if out is None:
+            out = np.empty((self.N, self.N), dtype=self.dtype)
+        for start, stop in self.chunks(chunk_bytes):
+            self.rows(start, stop, out=out[start:stop])
+        return out
+
+
+@instrument.timed('view3d.read_output')
+def read_output(path_to_file, delimiter=' ', dtype=np.float64, chunk_bytes=2**24, out=None):
+    """
+    Read the areas, view factors and emissivities of a View3D output file.
+
+    Parameters
+    ----------
+    path_to_file: str
+        The path to the View3D output file
+    delimiter: str
+        The delimiter between the values of a row
+    dtype:
+        The floating point type of the returned arrays, e.g. np.float32 to halve the memory
+    chunk_bytes: int
+        The size in bytes of the text of the view factor rows parsed per call
+    out: np.ndarray
+        Optional array of shape (N, N) to parse into, e.g. a np.memmap for a matrix
+        larger than memory (see outofcore.read_output)
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix and the emissivities (column vector)
+    """
+    output = View3DOutput(path_to_file, delimiter=delimiter, dtype=dtype)
+    view_factors = output.read(chunk_bytes=chunk_bytes, out=out)
+
+    return output.A, view_factors, output.eps
+
+
+def check_symmetric(a, rtol=1e-05, atol=1e-08, memory=None):
+    # Check the symmetry of a matrix, np.allclose(a, a.T) compared tile by tile so that
+    # a memory mapped matrix larger than memory can be checked
     # https://stackoverflow.com/a/42913743/11637415
-    return np.allclose(a, a.T, rtol=rtol, atol=atol)
+    from .outofcore import allclose_transpose
+
+    return allclose_transpose(a, rtol=rtol, atol=atol, memory=memory)
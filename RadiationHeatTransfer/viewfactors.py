@@ -0,0 +1,308 @@
+"""
+viewfactors.py
+Unobstructed view factors between the planar polygons of a VS3 geometry, computed
+with the contour integral form of the view factor (Stokes' theorem)
+
+A_i F_ij = 1 / (2 pi) sum_p sum_q (a_p . b_q) int_0^1 int_0^1 ln|r_p(s) - r_q(t)| ds dt
+
+where the sums run over the edges a_p of polygon i and b_q of polygon j. The double
+integral is evaluated in closed form for parallel edges, which includes the shared
+edges of adjacent surfaces where the logarithm is singular, and with Gauss-Legendre
+quadrature otherwise. Obstructions are not considered.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from math import pi
+
+import numpy as np
+
+from . import instrument
+
+
+def polygons(vertices, shapes):
+    """
+    The vertex coordinates of every surface as a padded array.
+
+    Parameters
+    ----------
+    vertices: dict
+        The vertex number: (x, y, z) dictionary of viewgr.read_vs3_file
+    shapes: dict
+        The shape number: (v1, v2, ..., v1) dictionary of viewgr.read_vs3_file
+
+    Returns
+    -------
+    The coordinates, shape (n_surfaces, m, 3) with m the largest vertex count, and the
+    number of vertices of each surface. Shorter polygons repeat their first vertex.
+    """
+    numbers = sorted(shapes)
+    loops = []
+    for s in numbers:
+        loop = list(shapes[s])
+        if len(loop) > 1 and loop[0] == loop[-1]:
+            loop = loop[:-1]
+        loops.append(loop)
+    n_vertices = np.array([len(loop) for loop in loops])
+    m = n_vertices.max()
+
+    P = np.empty((len(loops), m, 3))
+    for i, loop in enumerate(loops):
+        P[i] = [vertices[v] for v in loop + [loop[0]] * (m - len(loop))]
+    return P, n_vertices
+
+
+def _areas_normals(P):
+    # the vector area of each polygon, 1/2 sum_k v_k x v_k+1
+    vector_area = 0.5 * np.cross(P, np.roll(P, -1, axis=1)).sum(axis=1)
+    A = np.linalg.norm(vector_area, axis=1)
+    return A, vector_area / A[:, np.newaxis]
+
+
+def _edges(P, n_vertices):
+    # the start and the direction of every edge, padded edges have zero length
+    start = P
+    end = np.roll(P, -1, axis=1)
+    for i, n in enumerate(n_vertices):
+        end[i, n - 1] = P[i, 0]
+    return start, end - start
+
+
+def _H(x, d):
+    # the second antiderivative in x of ln(sqrt(x^2 + d^2)), zero at x = d = 0
+    r2 = x**2 + d**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_term = np.where(r2 > 0, 0.5 * (x**2 - d**2) * np.log(r2), 0.)
+    return 0.5 * (log_term - 1.5 * x**2 + 2 * d * x * np.arctan2(x, d))
+
+
+def _edge_integrals(p0, a, q0, b, n_gauss=10):
+    """
+    (a . b) int_0^1 int_0^1 ln|p0 + s a - q0 - t b| ds dt for arrays of edge pairs of
+    shape (K, 3).
+    """
+    dot = np.einsum('ki,ki->k', a, b)
+    La = np.linalg.norm(a, axis=1)
+    Lb = np.linalg.norm(b, axis=1)
+    active = np.abs(dot) > 1e-14 * La * Lb
+    parallel = active & (np.linalg.norm(np.cross(a, b), axis=1) <= 1e-10 * La * Lb)
+    skew = active & ~parallel
+
+    out = np.zeros(len(dot))
+
+    if parallel.any():
+        u = a[parallel] / La[parallel, np.newaxis]
+        w = p0[parallel] - q0[parallel]
+        c = np.einsum('ki,ki->k', w, u)
+        d = np.linalg.norm(w - c[:, np.newaxis] * u, axis=1)
+        alpha = La[parallel]
+        beta = -np.einsum('ki,ki->k', b[parallel], u)
+        I = (_H(c + alpha + beta, d) - _H(c + alpha, d) - _H(c + beta, d) + _H(c, d)) / (alpha * beta)
+        out[parallel] = dot[parallel] * I
+
+    if skew.any():
+        x, wx = np.polynomial.legendre.leggauss(n_gauss)
+        s = (x + 1) / 2
+        ws = wx / 2
+        r = (p0[skew, np.newaxis, np.newaxis, :] + s[:, np.newaxis, np.newaxis] * a[skew, np.newaxis, np.newaxis, :]
+             - q0[skew, np.newaxis, np.newaxis, :] - s[np.newaxis, :, np.newaxis] * b[skew, np.newaxis, np.newaxis, :])
+        with np.errstate(divide='ignore'):
+            log_r = np.log(np.linalg.norm(r, axis=-1))
+        # a node landing exactly on a shared vertex does not contribute to the integral
+        log_r[np.isinf(log_r)] = 0.
+        I = np.einsum('kst,s,t->k', log_r, ws, ws)
+        out[skew] = dot[skew] * I
+
+    return out
+
+
+def _polygon_pair(Pi, Pj, n_gauss):
+    # A_i F_ij of two polygons given as (m, 3) arrays of their vertices in order
+    ai = np.roll(Pi, -1, axis=0) - Pi
+    bj = np.roll(Pj, -1, axis=0) - Pj
+    mi, mj = len(Pi), len(Pj)
+    p0 = np.repeat(Pi, mj, axis=0)
+    a = np.repeat(ai, mj, axis=0)
+    q0 = np.tile(Pj, (mi, 1))
+    b = np.tile(bj, (mi, 1))
+    return _edge_integrals(p0, a, q0, b, n_gauss).sum() / (2 * pi)
+
+
+def _clip(P, point, normal, tol):
+    # the part of polygon P in front of the plane through point with normal
+    # (Sutherland-Hodgman against a single plane)
+    dist = (P - point) @ normal
+    clipped = []
+    for k in range(len(P)):
+        cur, nxt = P[k], P[(k + 1) % len(P)]
+        d_cur, d_nxt = dist[k], dist[(k + 1) % len(P)]
+        if d_cur >= -tol:
+            clipped.append(cur)
+        if (d_cur > tol and d_nxt < -tol) or (d_cur < -tol and d_nxt > tol):
+            clipped.append(cur + (nxt - cur) * d_cur / (d_cur - d_nxt))
+    return np.array(clipped).reshape(-1, 3)
+
+
+_shared = {}
+
+
+def _init_worker(start, edge, P, n_vertices, A, normals, n_gauss):
+    _shared.update(start=start, edge=edge, P=P, n_vertices=n_vertices, A=A, normals=normals, n_gauss=n_gauss)
+
+
+def _pairs(start, stop, N):
+    """
+    The surface pairs i < j with the row-major index start to stop (exclusive) among the
+    N (N - 1) / 2 pairs, so that a chunk of pairs is built from its bounds alone.
+    """
+    k = np.arange(start, stop, dtype=np.int64)
+    rows = np.arange(N, dtype=np.int64)
+    # the index of the first pair of each row i, (i, i + 1)
+    row_start = rows * N - rows * (rows + 1) // 2
+    i = np.searchsorted(row_start, k, side='right') - 1
+    return i, k - row_start[i] + i + 1
+
+
+def _chunk(bounds):
+    """
+    A_i F_ij for the surface pairs of _pairs(*bounds), using the arrays of _init_worker.
+    """
+    return _pair_chunk(np.stack(_pairs(*bounds, len(_shared['P'])), axis=1))
+
+
+def _pair_chunk(pairs):
+    """
+    A_i F_ij for an array of surface pairs (n_pairs, 2), using the arrays of _init_worker.
+    """
+    start, edge, P = _shared['start'], _shared['edge'], _shared['P']
+    n_vertices, normals, n_gauss = _shared['n_vertices'], _shared['normals'], _shared['n_gauss']
+    i, j = pairs[:, 0], pairs[:, 1]
+    tol = 1e-9 * np.sqrt(_shared['A'].max())
+
+    # signed distances of the vertices of each surface from the plane of the other
+    mask_i = np.arange(P.shape[1]) < n_vertices[i, np.newaxis]
+    mask_j = np.arange(P.shape[1]) < n_vertices[j, np.newaxis]
+    d_j = np.einsum('pmk,pk->pm', P[j] - P[i, :1], normals[i])
+    d_i = np.einsum('pmk,pk->pm', P[i] - P[j, :1], normals[j])
+    front_j = np.where(mask_j, d_j >= -tol, True).all(axis=1)
+    front_i = np.where(mask_i, d_i >= -tol, True).all(axis=1)
+    behind_j = np.where(mask_j, d_j <= tol, True).all(axis=1)
+    behind_i = np.where(mask_i, d_i <= tol, True).all(axis=1)
+
+    AF = np.zeros(len(i))
+    full = front_i & front_j & ~behind_i & ~behind_j
+    straddle = ~behind_i & ~behind_j & ~full
+
+    if full.any():
+        m = P.shape[1]
+        fi, fj = i[full], j[full]
+        p0 = np.repeat(start[fi], m, axis=1).reshape(-1, 3)
+        a = np.repeat(edge[fi], m, axis=1).reshape(-1, 3)
+        q0 = np.tile(start[fj], (1, m, 1)).reshape(-1, 3)
+        b = np.tile(edge[fj], (1, m, 1)).reshape(-1, 3)
+        AF[full] = _edge_integrals(p0, a, q0, b, n_gauss).reshape(-1, m * m).sum(axis=1) / (2 * pi)
+
+    # surfaces partly behind each other are clipped to the visible parts one pair at a time
+    for k in np.flatnonzero(straddle):
+        Pi = P[i[k], :n_vertices[i[k]]]
+        Pj = P[j[k], :n_vertices[j[k]]]
+        Pi, Pj = _clip(Pi, Pj[0], normals[j[k]], tol), _clip(Pj, Pi[0], normals[i[k]], tol)
+        if len(Pi) >= 3 and len(Pj) >= 3:
+            AF[k] = _polygon_pair(Pi, Pj, n_gauss)
+
+    return AF
+
+
+@instrument.timed('viewfactors.unobstructed_view_factors')
+def unobstructed_view_factors(vertices, shapes, n_gauss=10, n_workers=1, chunk_size=4096):
+    """
+    The view factor matrix of the surfaces of a VS3 geometry, ignoring obstructions.
+    Only the pairs i < j are computed and A_i F_ij is mirrored, so reciprocity holds
+    exactly. Surfaces are numbered in increasing shape number.
+
+    Parameters
+    ----------
+    vertices: dict
+        The vertex number: (x, y, z) dictionary of viewgr.read_vs3_file
+    shapes: dict
+        The shape number: (v1, v2, ..., v1) dictionary of viewgr.read_vs3_file
+    n_gauss: int
+        The number of Gauss-Legendre points per edge for non-parallel edges
+    n_workers: int
+        The number of worker processes, 1 computes in this process
+    chunk_size: int
+        The number of surface pairs per vectorized batch
+
+    Returns
+    -------
+    The areas (column vector) and the view factor matrix
+    """
+    P, n_vertices = polygons(vertices, shapes)
+    return _view_factors(P, n_vertices, n_gauss, n_workers, chunk_size)
+
+
+def _view_factors(P, n_vertices, n_gauss, n_workers, chunk_size):
+    # unobstructed_view_factors of the padded polygons P, shape (N, m, 3)
+    A, normals = _areas_normals(P)
+    start, edge = _edges(P, n_vertices)
+    args = (start, edge, P, n_vertices, A, normals, n_gauss)
+
+    N = len(A)
+    n_pairs = N * (N - 1) // 2
+
+    def chunks():
+        # only the bounds of the chunks are sent, the pairs are built where they are used
+        return ((k, min(k + chunk_size, n_pairs)) for k in range(0, n_pairs, chunk_size))
+
+    AF = np.zeros((N, N))
+    if n_workers == 1:
+        _init_worker(*args)
+        results = map(_chunk, chunks())
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=args)
+        results = pool.map(_chunk, chunks())
+    try:
+        for bounds, AF_chunk in zip(chunks(), results):
+            i, j = _pairs(*bounds, N)
+            AF[i, j] = AF_chunk
+    finally:
+        if n_workers != 1:
+            pool.shutdown()
+
+    if instrument.enabled:
+        instrument.count('viewfactors.surface_pairs', n_pairs)
+
+    AF += AF.T
+
+    return A[:, np.newaxis], AF / A[:, np.newaxis]
+
+
+def read_vs3_view_factors(path_to_vs3, delimiter='\t', n_gauss=10, n_workers=1):
+    """
+    The (A, Fij, eps) triple of view3d.read_output computed directly from a .vs3 file,
+    without obstructions.
+
+    Parameters
+    ----------
+    path_to_vs3: str
+        The path to the .vs3 file
+    delimiter: str
+        The delimiter between the values of a line
+    n_gauss: int
+        The number of Gauss-Legendre points per edge for non-parallel edges
+    n_workers: int
+        The number of worker processes
+
+    Returns
+    -------
+    The areas (column vector), the view factor matrix and the emissivities (column vector)
+    """
+    from .viewgr import VS3Geometry
+
+    geometry = VS3Geometry.from_file(path_to_vs3, delimiter=None if not delimiter.strip() else delimiter)
+    # the surfaces in increasing shape number, as in unobstructed_view_factors
+    order = np.argsort(geometry.surface_numbers)
+    n_vertices = (geometry.connectivity[order] >= 0).sum(axis=1)
+    A, Fij = _view_factors(geometry.polygons()[order], n_vertices, n_gauss, n_workers, chunk_size=4096)
+    eps = geometry.emissivity[order][:, np.newaxis]
+
+    return A, Fij, eps
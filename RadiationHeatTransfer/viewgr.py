@@ -13,54 +13,260 @@ Gaithersburg, MD, 2002.
 https://github.com/jasondegraw/View3D
 """
 
-import matplotlib.pyplot as plt
-from mpl_toolkits import mplot3d
-import plotly.graph_objects as go
+import io
+from functools import cached_property
 
+import numpy as np
 
-def read_vs3_file(path_to_vs3, delimiter='\t'):
+from . import instrument
+
+# matplotlib and plotly are imported by the plotting functions, so that reading
+# geometry does not require them
+
+
+class VS3Geometry:
+    """
+    The contents of a VS3 file as arrays. Surfaces have 3 or 4 vertices; a triangle has
+    a 0 in the v4 column of the file and -1 in connectivity.
+
+    Attributes
+    ----------
+    title: str
+        The title of the T line
+    control: dict
+        The name=value parameters of the C line
+    format: int
+        The value of the F line
+    vertex_numbers: np.ndarray
+        The number of each vertex, shape (nv,)
+    vertices: np.ndarray
+        The coordinates of each vertex, shape (nv, 3)
+    surface_numbers: np.ndarray
+        The number of each surface, shape (ns,)
+    connectivity: np.ndarray
+        The rows of vertices of each surface, shape (ns, 4)
+    base, cmb: np.ndarray
+        The base and cmb columns of each surface, shape (ns,)
+    emissivity: np.ndarray
+        The emissivity of each surface, shape (ns,)
+    names: np.ndarray
+        The name of each surface, shape (ns,)
+    """
+    def __init__(self, vertex_numbers, vertices, surface_numbers, connectivity, base=None, cmb=None,
+                 emissivity=None, names=None, title='', control=None, format=0):
+        self.vertex_numbers = np.asarray(vertex_numbers, dtype=np.int64)
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.surface_numbers = np.asarray(surface_numbers, dtype=np.int64)
+        self.connectivity = np.asarray(connectivity, dtype=np.int64).reshape(-1, 4)
+        ns = len(self.surface_numbers)
+        self.base = np.zeros(ns, dtype=np.int64) if base is None else np.asarray(base, dtype=np.int64)
+        self.cmb = np.zeros(ns, dtype=np.int64) if cmb is None else np.asarray(cmb, dtype=np.int64)
+        self.emissivity = np.ones(ns) if emissivity is None else np.asarray(emissivity, dtype=np.float64)
+        self.names = np.array([''] * ns) if names is None else np.asarray(names, dtype=str)
+        self.title = title
+        self.control = {} if control is None else control
+        self.format = format
+
+    @classmethod
+    def from_file(cls, path_to_vs3, delimiter=None):
+        """
+        Parse a VS3 file. The lines are sorted by their record type on the bytes of the
+        file, then the V lines and the S lines, names included, are each parsed in one
+        np.loadtxt pass.
+
+        Parameters
+        ----------
+        path_to_vs3: str
+            The path to the .vs3 file
+        delimiter: str
+            The delimiter between the values of a line, None (default) splits on any
+            run of spaces and tabs
 
-    file = open(path_to_vs3, 'r+')
-    data = file.readlines()
-    file.close()
+        Returns
+        -------
+        A VS3Geometry
+        """
+        with open(path_to_vs3, 'rb') as file:
+            raw = file.read()
+        view = memoryview(raw)
+        buf = np.frombuffer(raw, dtype=np.uint8)
+        ends = np.flatnonzero(buf == ord('\n')) + 1
+        if len(ends) == 0 or ends[-1] != len(buf):
+            ends = np.append(ends, len(buf))
+        starts = np.concatenate(([0], ends[:-1]))
+        kinds = buf[starts[starts < len(buf)]]
 
-    vertices = {}
-    shapes = {}
+        def lines(kind):
+            # the bytes of all the lines of a record type and their line numbers
+            rows = np.flatnonzero(kinds == ord(kind))
+            runs = np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1) if len(rows) else []
+            return b''.join(view[starts[run[0]]:ends[run[-1]]] for run in runs), rows + 1
 
-    def process_line(chars):
-        current_line_data = []
-        for i in range(len(chars)):
+        title = ''
+        control = {}
+        fmt = 0
+        for kind in 'TCF':
+            text, _ = lines(kind)
+            for line in text.decode().splitlines():
+                if kind == 'T':
+                    title = line[1:].strip()
+                elif kind == 'C':
+                    for field in line[1:].split():
+                        name, _, value = field.partition('=')
+                        control[name] = int(value) if value.lstrip('-').isdigit() else value
+                else:
+                    fmt = int(line[1:].split()[0])
+
+        v_text, _ = lines('V')
+        s_text, s_line_numbers = lines('S')
+        longest = int((ends - starts)[s_line_numbers - 1].max(initial=0))
+        # only the V and S lines are kept while parsing
+        del raw, view, buf, lines, starts, ends, kinds
+
+        V = np.loadtxt(io.BytesIO(v_text), usecols=(1, 2, 3, 4), delimiter=delimiter, ndmin=2, encoding='utf-8')
+        del v_text
+        # the name column is optional
+        named = len(s_text[:s_text.find(b'\n')].decode().split(delimiter)) > 9
+        columns = [('number', np.int64), ('vertices', np.int64, (4,)), ('base', np.int64), ('cmb', np.int64),
+                   ('emissivity', np.float64)]
+        if named:
+            columns.append(('name', 'S{}'.format(longest)))
+        S = np.loadtxt(io.BytesIO(s_text), dtype=columns, usecols=range(1, 10 if named else 9),
+                       delimiter=delimiter, ndmin=1, encoding='utf-8')
+        del s_text
+        if named:
+            names = S['name']
+            names = names.astype('S{}'.format(np.char.str_len(names).max(initial=1)))
             try:
-                value = float(chars[i].replace('\n', ''))
-                current_line_data.append(value)
-            except:
-                pass
-        return current_line_data
-
-    for line in data:
-        characters = line.split(delimiter)
-        # collect all of the vertices
-        if characters[0] == 'V':
-            current_line_data = process_line(characters)
-            vertice_number = current_line_data[0]
-            x = current_line_data[1]
-            y = current_line_data[2]
-            z = current_line_data[3]
-            vertices[int(vertice_number)] = (x, y, z)
-        # collect the shapes
-        if characters[0] == 'S':
-            current_line_data = process_line(characters)
-            shape_number = current_line_data[0]
-            v1 = current_line_data[1]
-            v2 = current_line_data[2]
-            v3 = current_line_data[3]
-            v4 = current_line_data[4]
-            shapes[int(shape_number)] = (int(v1), int(v2), int(v3), int(v4), int(v1))
-
-    return vertices, shapes
+                names = names.astype(str)
+            except UnicodeDecodeError:
+                # loadtxt stores the bytes of the names as latin-1
+                names = np.char.decode(names, 'latin-1')
+        else:
+            names = None
+
+        vertex_numbers = V[:, 0].astype(np.int64)
+        ids = np.ascontiguousarray(S['vertices'])
+        number, base, cmb, emissivity = (np.ascontiguousarray(S[name])
+                                         for name in ('number', 'base', 'cmb', 'emissivity'))
+        del S
+        # vertex numbers to rows of vertices, 0 (no 4th vertex) maps to -1
+        lookup = np.full(max(vertex_numbers.max(initial=0), ids.max(initial=0)) + 1, -1)
+        lookup[vertex_numbers] = np.arange(len(vertex_numbers))
+        connectivity = lookup[np.maximum(ids, 0)]
+        unknown = (connectivity < 0) | (ids < 0)
+        unknown[:, 3] &= ids[:, 3] != 0
+        if unknown.any():
+            k, c = np.argwhere(unknown)[0]
+            raise ValueError('{}: line {}: surface {} refers to the unknown vertex {}'.format(
+                path_to_vs3, s_line_numbers[k], number[k], ids[k, c]))
+
+        return cls(vertex_numbers, V[:, 1:], number, connectivity, base=base, cmb=cmb, emissivity=emissivity,
+                   names=names, title=title, control=control, format=fmt)
+
+    @classmethod
+    def from_dicts(cls, vertices, shapes):
+        """
+        A VS3Geometry from the vertices and shapes dictionaries of read_vs3_file.
+        """
+        vertex_numbers = np.array(sorted(vertices), dtype=np.int64)
+        rows = {v: k for k, v in enumerate(vertex_numbers)}
+        surface_numbers = np.array(sorted(shapes), dtype=np.int64)
+        connectivity = np.full((len(surface_numbers), 4), -1, dtype=np.int64)
+        for k, number in enumerate(surface_numbers):
+            loop = list(shapes[number])
+            if len(loop) > 1 and loop[0] == loop[-1]:
+                loop = loop[:-1]
+            connectivity[k, :len(loop)] = [rows[v] for v in loop]
+        return cls(vertex_numbers, [vertices[v] for v in vertex_numbers], surface_numbers, connectivity)
+
+    @property
+    def n_vertices(self):
+        """
+        The number of vertices of each surface, 3 or 4.
+        """
+        return (self.connectivity >= 0).sum(axis=1)
+
+    def polygons(self):
+        """
+        The vertex coordinates of each surface, shape (ns, 4, 3). Triangles repeat their
+        first vertex, which adds a zero length edge.
+        """
+        conn = np.where(self.connectivity >= 0, self.connectivity, self.connectivity[:, :1])
+        return self.vertices[conn]
+
+    @cached_property
+    def _vector_areas(self):
+        P = self.polygons()
+        return 0.5 * np.cross(P, np.roll(P, -1, axis=1)).sum(axis=1)
+
+    @cached_property
+    def areas(self):
+        """
+        The area of each surface, shape (ns,).
+        """
+        return np.linalg.norm(self._vector_areas, axis=1)
+
+    @cached_property
+    def normals(self):
+        """
+        The unit normal of each surface by the right hand rule, shape (ns, 3).
+        """
+        return self._vector_areas / self.areas[:, np.newaxis]
+
+    @cached_property
+    def centroids(self):
+        """
+        The centroid of each surface, shape (ns, 3).
+        """
+        P = self.polygons()
+        # the fan triangles (v1, v2, v3) and (v1, v3, v4), the second is empty for a triangle
+        centroid = np.zeros((len(P), 3))
+        total = np.zeros(len(P))
+        for k in (1, 2):
+            t = (P[:, 0] + P[:, k] + P[:, k + 1]) / 3
+            a = 0.5 * np.linalg.norm(np.cross(P[:, k] - P[:, 0], P[:, k + 1] - P[:, 0]), axis=1)
+            centroid += a[:, np.newaxis] * t
+            total += a
+        return centroid / total[:, np.newaxis]
+
+    def to_dicts(self):
+        """
+        The vertices and shapes dictionaries of read_vs3_file.
+        """
+        vertices = {int(v): tuple(float(x) for x in xyz) for v, xyz in zip(self.vertex_numbers, self.vertices)}
+        shapes = {}
+        for number, conn in zip(self.surface_numbers, self.connectivity):
+            loop = tuple(int(self.vertex_numbers[c]) for c in conn if c >= 0)
+            shapes[int(number)] = loop + loop[:1]
+        return vertices, shapes
+
+
+@instrument.timed('viewgr.read_vs3_file')
+def read_vs3_file(path_to_vs3, delimiter='\t'):
+    """
+    Read the vertices and shapes of a VS3 file.
+
+    Parameters
+    ----------
+    path_to_vs3: str
+        The path to the .vs3 file
+    delimiter: str
+        The delimiter between the values of a line. Any whitespace delimiter splits on
+        runs of spaces and tabs.
+
+    Returns
+    -------
+    The vertex number: (x, y, z) and the shape number: (v1, v2, ..., v1) dictionaries
+    """
+    geometry = VS3Geometry.from_file(path_to_vs3, delimiter=None if not delimiter.strip() else delimiter)
+    return geometry.to_dicts()
 
 
 def plot_vs3_shape(vertices, shapes):
+    import matplotlib.pyplot as plt
+    from mpl_toolkits import mplot3d
+
     fig = plt.figure()
 
     # syntax for 3-D projection
@@ -89,6 +295,7 @@ def plot_vs3_shape(vertices, shapes):
 
 
 def i_plot_vs3_shape(vertices, shapes):
+    import plotly.graph_objects as go
 
     surfaces = []
     for shape in shapes:
@@ -109,3 +316,135 @@ def i_plot_vs3_shape(vertices, shapes):
     fig = go.Figure(data=surfaces)
 
     return fig
+
+
+def _label_rows(n, max_labels):
+    # every k-th row so that at most max_labels are labeled
+    return np.arange(0, n, max(1, int(np.ceil(n / max_labels)))) if max_labels else np.arange(0)
+
+
+def plot_vs3_geometry(geometry, values=None, faces=None, labels=False, max_labels=100, cmap='viridis', ax=None):
+    """
+    Plot a geometry as a single collection, so that large models draw quickly. The
+    surfaces are drawn as outlines (a Line3DCollection) or as filled faces (a
+    Poly3DCollection), which can be colored by a per-surface result.
+
+    Parameters
+    ----------
+    geometry: VS3Geometry
+        The geometry to plot
+    values: np.ndarray
+        A result for every surface to color the faces by, e.g. heat flux or temperature
+    faces: bool
+        Draw filled faces instead of outlines, defaults to True when values are given
+    labels: bool
+        Label the vertex numbers
+    max_labels: int
+        The largest number of labels, every k-th vertex is labeled beyond that
+    cmap: str
+        The matplotlib colormap of the values
+    ax:
+        The 3D axes to draw on, a new figure is created by default
+
+    Returns
+    -------
+    The figure and the axes
+    """
+    import matplotlib.pyplot as plt
+    from mpl_toolkits import mplot3d
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
+
+    if ax is None:
+        fig = plt.figure()
+        ax = plt.axes(projection='3d')
+    else:
+        fig = ax.figure
+
+    # the outline of every surface, triangles repeat a vertex
+    P = geometry.polygons()
+    faces = values is not None if faces is None else faces
+    if faces:
+        collection = Poly3DCollection(P, edgecolor='k', linewidths=0.2)
+        if values is not None:
+            collection.set_array(np.asarray(values, dtype=np.float64).reshape(-1))
+            collection.set_cmap(cmap)
+            fig.colorbar(collection, ax=ax)
+        ax.add_collection3d(collection)
+    else:
+        edges = np.stack((P, np.roll(P, -1, axis=1)), axis=2).reshape(-1, 2, 3)
+        ax.add_collection3d(Line3DCollection(edges, linewidths=0.5))
+
+    if labels:
+        for k in _label_rows(len(geometry.vertices), max_labels):
+            x, y, z = geometry.vertices[k]
+            ax.text(x, y, z, str(geometry.vertex_numbers[k]))
+
+    # collections do not update the data limits of 3D axes
+    lo = geometry.vertices.min(axis=0)
+    hi = geometry.vertices.max(axis=0)
+    for set_lim, l, h in zip((ax.set_xlim, ax.set_ylim, ax.set_zlim), lo, hi):
+        if h > l:
+            set_lim(l, h)
+
+    ax.set_xlabel('x')
+    ax.set_ylabel('y')
+    ax.set_zlabel('z')
+
+    return fig, ax
+
+
+def i_plot_vs3_geometry(geometry, values=None, edges=True, labels=False, max_labels=100, colorscale='Viridis'):
+    """
+    Plot a geometry interactively as one plotly Mesh3d trace, with the surface outlines
+    as one more Scatter3d trace.
+
+    Parameters
+    ----------
+    geometry: VS3Geometry
+        The geometry to plot
+    values: np.ndarray
+        A result for every surface to color the faces by, e.g. heat flux or temperature
+    edges: bool
+        Draw the outlines of the surfaces
+    labels: bool
+        Label the vertex numbers
+    max_labels: int
+        The largest number of labels, every k-th vertex is labeled beyond that
+    colorscale: str
+        The plotly colorscale of the values
+
+    Returns
+    -------
+    The plotly figure
+    """
+    import plotly.graph_objects as go
+
+    conn = geometry.connectivity
+    quad = conn[:, 3] >= 0
+    # the quadrilaterals are split into the triangles (v1, v2, v3) and (v1, v3, v4)
+    triangles = np.concatenate((conn[:, :3], conn[quad][:, [0, 2, 3]]))
+    surface = np.concatenate((np.arange(len(conn)), np.flatnonzero(quad)))
+
+    x, y, z = geometry.vertices.T
+    mesh = dict(x=x, y=y, z=z, i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2],
+                hovertext=geometry.names[surface] if geometry.names.any() else None, flatshading=True)
+    if values is not None:
+        mesh.update(intensity=np.asarray(values, dtype=np.float64).reshape(-1)[surface], intensitymode='cell',
+                    colorscale=colorscale)
+    else:
+        mesh.update(color='lightgrey', opacity=0.5)
+    data = [go.Mesh3d(**mesh)]
+
+    if edges:
+        P = geometry.polygons()
+        # each outline is closed and separated from the next by a gap
+        loops = np.concatenate((P, P[:, :1], np.full((len(P), 1, 3), np.nan)), axis=1).reshape(-1, 3)
+        data.append(go.Scatter3d(x=loops[:, 0], y=loops[:, 1], z=loops[:, 2], mode='lines',
+                                 line=dict(color='black', width=1), hoverinfo='skip'))
+
+    if labels:
+        rows = _label_rows(len(geometry.vertices), max_labels)
+        data.append(go.Scatter3d(x=x[rows], y=y[rows], z=z[rows], mode='text',
+                                 text=[str(v) for v in geometry.vertex_numbers[rows]]))
+
+    return go.Figure(data=data)
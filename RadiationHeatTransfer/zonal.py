@@ -0,0 +1,431 @@
+"""
+Zonal Method:
+The steady state energy balance of the surfaces and the air of an enclosure. Every
+surface exchanges radiation with the other surfaces through the exchange matrix SS
+(T SS = S, see enclosures.T_matrix and enclosures.S_matrix), convection with the air,
+conduction to the back side and may have a heat input. The radiation term is
+linearized as UA_ij = SS_ij sigma (Ti^2 + Tj^2)(Ti + Tj), so that
+UA_ij (Tj - Ti) = SS_ij sigma (Tj^4 - Ti^4).
+"""
+
+import numpy as np
+
+from . import instrument
+
+
+def _column(x, s: int):
+    # a scalar or a vector of length s as a 1D array of length s
+    return np.broadcast_to(np.asarray(x, dtype=np.float64).reshape(-1), (s,)).copy()
+
+
+@instrument.timed('zonal.conductance_matrix')
+def conductance_matrix(SS: np.ndarray, Ts: np.ndarray, A: np.ndarray, h=10., U=.15, TOS: float = 300.,
+                       qf_in=0., sigma: float = 5.67e-08):
+    """
+    Assemble the linear system of the zonal method for the current surface temperatures.
+    The unknowns are the N surface temperatures and the air temperature.
+
+    Parameters
+    ----------
+    SS: np.ndarray
+        The radiative exchange matrix, shape (N, N)
+    Ts: np.ndarray
+        The surface temperatures the radiation is linearized about (K), shape (N, 1)
+    A: np.ndarray
+        The area of each surface (column vector)
+    h: float or np.ndarray
+        The internal convection coefficient of each surface (W/m^2.K)
+    U: float or np.ndarray
+        The U-value of each surface to the back side (W/m^2.K)
+    TOS: float
+        The back side temperature (K)
+    qf_in: float or np.ndarray
+        The heat input of each surface (W/m^2), e.g. by embedded electric resistance
+        heating cable
+    sigma: float
+        The Stefan-Boltzmann constant (W/m^2.K^4)
+
+    Returns
+    -------
+    The conductance matrix UCA, shape (N + 1, N + 1), and the right hand side RHS,
+    shape (N + 1, 1), of UCA T = RHS
+    """
+    s = SS.shape[0]
+    Ts = np.asarray(Ts, dtype=np.float64).reshape(-1)
+    hA = _column(h, s) * _column(A, s)
+    UA_back = _column(U, s) * _column(A, s)
+
+    Ti = Ts[:, np.newaxis]
+    Tj = Ts[np.newaxis, :]
+    UA = SS * sigma * (Ti**2 + Tj**2) * (Ti + Tj)
+
+    UCA = np.zeros((s + 1, s + 1))
+    UCA[:s, :s] = UA
+    # Correct diagonal through N
+    UCA[np.arange(s), np.arange(s)] -= hA + UA_back + UA.sum(axis=0)
+    # the N+1th row and column couple the surfaces to the air
+    UCA[s, :s] = hA
+    UCA[:s, s] = hA
+    UCA[s, s] = -hA.sum()
+
+    RHS = np.zeros((s + 1, 1))
+    RHS[:s, 0] = -UA_back * TOS - _column(qf_in, s) * _column(A, s)
+
+    return UCA, RHS
+
+
+def _residual(P: np.ndarray, x: np.ndarray, c: np.ndarray, hA: np.ndarray, b: np.ndarray):
+    """
+    The residual UCA(Ts) x - RHS of the energy balance at x = [Ts, Ta], which is also
+    the net heat gain of every surface and of the air (W). P is sigma SS with a zero
+    diagonal, the diagonal terms cancel in the energy balance.
+    """
+    s = P.shape[0]
+    T = x[:s]
+    Ta = x[s]
+    Ti = T[:, np.newaxis]
+    Tj = T[np.newaxis, :]
+
+    G = (Ti**2 + Tj**2) * (Ti + Tj)
+    # D_ij = P_ij Tj - P_ji Ti, the row and column sums of UCA in one term
+    D = P * Tj - P.T * Ti
+
+    R = np.empty(s + 1)
+    R[:s] = (G * D).sum(axis=1) - c * T + hA * Ta - b
+    R[s] = hA @ T - hA.sum() * Ta
+    return R
+
+
+def _jacobian(P: np.ndarray, x: np.ndarray, c: np.ndarray, hA: np.ndarray):
+    """
+    The Jacobian of _residual with respect to x = [Ts, Ta].
+    """
+    s = P.shape[0]
+    T = x[:s]
+    Ti = T[:, np.newaxis]
+    Tj = T[np.newaxis, :]
+
+    G = (Ti**2 + Tj**2) * (Ti + Tj)
+    D = P * Tj - P.T * Ti
+    dG_dTi = 3 * Ti**2 + 2 * Ti * Tj + Tj**2
+    dG_dTj = Ti**2 + 2 * Ti * Tj + 3 * Tj**2
+
+    jac = np.zeros((s + 1, s + 1))
+    jac[:s, :s] = dG_dTj * D + G * P
+    jac[np.arange(s), np.arange(s)] = (dG_dTi * D - G * P.T).sum(axis=1) - c
+    jac[:s, s] = hA
+    jac[s, :s] = hA
+    jac[s, s] = -hA.sum()
+    return jac
+
+
+def _setup(SS: np.ndarray, A: np.ndarray, h, U, sigma: float):
+    # the arrays shared by the steady and transient solvers
+    s = SS.shape[0]
+    A = _column(A, s)
+    hA = _column(h, s) * A
+    UA_back = _column(U, s) * A
+    P = sigma * np.asarray(SS, dtype=np.float64)
+    P[np.arange(s), np.arange(s)] = 0.
+    return s, A, hA, UA_back, P
+
+
+@instrument.timed('zonal.solve')
+def solve(SS: np.ndarray, A: np.ndarray, h=10., U=.15, TOS: float = 300., qf_in=0., Ts=300.,
+          method: str = 'newton', tol: float = 1.0E-06, maxiter: int = 100, sigma: float = 5.67e-08):
+    """
+    Solve the zonal method for the steady state surface and air temperatures.
+
+    Parameters
+    ----------
+    SS: np.ndarray
+        The radiative exchange matrix, shape (N, N)
+    A: np.ndarray
+        The area of each surface (column vector)
+    h: float or np.ndarray
+        The internal convection coefficient of each surface (W/m^2.K)
+    U: float or np.ndarray
+        The U-value of each surface to the back side (W/m^2.K)
+    TOS: float or np.ndarray
+        The back side temperature (K), or that of each surface
+    qf_in: float or np.ndarray
+        The heat input of each surface (W/m^2)
+    Ts: float or np.ndarray
+        Initial guess of surface temperatures (K)
+    method: str
+        'newton' for Newton-Raphson on the energy balance with the analytic Jacobian, or
+        'picard' for the fixed point iteration that re-solves the linearized system
+    tol: float
+        Stop when the root mean square change of the surface temperatures is below tol (K)
+    maxiter: int
+        The maximum number of iterations
+    sigma: float
+        The Stefan-Boltzmann constant (W/m^2.K^4)
+
+    Returns
+    -------
+    The surface temperatures (column vector), the air temperature and a dict with the
+    number of iterations, the change and residual norm of every iteration and whether
+    tol was met. Without convection (h = 0) the air temperature is undetermined and
+    the mean of the initial Ts is returned.
+    """
+    s, A, hA, UA_back, P = _setup(SS, A, h, U, sigma)
+    c = hA + UA_back
+    # the right hand side of the surface rows, UCA x = RHS
+    b = -UA_back * TOS - _column(qf_in, s) * A
+
+    x = np.empty(s + 1)
+    x[:s] = _column(Ts, s)
+    x[s] = np.average(x[:s], weights=hA) if hA.sum() > 0 else x[:s].mean()
+    # without convection the air equation is 0 = 0, drop the air unknown
+    m = s + 1 if hA.sum() > 0 else s
+
+    if method not in ('newton', 'picard'):
+        raise ValueError('Unknown method: {}'.format(method))
+
+    changes = []
+    residuals = []
+    diff = np.inf
+    count = 0
+    while diff > tol and count < maxiter:
+        if method == 'newton':
+            R = _residual(P, x, c, hA, b)
+            x_next = x.copy()
+            x_next[:m] -= np.linalg.solve(_jacobian(P, x, c, hA)[:m, :m], R[:m])
+            residuals.append(float(np.linalg.norm(R)))
+        else:
+            UCA, RHS = conductance_matrix(SS, x[:s], A, h=h, U=U, TOS=TOS, qf_in=qf_in, sigma=sigma)
+            residuals.append(float(np.linalg.norm(UCA @ x - RHS[:, 0])))
+            x_next = x.copy()
+            x_next[:m] = np.linalg.solve(UCA[:m, :m], RHS[:m, 0])
+
+        diff = np.sqrt(np.mean((x_next[:s] - x[:s])**2))  # rmse
+        changes.append(float(diff))
+        x = x_next
+        count += 1
+        if instrument.enabled:
+            instrument.count('zonal.linear_solves')
+            instrument.event('zonal.iteration', method=method, iteration=count, change=changes[-1],
+                             residual=residuals[-1])
+
+    info = {'iterations': count, 'changes': changes, 'residuals': residuals, 'converged': diff <= tol}
+
+    return x[:s, np.newaxis], float(x[s]), info
+
+
+@instrument.timed('zonal.gradient')
+def gradient(SS: np.ndarray, A: np.ndarray, Ts: np.ndarray, Ta: float, dTs, dTa=0., h=10., U=.15,
+             TOS: float = 300., Fij: np.ndarray = None, eps: np.ndarray = None, sigma: float = 5.67e-08):
+    """
+    The gradient of an objective f(Ts, Ta) of the steady state temperatures of the zonal
+    method with respect to its inputs, by the adjoint method. At the solution of R(x, p) = 0,
+    one solve with the transposed Jacobian of the energy balance, J^T lambda = df/dx,
+    gives df/dp = -lambda^T dR/dp for every parameter p at once.
+
+    Parameters
+    ----------
+    SS: np.ndarray
+        The radiative exchange matrix, shape (N, N)
+    A: np.ndarray
+        The area of each surface (column vector)
+    Ts: np.ndarray
+        The converged surface temperatures returned by solve (K), shape (N, 1)
+    Ta: float
+        The converged air temperature returned by solve (K)
+    dTs: np.ndarray
+        The derivative df/dTs of the objective, shape (N, 1), or one column per
+        objective, shape (N, m). The identity gives the transposed Jacobian of Ts.
+    dTa: float or np.ndarray
+        The derivative df/dTa of the objective, one value per objective
+    h: float or np.ndarray
+        The internal convection coefficient of each surface (W/m^2.K)
+    U: float or np.ndarray
+        The U-value of each surface to the back side (W/m^2.K)
+    TOS: float
+        The back side temperature (K)
+    Fij: np.ndarray
+        View factor matrix, to also get the gradient with respect to the emissivities
+        SS was computed with
+    eps: np.ndarray
+        The emissivity of each surface (column vector), with Fij
+    sigma: float
+        The Stefan-Boltzmann constant (W/m^2.K^4)
+
+    Returns
+    -------
+    A dict of the gradients with respect to 'qf_in', 'h', 'U' and, with Fij and eps,
+    'eps', each of shape (N, m), and 'TOS', shape (m,). The emissivities enter through
+    SS = T^-1 S, so their gradient needs a solve with N right hand sides per objective,
+    as many as computing SS.
+    """
+    from .enclosures import T_matrix
+
+    s, A, hA, UA_back, P = _setup(SS, A, h, U, sigma)
+    c = hA + UA_back
+    x = np.append(np.asarray(Ts, dtype=np.float64).reshape(-1), Ta)
+    T = x[:s]
+
+    dTs = np.asarray(dTs, dtype=np.float64).reshape(s, -1)
+    rhs = np.vstack([dTs, np.broadcast_to(np.asarray(dTa, dtype=np.float64).reshape(-1), (dTs.shape[1],))])
+    lmbda = np.linalg.solve(_jacobian(P, x, c, hA).T, rhs)
+    if instrument.enabled:
+        instrument.count('zonal.linear_solves')
+    lmbda_s = lmbda[:s]
+    lmbda_air = lmbda[s]
+
+    # R_i = ... - (hA_i + UA_i) T_i + hA_i Ta + UA_i TOS + qf_in_i A_i, R_air = hA T - sum(hA) Ta
+    gradients = {'qf_in': -lmbda_s * A[:, np.newaxis],
+                 'h': -(A * (Ta - T))[:, np.newaxis] * (lmbda_s - lmbda_air),
+                 'U': -(A * (TOS - T))[:, np.newaxis] * lmbda_s,
+                 'TOS': -UA_back @ lmbda_s}
+
+    if Fij is not None and eps is not None:
+        Fij = np.asarray(Fij, dtype=np.float64)
+        eps = np.asarray(eps, dtype=np.float64).reshape(-1, 1)
+        A_col = A[:, np.newaxis]
+        SS = np.asarray(SS, dtype=np.float64)
+        T_lhs = T_matrix(Fij, eps, A_col)
+        Ti = T[:, np.newaxis]
+        Tj = T[np.newaxis, :]
+        G = (Ti**2 + Tj**2) * (Ti + Tj)
+        d_eps = np.empty_like(lmbda_s)
+        for k in range(lmbda_s.shape[1]):
+            # df/dSS_ij = -sigma G_ij Tj (lambda_i - lambda_j), the diagonal of SS cancels
+            dSS = -sigma * G * Tj * (lmbda_s[:, k, np.newaxis] - lmbda_s[np.newaxis, :, k])
+            dSS[np.arange(s), np.arange(s)] = 0.
+            # SS = T^-1 S: df/dS = T^-T df/dSS and df/dT = -df/dS SS^T
+            dS = np.linalg.solve(T_lhs.T, dSS)
+            dT = -dS @ SS.T
+            # T_ij = delta_ij / eps_i - (1 - eps_j) A_i Fij / (eps_j A_j), S_ij = A_i Fij eps_j
+            d_eps[:, k] = ((dT * Fij * A_col).sum(axis=0) / (A * eps[:, 0]**2) - dT.diagonal() / eps[:, 0]**2
+                           + (dS * Fij * A_col).sum(axis=0))
+        if instrument.enabled:
+            instrument.count('enclosures.linear_solves', lmbda_s.shape[1])
+        gradients['eps'] = d_eps
+
+    return gradients
+
+
+def transient(SS: np.ndarray, A: np.ndarray, C, dt: float, n_steps: int, h=10., U=.15, TOS: float = 300.,
+              qf_in=0., Ts=300., Ta: float = None, C_air: float = 0., method: str = 'semi-implicit',
+              refactor_tol: float = 10., output_every: int = 1, tol: float = 1.0E-06, maxiter: int = 20,
+              sigma: float = 5.67e-08):
+    """
+    March the surface and air temperatures of the zonal method forward in time,
+    C dx/dt = UCA(Ts) x - RHS. The exchange matrix SS is computed once by the caller and
+    reused for every step. The implicit schemes factorize C/dt - J, with J the Jacobian
+    of the energy balance, and reuse the factorization until a temperature has moved by
+    more than refactor_tol from where it was factorized. The results are yielded as a
+    generator instead of being stored.
+
+    Parameters
+    ----------
+    SS: np.ndarray
+        The radiative exchange matrix, shape (N, N)
+    A: np.ndarray
+        The area of each surface (column vector)
+    C: float or np.ndarray
+        The thermal capacitance of each surface (J/K)
+    dt: float
+        The time step (s)
+    n_steps: int
+        The number of time steps
+    h: float or np.ndarray
+        The internal convection coefficient of each surface (W/m^2.K)
+    U: float or np.ndarray
+        The U-value of each surface to the back side (W/m^2.K)
+    TOS: float
+        The back side temperature (K)
+    qf_in: float, np.ndarray or callable
+        The heat input of each surface (W/m^2), or a function of time t (s) returning it,
+        e.g. to switch the heaters off for a cool down
+    Ts: float or np.ndarray
+        The initial surface temperatures (K)
+    Ta: float
+        The initial air temperature (K), defaults to the convection weighted mean of Ts
+    C_air: float
+        The thermal capacitance of the air (J/K). With 0 the air is in quasi-steady state,
+        or, without convection (h = 0), decoupled from the surfaces and kept at Ta.
+    method: str
+        'explicit' for forward Euler, 'semi-implicit' for the linearly implicit Euler
+        step (C/dt - J) dx = R(x), or 'implicit' for backward Euler solved with chord
+        Newton iterations on the reused factorization
+    refactor_tol: float
+        The largest temperature change (K) since the last factorization before
+        refactorizing C/dt - J
+    output_every: int
+        Yield every output_every steps
+    tol: float
+        The convergence tolerance of the implicit Newton iterations (K)
+    maxiter: int
+        The maximum number of Newton iterations per implicit step
+    sigma: float
+        The Stefan-Boltzmann constant (W/m^2.K^4)
+
+    Returns
+    -------
+    A generator of (t, Ts, Ta) with the time (s), the surface temperatures (column
+    vector) and the air temperature
+    """
+    from scipy.linalg import lu_factor, lu_solve
+
+    if method not in ('explicit', 'semi-implicit', 'implicit'):
+        raise ValueError('Unknown method: {}'.format(method))
+
+    s, A, hA, UA_back, P = _setup(SS, A, h, U, sigma)
+    c = hA + UA_back
+
+    def rhs(t):
+        qf = qf_in(t) if callable(qf_in) else qf_in
+        return -UA_back * TOS - _column(qf, s) * A
+
+    x = np.empty(s + 1)
+    x[:s] = _column(Ts, s)
+    if Ta is not None:
+        x[s] = Ta
+    else:
+        x[s] = np.average(x[:s], weights=hA) if hA.sum() > 0 else x[:s].mean()
+
+    C_dt = np.append(_column(C, s), C_air) / dt
+    quasi_steady_air = C_air == 0 and hA.sum() > 0
+    # without convection and capacitance the air equation is 0 = 0, drop the air unknown
+    m = s if C_air == 0 and hA.sum() == 0 else s + 1
+
+    lu = None
+    x_ref = None
+
+    for n in range(1, n_steps + 1):
+        t = n * dt
+        if method == 'explicit':
+            b = rhs(t - dt)
+            R = _residual(P, x, c, hA, b)
+            x[:s] += R[:s] / C_dt[:s]
+            if quasi_steady_air:
+                x[s] = hA @ x[:s] / hA.sum()
+            elif m > s:
+                x[s] += R[s] / C_dt[s]
+        else:
+            if lu is None or np.abs(x - x_ref).max() > refactor_tol:
+                lu = lu_factor((np.diag(C_dt) - _jacobian(P, x, c, hA))[:m, :m])
+                x_ref = x.copy()
+                if instrument.enabled:
+                    instrument.count('zonal.factorizations')
+            b = rhs(t)
+            if method == 'semi-implicit':
+                x[:m] += lu_solve(lu, _residual(P, x, c, hA, b)[:m])
+                solves = 1
+            else:
+                x_old = x.copy()
+                for solves in range(1, maxiter + 1):
+                    G = C_dt * (x - x_old) - _residual(P, x, c, hA, b)
+                    step = lu_solve(lu, G[:m])
+                    x[:m] -= step
+                    if np.abs(step).max() <= tol:
+                        break
+            if instrument.enabled:
+                instrument.count('zonal.lu_solves', solves)
+        if instrument.enabled:
+            instrument.count('zonal.steps')
+
+        if n % output_every == 0:
+            yield t, x[:s, np.newaxis].copy(), float(x[s])
@@ -0,0 +1,77 @@
+# Benchmarks of the blackbody module
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+import RadiationHeatTransfer as rht
+
+
+class BlackbodyArrays:
+    params = [10, 1000, 100000]
+    param_names = ['n']
+
+    def setup(self, n):
+        rng = np.random.default_rng(0)
+        self.T = rng.uniform(300., 3000., n)
+        self.lmbda = rng.uniform(0.1, 100., n)
+
+    def time_Eb(self, n):
+        rht.blackbody.Eb(self.T)
+
+    def time_Eb_vectorized(self, n):
+        rht.blackbody.Eb_vectorized(self.T)
+
+    def time_f_lambda(self, n):
+        rht.blackbody.f_lambda(self.lmbda, self.T)
+
+    def time_f_lambda_fast(self, n):
+        rht.blackbody.f_lambda_fast(self.lmbda, self.T)
+
+    def time_Eblambda(self, n):
+        rht.blackbody.Eblambda(self.lmbda, self.T)
+
+
+class EblambdaGrid:
+    params = [[100, 10000], [10, 100]]
+    param_names = ['n_wavelengths', 'n_temperatures']
+
+    def setup(self, n_wavelengths, n_temperatures):
+        self.lmbda = np.geomspace(0.1, 1000., n_wavelengths)
+        self.T = np.linspace(300., 6000., n_temperatures)
+
+    def time_Eblambda_grid(self, n_wavelengths, n_temperatures):
+        rht.blackbody.Eblambda(self.lmbda, self.T, grid=True)
+
+    def time_Eblambda_grid_float32(self, n_wavelengths, n_temperatures):
+        rht.blackbody.Eblambda(self.lmbda, self.T, grid=True, dtype=np.float32)
+
+
+class EffectiveSpectral:
+    params = [0.1, 0.01]
+    param_names = ['step']
+
+    def setup(self, step):
+        lmbdas = np.array([0.0001, 0.25, 0.625, 1.2, 2.2, 2.25, 2.5, 1000.])
+        alphas = np.array([0.92, 0.92, 0.92, 0.39, 0.39, 0.47, 0.47, 0.47])
+        self.f = interp1d(lmbdas, alphas)
+
+    def time_effective_spectral(self, step):
+        rht.blackbody.effective_spectral(0.0001, 1000., 5800., self.f, step=step)
+
+    def time_effective_spectral_adaptive(self, step):
+        rht.blackbody.effective_spectral_adaptive(0.0001, 1000., 5800., self.f, rtol=step * 1e-4)
+
+
+class EffectiveSpectralBatch:
+    params = [[0.1, 0.01], [1, 100]]
+    param_names = ['step', 'n_curves']
+
+    def setup(self, step, n_curves):
+        lmbdas = np.array([0.0001, 0.25, 0.625, 1.2, 2.2, 2.25, 2.5, 1000.])
+        alphas = np.array([0.92, 0.92, 0.92, 0.39, 0.39, 0.47, 0.47, 0.47])
+        scale = np.linspace(0.5, 1., n_curves)[:, np.newaxis]
+        self.f_stacked = interp1d(lmbdas, scale * alphas)
+        self.T = np.linspace(300., 5800., 10)
+
+    def time_effective_spectral_batch(self, step, n_curves):
+        rht.blackbody.effective_spectral_batch([0.0001, 0.5], [1000., 3.], self.T, self.f_stacked, step=step)
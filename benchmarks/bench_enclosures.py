@@ -0,0 +1,66 @@
+# Benchmarks of the enclosures module
+
+import numpy as np
+
+import RadiationHeatTransfer as rht
+
+
+def random_enclosure(N, seed=0):
+    """
+    A view factor matrix with rows summing to one, areas and emissivities of N surfaces.
+    """
+    rng = np.random.default_rng(seed)
+    Fij = rng.random((N, N))
+    np.fill_diagonal(Fij, 0.)
+    Fij /= Fij.sum(axis=1, keepdims=True)
+    A = rng.uniform(0.1, 1., (N, 1))
+    eps = rng.uniform(0.1, 0.9, (N, 1))
+    T = rng.uniform(300., 1200., (N, 1))
+    return Fij, A, eps, T
+
+
+class EnclosureAssembly:
+    params = [4, 100, 1000, 10000]
+    param_names = ['N']
+
+    def setup(self, N):
+        self.Fij, self.A, self.eps, self.T = random_enclosure(N)
+        self.eb = rht.blackbody.Eb_vectorized(self.T)
+        self.SS = self.Fij * self.A
+
+    def time_F_matrix(self, N):
+        rht.enclosures.F_matrix(self.Fij, self.eps)
+
+    def time_T_matrix(self, N):
+        rht.enclosures.T_matrix(self.Fij, self.eps, self.A)
+
+    def time_S_matrix(self, N):
+        rht.enclosures.S_matrix(self.Fij, self.eps, self.A)
+
+    def time_heat_flow(self, N):
+        rht.enclosures.heat_flow(self.SS, self.eb)
+
+
+class EnclosureSolve:
+    params = [4, 100, 1000, 10000]
+    param_names = ['N']
+    timeout = 600
+
+    def setup(self, N):
+        self.Fij, self.A, self.eps, self.T = random_enclosure(N)
+        self.eb = rht.blackbody.Eb_vectorized(self.T)
+        self.F = rht.enclosures.F_matrix(self.Fij, self.eps)
+        self.enclosure = rht.enclosures.Enclosure(self.Fij, self.A, self.eps)
+        self.eb_many = self.eb * np.linspace(0.5, 1.5, 100)
+
+    def time_solve(self, N):
+        np.linalg.solve(self.F, self.eb)
+
+    def time_Enclosure_factorize(self, N):
+        rht.enclosures.Enclosure(self.Fij, self.A, self.eps)
+
+    def time_Enclosure_heat_flow_100_cases(self, N):
+        self.enclosure.heat_flow(self.eb_many)
+
+    def time_solve_radiosity_gmres(self, N):
+        rht.enclosures.solve_radiosity(self.Fij, self.eps, self.eb, method='gmres')
@@ -0,0 +1,76 @@
+# Benchmarks of reading View3D output and VS3 geometry files, on generated inputs
+
+import os
+import tempfile
+
+import numpy as np
+
+import RadiationHeatTransfer as rht
+
+
+def write_view3d_output(path, N, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as file:
+        file.write('View3D 4.0.0 0 1 0 {}\n'.format(N))
+        np.savetxt(file, rng.uniform(0.1, 1., (1, N)), fmt='%.6f')
+        np.savetxt(file, rng.random((N, N)), fmt='%.6f')
+        np.savetxt(file, np.full((1, N), 0.9), fmt='%.3f')
+
+
+def write_vs3(path, n):
+    """
+    An n x n grid of unit squares in the plane z = 0.
+    """
+    x, y = np.meshgrid(np.arange(n + 1), np.arange(n + 1))
+    with open(path, 'w') as file:
+        file.write('T grid\nC encl=0 list=0\nF 3\n')
+        for k, (xk, yk) in enumerate(zip(x.ravel(), y.ravel())):
+            file.write('V\t{}\t{}\t{}\t0.\n'.format(k + 1, xk, yk))
+        k = 0
+        for i in range(n):
+            for j in range(n):
+                a = i * (n + 1) + j + 1
+                k += 1
+                file.write('S\t{}\t{}\t{}\t{}\t{}\t0\t0\t0.9\ts{}\n'.format(k, a, a + 1, a + n + 2, a + n + 1, k))
+        file.write('End of data\n')
+
+
+class ReadView3DOutput:
+    params = [10, 1000, 3000]
+    param_names = ['N']
+    timeout = 600
+
+    def setup(self, N):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'output.txt')
+        write_view3d_output(self.path, N)
+
+    def teardown(self, N):
+        os.remove(self.path)
+        os.rmdir(self.dir)
+
+    def time_read_output(self, N):
+        rht.view3d.read_output(self.path)
+
+    def time_read_output_float32(self, N):
+        rht.view3d.read_output(self.path, dtype=np.float32)
+
+
+class ReadVS3:
+    params = [10, 100, 300]
+    param_names = ['n_grid']
+
+    def setup(self, n_grid):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'grid.vs3')
+        write_vs3(self.path, n_grid)
+
+    def teardown(self, n_grid):
+        os.remove(self.path)
+        os.rmdir(self.dir)
+
+    def time_read_vs3_file(self, n_grid):
+        rht.viewgr.read_vs3_file(self.path)
+
+    def time_VS3Geometry_from_file(self, n_grid):
+        rht.viewgr.VS3Geometry.from_file(self.path)
@@ -0,0 +1,39 @@
+# Benchmarks of the zonal method, the iteration of examples/zonal_method_example_2.py
+
+import numpy as np
+
+import RadiationHeatTransfer as rht
+
+from .bench_enclosures import random_enclosure
+
+
+class ZonalSolve:
+    params = [[6, 100, 1000], ['picard', 'newton']]
+    param_names = ['N', 'method']
+    timeout = 600
+
+    def setup(self, N, method):
+        Fij, A, eps, _ = random_enclosure(N)
+        self.A = A
+        self.SS = rht.enclosures.Enclosure(Fij, A, eps).SS
+        self.qf_in = np.zeros((N, 1))
+        self.qf_in[0] = 200.
+
+    def time_solve(self, N, method):
+        rht.zonal.solve(self.SS, self.A, qf_in=self.qf_in, method=method)
+
+
+class ConductanceMatrix:
+    params = [6, 100, 1000]
+    param_names = ['N']
+
+    def setup(self, N):
+        Fij, A, eps, _ = random_enclosure(N)
+        self.A = A
+        self.SS = rht.enclosures.Enclosure(Fij, A, eps).SS
+        self.Ts = np.full(N, 300.)
+        self.qf_in = np.zeros((N, 1))
+        self.qf_in[0] = 200.
+
+    def time_conductance_matrix(self, N):
+        rht.zonal.conductance_matrix(self.SS, self.Ts, self.A, qf_in=self.qf_in)
@@ -0,0 +1,197 @@
+# Run the benchmark suite offline and write the timings to a JSON file
+#
+# The benchmark classes follow the airspeed velocity (asv) layout: `params` and
+# `param_names` attributes, `setup`/`teardown` methods taking the parameters, and
+# `time_*` methods being timed. This script does not need asv.
+#
+#   python benchmarks/run.py                         # all benchmarks -> benchmarks/results.json
+#   python benchmarks/run.py -b Enclosure --max-size 1000 -o before.json
+#   python benchmarks/run.py --compare before.json after.json
+
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def discover(pattern=None):
+    """
+    Find the benchmark classes of the bench_*.py modules in this directory.
+
+    Parameters
+    ----------
+    pattern: str
+        Only keep the benchmarks whose full name contains this string
+
+    Returns
+    -------
+    A list of (name, class, method name) tuples
+    """
+    benchmarks = []
+    for module_info in sorted(pkgutil.iter_modules([HERE]), key=lambda m: m.name):
+        if not module_info.name.startswith('bench_'):
+            continue
+        module = importlib.import_module('benchmarks.' + module_info.name)
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method in sorted(m for m in dir(cls) if m.startswith('time_')):
+                name = '.'.join([module_info.name, class_name, method])
+                if pattern is None or pattern in name:
+                    benchmarks.append((name, cls, method))
+    return benchmarks
+
+
+def parameter_grid(cls):
+    """
+    The parameter combinations of a benchmark class as a list of tuples.
+    """
+    params = getattr(cls, 'params', [])
+    if not params:
+        return [()]
+    if not isinstance(params[0], (list, tuple)):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def too_large(cls, combination, max_size):
+    """
+    Whether a parameter combination has a size parameter (N, n, ...) above max_size.
+    """
+    if max_size is None:
+        return False
+    names = getattr(cls, 'param_names', [])
+    for name, value in zip(names, combination):
+        if name.lower().startswith('n') and isinstance(value, (int, np.integer)) and value > max_size:
+            return True
+    return False
+
+
+def time_benchmark(func, repeat=5, min_time=0.2):
+    """
+    Time func like timeit's autorange: the number of calls per sample grows until a
+    sample lasts min_time / repeat, then repeat samples are taken.
+
+    Returns
+    -------
+    The number of calls per sample and the seconds per call of each sample
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / repeat:
+            break
+        number *= 10 if elapsed < min_time / (100 * repeat) else 2
+    samples = [elapsed / number] + [t / number for t in timer.repeat(repeat - 1, number)]
+    return number, samples
+
+
+def run(benchmarks, repeat=5, min_time=0.2, max_size=None, verbose=True):
+    results = []
+    for name, cls, method in benchmarks:
+        names = list(getattr(cls, 'param_names', []))
+        for combination in parameter_grid(cls):
+            params = dict(zip(names, combination))
+            if too_large(cls, combination, max_size):
+                continue
+            instance = cls()
+            record = {'benchmark': name, 'params': params}
+            if hasattr(instance, 'setup'):
+                instance.setup(*combination)
+            try:
+                bound = getattr(instance, method)
+                number, samples = time_benchmark(lambda: bound(*combination), repeat=repeat,
+                                                 min_time=min_time)
+                record.update(number=number, samples=samples, min=min(samples),
+                              median=float(np.median(samples)))
+            except Exception as error:
+                record['error'] = '{}: {}'.format(type(error).__name__, error)
+            finally:
+                if hasattr(instance, 'teardown'):
+                    instance.teardown(*combination)
+            results.append(record)
+            if verbose:
+                value = record['error'] if 'error' in record else '{:.3e} s'.format(record['min'])
+                print('{:<65} {:<30} {}'.format(name, str(params), value), flush=True)
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    try:
+        import scipy
+        versions['scipy'] = scipy.__version__
+    except ImportError:
+        pass
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': platform.machine(),
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'versions': versions}
+
+
+def compare(path_before, path_after, threshold=1.1):
+    """
+    Print the ratio of the after to the before timings of the benchmarks in both files.
+    """
+    def load(path):
+        with open(path) as file:
+            data = json.load(file)
+        return {(r['benchmark'], json.dumps(r['params'], sort_keys=True)): r.get('min')
+                for r in data['results']}
+
+    before = load(path_before)
+    after = load(path_after)
+    for key in sorted(set(before) & set(after)):
+        if before[key] is None or after[key] is None:
+            continue
+        ratio = after[key] / before[key]
+        flag = 'slower' if ratio > threshold else 'faster' if ratio < 1 / threshold else ''
+        print('{:<65} {:<30} {:.3e} -> {:.3e} s  x{:.2f} {}'.format(
+            key[0], key[1], before[key], after[key], ratio, flag))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the benchmark suite and write the timings to JSON')
+    parser.add_argument('-b', '--bench', help='only run benchmarks whose name contains this string')
+    parser.add_argument('-o', '--output', default=os.path.join(HERE, 'results.json'),
+                        help='the JSON file the results are written to')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of timing samples')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='the total seconds the samples of a benchmark should last')
+    parser.add_argument('--max-size', type=int, help='skip size parameters above this value')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sys.path.insert(0, ROOT)
+    results = run(discover(args.bench), repeat=args.repeat, min_time=args.min_time,
+                  max_size=args.max_size)
+    with open(args.output, 'w') as file:
+        json.dump({'metadata': metadata(), 'results': results}, file, indent=1)
+    print('wrote {} results to {}'.format(len(results), args.output))
+
+
+if __name__ == '__main__':
+    main()
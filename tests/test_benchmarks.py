@@ -0,0 +1,56 @@
+import json
+
+from benchmarks import run
+
+
+class TinySuite:
+    params = ([10, 1000], ['a', 'b'])
+    param_names = ['n', 'kind']
+
+    def setup(self, n, kind):
+        self.values = list(range(n))
+
+    def time_sum(self, n, kind):
+        sum(self.values)
+
+    def time_fails(self, n, kind):
+        raise ValueError('broken')
+
+
+def test_parameter_grid():
+    assert run.parameter_grid(TinySuite) == [(10, 'a'), (10, 'b'), (1000, 'a'), (1000, 'b')]
+
+    class Single:
+        params = [1, 2]
+
+    assert run.parameter_grid(Single) == [(1,), (2,)]
+    assert run.parameter_grid(object) == [()]
+
+
+def test_too_large():
+    assert run.too_large(TinySuite, (1000, 'a'), 100)
+    assert not run.too_large(TinySuite, (10, 'a'), 100)
+    assert not run.too_large(TinySuite, (1000, 'a'), None)
+
+
+def test_run_and_compare(tmp_path, capsys):
+    benchmarks = [('bench.TinySuite.time_sum', TinySuite, 'time_sum'),
+                  ('bench.TinySuite.time_fails', TinySuite, 'time_fails')]
+
+    results = run.run(benchmarks, repeat=2, min_time=1e-3, max_size=100, verbose=False)
+
+    assert [(r['benchmark'], r['params']['kind']) for r in results] == [
+        ('bench.TinySuite.time_sum', 'a'), ('bench.TinySuite.time_sum', 'b'),
+        ('bench.TinySuite.time_fails', 'a'), ('bench.TinySuite.time_fails', 'b')]
+    assert all(r['params']['n'] == 10 for r in results)
+    assert len(results[0]['samples']) == 2 and results[0]['min'] > 0
+    assert results[2]['error'] == 'ValueError: broken'
+
+    before, after = tmp_path / 'before.json', tmp_path / 'after.json'
+    before.write_text(json.dumps({'metadata': run.metadata(), 'results': results}))
+    slower = [dict(r, min=2 * r['min']) if 'min' in r else r for r in results]
+    after.write_text(json.dumps({'metadata': {}, 'results': slower}))
+    run.compare(str(before), str(after))
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert all('x2.00 slower' in line for line in lines)
@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.integrate import quad
+from scipy.interpolate import interp1d
+
+from RadiationHeatTransfer import blackbody
+
+LMBDAS = np.array([0.0001, 0.25, 0.625, 1.2, 2.2, 2.25, 2.5, 1000.])
+ALPHAS = np.array([0.92, 0.92, 0.92, 0.39, 0.39, 0.47, 0.47, 0.47])
+
+
+def test_Eb_is_sigma_T4():
+    T = np.array([[300.], [1000.], [5800.]])
+    Eb, error = blackbody.Eb(T)
+    assert Eb.shape == T.shape
+    np.testing.assert_allclose(Eb / T**4, 5.67e-8, rtol=1e-3)
+    np.testing.assert_allclose(Eb / T**4, Eb[0, 0] / T[0, 0]**4, rtol=1e-14)
+    np.testing.assert_array_equal(error, 0.)
+
+
+@pytest.mark.parametrize('lmbda, T', [(.5, 5800.), (3., 1000.), (10., 300.), (100., 300.)])
+def test_f_lambda_matches_quadrature(lmbda, T):
+    # the fraction below lambda T = 100 micrometer.K is below 1e-60
+    expected = quad(lambda x: blackbody.Eblambda(x, T), 100. / T, lmbda, epsabs=0., epsrel=1e-12, limit=200)[0]
+    assert blackbody.f_lambda(lmbda, T) == pytest.approx(expected / blackbody.Eb(T)[0], rel=1e-9)
+    y, error = blackbody.Eb_0_lambda(lmbda, T)
+    assert y == pytest.approx(expected, rel=1e-9)
+
+
+def test_f_lambda_broadcasts():
+    lmbdas = np.array([[0.], [.5], [2.], [20.], [np.inf]])
+    T = np.array([300., 1000., 5800.])
+    f = blackbody.f_lambda(lmbdas, T)
+    assert f.shape == (5, 3)
+    for i, j in np.ndindex(f.shape):
+        assert f[i, j] == blackbody.f_lambda(lmbdas[i, 0], T[j])
+    np.testing.assert_array_equal(f[0], 0.)
+    np.testing.assert_array_equal(f[-1], 1.)
+    assert np.all(np.diff(f, axis=0) >= 0)
+
+
+def test_f_lambdaT_matches_series():
+    # inside and outside of the table
+    lmbdaT = np.geomspace(20., 5e6, 4001)
+    np.testing.assert_allclose(blackbody.f_lambdaT(lmbdaT), blackbody.f_lambda(lmbdaT, 1.), rtol=0., atol=1e-13)
+    np.testing.assert_allclose(blackbody.f_lambda_fast(np.array([.5, 2.]), 1000.),
+                               blackbody.f_lambda(np.array([.5, 2.]), 1000.), rtol=0., atol=1e-13)
+    assert blackbody.f_lambdaT(0.) == 0.
+    assert blackbody.f_lambdaT(np.inf) == 1.
+
+
+def test_f_lambdaT_table_file(tmp_path):
+    path = str(tmp_path / 'f_lambdaT.npz')
+    table = blackbody.f_lambdaT_table(path)
+    assert os.path.isfile(path)
+    loaded = np.load(path)
+    for name, array in zip(('lmbdaT', 'f', 'dfdu'), table):
+        np.testing.assert_array_equal(loaded[name], array)
+    assert all(a is b for a, b in zip(blackbody.f_lambdaT_table(), blackbody.f_lambdaT_table()))
+
+
+def test_Eblambda_grid_and_broadcast():
+    lmbdas = np.array([0., .01, .5, 10., 1e4])
+    T = np.array([300., 5800.])
+    grid = blackbody.Eblambda(lmbdas, T, grid=True)
+    assert grid.shape == (5, 2)
+    np.testing.assert_array_equal(grid, blackbody.Eblambda(lmbdas[:, np.newaxis], T))
+    # no overflow at short wavelengths and low temperatures
+    assert np.all(np.isfinite(grid)) and grid[0, 0] == grid[0, 1] == grid[1, 0] == 0.
+
+    planck = 3.741771852e8 / 10.**5 / np.expm1(14387.77 / (10. * 300.))
+    assert grid[3, 0] == pytest.approx(planck, rel=1e-3)
+
+    out = np.empty((5, 2))
+    assert blackbody.Eblambda(lmbdas, T, grid=True, out=out) is out
+    single = blackbody.Eblambda(lmbdas, T, grid=True, dtype=np.float32)
+    assert single.dtype == np.float32
+    np.testing.assert_allclose(single, grid, rtol=1e-5, atol=1e-20)
+
+
+def test_effective_spectral_batch_shape():
+    f = interp1d(LMBDAS, np.stack([ALPHAS, 1 - ALPHAS]))
+    lmbda_1 = np.array([.3, 1.])
+    lmbda_2 = np.array([2., 3.])
+    T = np.array([300., 1000., 3000.])
+    eff = blackbody.effective_spectral_batch(lmbda_1, lmbda_2, T, f, step=.01)
+    assert eff.shape == (2, 2, 3)
+    # the curves add up to one at every wavelength, their sum is the band fraction
+    fraction = blackbody.f_lambda(lmbda_2[:, np.newaxis], T) - blackbody.f_lambda(lmbda_1[:, np.newaxis], T)
+    np.testing.assert_allclose(eff.sum(axis=0), fraction, rtol=2e-3)
+    for b in range(2):
+        for t in range(3):
+            np.testing.assert_allclose(eff[:, b, t], blackbody.effective_spectral_batch(
+                lmbda_1[b], lmbda_2[b], T[t], [interp1d(LMBDAS, ALPHAS), interp1d(LMBDAS, 1 - ALPHAS)],
+                step=.01)[:, 0, 0], rtol=1e-12)
+
+
+@pytest.mark.parametrize('lmbda_1, lmbda_2, T, step', [(0.0001, 1000., 5800., .01), (0.5, 3., 1000., .01),
+                                                       (0.3, 2., 3000., .1), (0.1, 50., 300., .05)])
+def test_effective_spectral_batch_matches_effective_spectral(lmbda_1, lmbda_2, T, step):
+    f = interp1d(LMBDAS, ALPHAS)
+    eff, _, _, _ = blackbody.effective_spectral(lmbda_1, lmbda_2, T, f, step=step)
+    batch = blackbody.effective_spectral_batch(lmbda_1, lmbda_2, T, f, step=step)[0, 0, 0]
+    # the batch grid is closed at lmbda_2, the two differ by at most one step at the end
+    last_step = np.linspace(lmbda_2 - step, lmbda_2, 11)
+    bound = step * np.max(blackbody.Eblambda(last_step, T) * f(last_step)) / blackbody.Eb(T)[0]
+    assert abs(batch - eff) <= bound + 1e-12
+
+
+@pytest.mark.parametrize('lmbda_1, lmbda_2, T', [(.1, 1000., 5800.), (.5, 3., 1000.), (2., 50., 300.)])
+def test_effective_spectral_adaptive_meets_rtol(lmbda_1, lmbda_2, T):
+    # a constant property gives the band fraction
+    constant = interp1d([1e-4, 1e4], [.5, .5])
+    eff, n_points, err = blackbody.effective_spectral_adaptive(lmbda_1, lmbda_2, T, constant, rtol=1e-10)
+    fraction = blackbody.f_lambda(lmbda_2, T) - blackbody.f_lambda(lmbda_1, T)
+    assert eff == pytest.approx(.5 * fraction, rel=1e-9)
+
+    f = interp1d(LMBDAS, ALPHAS)
+    eff, n_points, err = blackbody.effective_spectral_adaptive(lmbda_1, lmbda_2, T, f, rtol=1e-8)
+    breaks = LMBDAS[(LMBDAS > lmbda_1) & (LMBDAS < lmbda_2)]
+    expected = quad(lambda x: f(x) * blackbody.Eblambda(x, T), lmbda_1, lmbda_2, points=breaks, epsabs=0.,
+                    epsrel=1e-12, limit=500)[0] / blackbody.Eb(T)[0]
+    assert eff == pytest.approx(expected, rel=1e-7)
+    assert err <= 1e-8 * eff
+    assert n_points < 10**4
+
+
+def test_blackbody_fraction_nan_input():
+    f = blackbody.f_lambda(np.array([np.nan, 1., 0.]), 1000.)
+    assert np.isnan(f[0])
+    assert 0. < f[1] < 1.
+    assert f[2] == 0.
+    np.testing.assert_array_equal(np.isnan(blackbody._f_zeta(np.full((2, 3), np.nan))), True)
+
+
+def test_blackbody_fraction_negative_lambda_T():
+    assert np.isnan(blackbody.f_lambdaT(-1.))
+    assert np.isnan(blackbody.f_lambdaT(-1e7))
+    assert np.isnan(blackbody.f_lambda(-1., 300.))
+    f = blackbody.f_lambdaT(np.array([-500., 0., 500., 5e7]))
+    assert np.isnan(f[0])
+    np.testing.assert_allclose(f[1:], blackbody.f_lambda(np.array([0., 500., 5e7]), 1.), atol=1e-13)
@@ -0,0 +1,119 @@
+import os
+import shutil
+
+import numpy as np
+
+from RadiationHeatTransfer import cache, viewgr
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples')
+
+# a unit square split into a triangle and a quadrilateral, with a triangle lid
+MIXED_VS3 = """T Mixed triangles and quadrilaterals
+C encl=0 list=0
+F 3
+V 1 0. 0. 0.
+V 2 1. 0. 0.
+V 3 1. 1. 0.
+V 4 0. 1. 0.
+V 5 0.5 0.5 0.
+V 6 0.5 0.5 1.
+S 3 1 2 5 0 0 0 0.9 tri
+S 1 2 3 4 5 0 0 0.5 quad
+S 2 1 4 6 0 0 0 0.7 lid
+End of data
+"""
+
+
+def test_read_output_hit_is_a_memmap(tmp_path):
+    from RadiationHeatTransfer import view3d
+
+    path = tmp_path / 'output.txt'
+    shutil.copy(os.path.join(EXAMPLES, 'oven_output.txt'), str(path))
+    array_cache = cache.ArrayCache(cache_dir=str(tmp_path / 'cache'))
+    expected = view3d.read_output(str(path))
+
+    key = array_cache.key(str(path), parser='view3d.read_output', delimiter=' ', dtype=np.dtype(np.float64).str)
+    assert array_cache.load(key) is None
+    for _ in range(2):
+        A, Fij, eps = cache.read_output(str(path), cache=array_cache)
+        assert isinstance(Fij, np.memmap)
+        assert not Fij.flags.writeable
+        for array, value in zip((A, Fij, eps), expected):
+            np.testing.assert_array_equal(array, value)
+    assert array_cache.load(key) is not None
+    assert A.shape == (6, 1)
+
+    # changed contents are a miss, even with the same size and modification time
+    st = os.stat(str(path))
+    path.write_text(path.read_text().replace('8 8 4 4 2 2', '9 9 4 4 2 2'))
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    A, Fij, eps = cache.read_output(str(path), cache=array_cache)
+    assert A[0, 0] == 9.
+    assert cache.read_output(str(path), dtype=np.float32, cache=array_cache)[1].dtype == np.float32
+
+    array_cache.clear()
+    assert os.listdir(array_cache.cache_dir) == ['stat']
+
+
+def test_read_vs3_file_round_trip(tmp_path):
+    path = os.path.join(EXAMPLES, 'oven.vs3')
+    array_cache = cache.ArrayCache(cache_dir=str(tmp_path / 'cache'))
+
+    expected = viewgr.read_vs3_file(path, delimiter=' ')
+    assert len(expected[1]) == 6
+    for _ in range(2):
+        vertices, shapes = cache.read_vs3_file(path, delimiter=' ', cache=array_cache)
+        assert vertices == expected[0]
+        assert shapes == expected[1]
+
+
+def test_evict_least_recently_used(tmp_path):
+    array_cache = cache.ArrayCache(cache_dir=str(tmp_path / 'cache'), max_bytes=10**6)
+    for key in ('a', 'b', 'c'):
+        array_cache.store(key, {'x': np.zeros(1000)})
+        os.utime(os.path.join(array_cache.cache_dir, key), (1, {'a': 1, 'b': 3, 'c': 2}[key]))
+    array_cache.load('a')
+
+    array_cache.max_bytes = 2 * 8500
+    array_cache.evict()
+
+    assert sorted(name for name in os.listdir(array_cache.cache_dir) if name != 'stat') == ['a', 'b']
+
+
+def test_read_vs3_mixed_triangles_and_quadrilaterals(tmp_path):
+    path = tmp_path / 'mixed.vs3'
+    path.write_text(MIXED_VS3)
+    array_cache = cache.ArrayCache(cache_dir=str(tmp_path / 'cache'))
+
+    expected = viewgr.read_vs3_file(str(path), delimiter=' ')
+    # a miss parses and stores, a hit loads the stored arrays
+    for _ in range(2):
+        vertices, shapes = cache.read_vs3_file(str(path), delimiter=' ', cache=array_cache)
+        assert vertices == expected[0]
+        assert shapes == expected[1]
+    assert shapes[3] == (1, 2, 5, 1)
+    assert shapes[1] == (2, 3, 4, 5, 2)
+
+    geometry = cache.read_vs3_geometry(str(path), cache=array_cache)
+    parsed = viewgr.VS3Geometry.from_file(str(path))
+    np.testing.assert_array_equal(geometry.connectivity, parsed.connectivity)
+    np.testing.assert_array_equal(geometry.emissivity, parsed.emissivity)
+    np.testing.assert_array_equal(geometry.names, parsed.names)
+    np.testing.assert_allclose(geometry.areas, parsed.areas)
+    assert geometry.title == 'Mixed triangles and quadrilaterals'
+    assert geometry.format == 3
+
+
+def test_entry_above_max_bytes_is_kept(tmp_path):
+    from RadiationHeatTransfer import view3d
+
+    path = os.path.join(EXAMPLES, 'oven_output.txt')
+    array_cache = cache.ArrayCache(cache_dir=str(tmp_path / 'cache'), max_bytes=100)
+    cache.read_vs3_geometry(os.path.join(EXAMPLES, 'oven.vs3'), cache=array_cache)
+
+    # the new entry alone is above max_bytes, the older one is evicted
+    A, Fij, eps = cache.read_output(path, cache=array_cache)
+    expected = view3d.read_output(path)
+    np.testing.assert_array_equal(Fij, expected[1])
+    np.testing.assert_array_equal(A, expected[0])
+    assert len([name for name in os.listdir(array_cache.cache_dir) if not name == 'stat']) == 1
@@ -0,0 +1,271 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from RadiationHeatTransfer import blackbody, enclosures
+
+# three surfaces of a long triangular duct, equal widths
+FIJ = np.array([[0., .5, .5],
+                [.5, 0., .5],
+                [.5, .5, 0.]])
+AREAS = np.ones((3, 1))
+
+
+def _random_enclosure(N, seed=0):
+    # reciprocal view factors of a closed enclosure, A_i Fij = A_j Fji and rows summing to 1
+    rng = np.random.default_rng(seed)
+    G = rng.random((N, N))
+    G = G + G.T
+    np.fill_diagonal(G, 0.)
+    A = G.sum(axis=1, keepdims=True)
+    eps = rng.uniform(.2, .9, (N, 1))
+    eb = rng.uniform(1e3, 1e5, (N, 1))
+    return G / A, A, eps, eb
+
+
+def test_band_heat_flux_gray_surfaces():
+    T = np.array([[1000.], [600.], [400.]])
+    eps = np.array([[.8], [.3], [.6]])
+    spectral = [lambda lmbda, e=e: np.full_like(lmbda, e) for e in eps[:, 0]]
+    bands = np.array([0., 1., 3., 8., np.inf])
+
+    flux, flux_bands = enclosures.band_heat_flux(FIJ, spectral, T, bands)
+
+    assert flux.shape == (3, 1)
+    assert flux_bands.shape == (4, 3, 1)
+    np.testing.assert_allclose(flux_bands.sum(axis=0), flux)
+    Eb = blackbody.Eb_vectorized(T)
+    J = np.linalg.solve(enclosures.F_matrix(FIJ, eps), Eb)
+    np.testing.assert_allclose(flux, enclosures.heat_flux(J, Eb, eps), rtol=1e-6)
+    # every band conserves energy on its own
+    np.testing.assert_allclose((flux_bands * AREAS).sum(axis=1), 0., atol=1e-9 * np.abs(flux).max())
+
+
+def test_band_emissivities_step():
+    T = np.array([[1000.], [1000.]])
+    spectral = [lambda lmbda: np.where(lmbda < 4., .9, .1), lambda lmbda: np.full_like(lmbda, .5)]
+    bands = np.array([0., 4., np.inf])
+
+    eps_bands = enclosures.band_emissivities(spectral, T, bands)
+
+    assert eps_bands.shape == (2, 2, 1)
+    # the step at the band edge is smeared over one interval of the averaging grid
+    np.testing.assert_allclose(eps_bands[:, 0, 0], [.9, .1], rtol=2e-2)
+    np.testing.assert_allclose(eps_bands[:, 1, 0], .5)
+
+
+def test_enclosure_matches_direct_solve():
+    Fij, A, eps, eb = _random_enclosure(20)
+    eb = np.hstack([eb, 2 * eb, eb[::-1]])
+    enclosure = enclosures.Enclosure(Fij, A, eps)
+
+    J = enclosure.radiosity(eb)
+
+    assert J.shape == eb.shape
+    np.testing.assert_allclose(J, np.linalg.solve(enclosures.F_matrix(Fij, eps), eb), rtol=1e-10)
+    for k in range(eb.shape[1]):
+        q = enclosures.heat_flux(J[:, [k]], eb[:, [k]], eps)
+        np.testing.assert_allclose(enclosure.heat_flux(eb[:, [k]]), q, rtol=1e-8, atol=1e-8 * np.abs(q).max())
+    Q = enclosure.heat_flow(eb)
+    np.testing.assert_allclose(Q.sum(axis=0), 0., atol=1e-9 * np.abs(Q).max())
+    np.testing.assert_allclose(Q[:, 1], 2 * Q[:, 0], rtol=1e-10)
+
+
+def test_heat_flow_any_size():
+    Fij, A, eps, eb = _random_enclosure(7)
+    SS = np.linalg.solve(enclosures.T_matrix(Fij, eps, A), enclosures.S_matrix(Fij, eps, A))
+
+    Q = enclosures.heat_flow(SS, eb)
+
+    expected = np.array([[sum(SS[i, j] * (eb[i, 0] - eb[j, 0]) for j in range(7))] for i in range(7)])
+    np.testing.assert_allclose(Q, expected, rtol=1e-10, atol=1e-10 * np.abs(expected).max())
+    np.testing.assert_allclose(Q, enclosures.Enclosure(Fij, A, eps).heat_flow(eb), rtol=1e-8,
+                               atol=1e-8 * np.abs(Q).max())
+
+
+def test_matrices_batched_over_scenarios():
+    Fij, A, eps, eb = _random_enclosure(6)
+    rng = np.random.default_rng(1)
+    eps_stack = rng.uniform(.2, .9, (4, 6, 1))
+    eb_stack = rng.uniform(1e3, 1e5, (4, 6, 1))
+
+    F = enclosures.F_matrix(Fij, eps_stack)
+    T = enclosures.T_matrix(Fij, eps_stack, A)
+    S = enclosures.S_matrix(Fij, eps_stack, A)
+    Q = enclosures.heat_flow(np.linalg.solve(T, S), eb_stack)
+
+    assert F.shape == T.shape == S.shape == (4, 6, 6)
+    assert Q.shape == (4, 6, 1)
+    for k in range(4):
+        np.testing.assert_allclose(F[k], enclosures.F_matrix(Fij, eps_stack[k]))
+        np.testing.assert_allclose(T[k], enclosures.T_matrix(Fij, eps_stack[k], A))
+        np.testing.assert_allclose(S[k], enclosures.S_matrix(Fij, eps_stack[k], A))
+        SS = np.linalg.solve(T[k], S[k])
+        np.testing.assert_allclose(Q[k], enclosures.heat_flow(SS, eb_stack[k]), rtol=1e-10)
+
+
+@pytest.mark.parametrize('method', ['gmres', 'bicgstab', 'jacobi'])
+def test_solve_radiosity_sparse(method):
+    Fij, A, eps, eb = _random_enclosure(40)
+    # an obstructed enclosure, most pairs do not see each other
+    Fij[np.abs(np.subtract.outer(np.arange(40), np.arange(40))) > 3] = 0.
+    Fij /= Fij.sum(axis=1, keepdims=True)
+    expected = np.linalg.solve(enclosures.F_matrix(Fij, eps), eb)
+
+    J, info = enclosures.solve_radiosity(sparse.csr_matrix(Fij), eps, eb, method=method, tol=1e-10)
+
+    assert info['converged']
+    assert info['iterations'] > 0
+    np.testing.assert_allclose(J, expected, rtol=1e-8)
+    # a warm start from the solution needs next to no iterations
+    _, warm = enclosures.solve_radiosity(sparse.csr_matrix(Fij), eps, eb, method=method, tol=1e-8, J0=J)
+    assert warm['iterations'] <= 1
+
+
+def test_F_matrix_sparse():
+    Fij, A, eps, eb = _random_enclosure(10)
+    Fij[Fij < np.median(Fij)] = 0.
+
+    F = enclosures.F_matrix(sparse.csr_matrix(Fij), eps)
+
+    assert sparse.issparse(F)
+    np.testing.assert_allclose(F.toarray(), enclosures.F_matrix(Fij, eps))
+
+
+def test_solve_radiosity_unknown_method():
+    Fij, A, eps, eb = _random_enclosure(5)
+    with pytest.raises(ValueError):
+        enclosures.solve_radiosity(Fij, eps, eb, method='lu')
+
+
+def test_band_heat_flux_black_surfaces():
+    T = np.array([[1000.], [600.], [400.]])
+    eps = np.array([[1.], [1.], [.5]])
+    spectral = [lambda lmbda, e=e: np.full_like(lmbda, e) for e in eps[:, 0]]
+    bands = np.array([0., 2., 5., np.inf])
+
+    flux, flux_bands = enclosures.band_heat_flux(FIJ, spectral, T, bands)
+
+    assert np.all(np.isfinite(flux_bands))
+    expected = enclosures.Enclosure(FIJ, AREAS, eps).heat_flow(blackbody.Eb_vectorized(T))
+    np.testing.assert_allclose(flux * AREAS, expected, rtol=1e-6)
+
+
+def test_solve_radiosity_jacobi_one_product_per_iteration():
+    from RadiationHeatTransfer import instrument, outofcore
+
+    rng = np.random.default_rng(0)
+    N = 50
+    Fij = rng.random((N, N))
+    Fij /= Fij.sum(axis=1, keepdims=True)
+    eps = rng.uniform(.3, .9, (N, 1))
+    eb = rng.uniform(1e3, 1e4, (N, 1))
+    Fij_blocked = outofcore.BlockedMatrix(Fij, memory=2**30)
+
+    with instrument.record() as recorder:
+        J, info = enclosures.solve_radiosity(Fij_blocked, eps, eb, method='jacobi', tol=1e-10)
+
+    assert info['converged']
+    np.testing.assert_allclose(J, np.linalg.solve(enclosures.F_matrix(Fij, eps), eb), rtol=1e-8)
+    # one product per iteration and one for the final residual, one block each
+    assert recorder.counters['outofcore.blocks'] == info['iterations'] + 1
+
+
+def test_solve_radiosity_linear_operator():
+    from scipy.sparse.linalg import aslinearoperator
+
+    Fij, A, eps, eb = _random_enclosure(30)
+    expected = np.linalg.solve(enclosures.F_matrix(Fij, eps), eb)
+
+    for method in ('gmres', 'bicgstab', 'jacobi'):
+        J, info = enclosures.solve_radiosity(aslinearoperator(Fij), eps, eb, method=method, tol=1e-10)
+        assert info['converged']
+        np.testing.assert_allclose(J, expected, rtol=1e-8)
+
+
+@pytest.mark.parametrize('max_rank', [64, 2])
+def test_update_eps_matches_fresh_factorization(max_rank):
+    Fij, A, eps, eb = _random_enclosure(30)
+    enclosure = enclosures.Enclosure(Fij, A, eps, max_rank=max_rank)
+    eps = eps.copy()
+
+    for indices, value in [(3, .95), ([3, 7], .4), ([10, 11, 12], .7), (7, eps[7, 0])]:
+        info = enclosure.update_eps(indices, value)
+        eps[indices, 0] = value
+        fresh = enclosures.Enclosure(Fij, A, eps)
+
+        np.testing.assert_allclose(enclosure.radiosity(eb), fresh.radiosity(eb), rtol=1e-10)
+        np.testing.assert_allclose(enclosure.heat_flow(eb), fresh.heat_flow(eb), rtol=1e-8,
+                                   atol=1e-8 * np.abs(fresh.heat_flow(eb)).max())
+        changed = np.count_nonzero(eps[:, 0] != enclosure._eps_factorized[:, 0])
+        assert info['rank'] == changed
+        assert info['refactorized'] == (info['reason'] is not None)
+
+
+def test_update_eps_refactorizes_beyond_max_rank():
+    Fij, A, eps, eb = _random_enclosure(10)
+    enclosure = enclosures.Enclosure(Fij, A, eps, max_rank=2)
+
+    assert not enclosure.update_eps([0, 1], .5)['refactorized']
+    info = enclosure.update_eps(2, .5)
+
+    assert info['refactorized']
+    assert 'max_rank' in info['reason']
+    assert info['rank'] == 0
+    assert enclosure.n_factorizations == 2
+
+
+def test_gradient_matches_finite_differences():
+    Fij, A, eps, eb = _random_enclosure(8)
+    w = np.random.default_rng(2).normal(size=(8, 1))
+    enclosure = enclosures.Enclosure(Fij, A, eps)
+
+    grad = enclosure.gradient(eb, w)
+
+    def f(eps, eb):
+        return (w.T @ enclosures.Enclosure(Fij, A, eps).heat_flow(eb)).item()
+
+    for i in range(8):
+        h = np.zeros((8, 1))
+        h[i] = 1e-6 * eps[i]
+        np.testing.assert_allclose(grad['eps'][i, 0], (f(eps + h, eb) - f(eps - h, eb)) / (2 * h[i, 0]), rtol=1e-5)
+        h[i] = 1e-6 * eb[i]
+        np.testing.assert_allclose(grad['eb'][i, 0], (f(eps, eb + h) - f(eps, eb - h)) / (2 * h[i, 0]), rtol=1e-5)
+    T = (eb / blackbody.sigma) ** .25
+    np.testing.assert_allclose(grad['T'], grad['eb'] * 4 * blackbody.sigma * T**3)
+
+
+def test_jacobian_is_stacked_gradients():
+    Fij, A, eps, eb = _random_enclosure(6)
+    enclosure = enclosures.Enclosure(Fij, A, eps)
+
+    jacobian = enclosure.jacobian(eb)
+    grad = enclosure.gradient(eb, np.identity(6))
+
+    for key in grad:
+        np.testing.assert_allclose(jacobian[key], grad[key].T)
+    # Q is linear in eb
+    np.testing.assert_allclose(jacobian['eb'] @ eb, enclosure.heat_flow(eb), rtol=1e-8,
+                               atol=1e-8 * np.abs(enclosure.heat_flow(eb)).max())
+
+
+def test_band_emissivities_tabulated():
+    from scipy.interpolate import interp1d
+
+    T = np.array([[1000.], [800.]])
+    lmbdas = np.array([.01, .06, 3., 10.])
+    table = np.array([[.2, .2, .9, .5],
+                      [.3, .4, .6, .7]])
+    # the first band lies below any emission, the last above
+    bands = np.array([.01, .05, 2., 5., 2e3, np.inf])
+
+    eps_bands = enclosures.band_emissivities((lmbdas, table), T, bands)
+    per_surface = enclosures.band_emissivities([(lmbdas, row) for row in table], T, bands)
+    f = interp1d(lmbdas, table, bounds_error=False, fill_value=(table[:, 0], table[:, -1]))
+    np.testing.assert_allclose(per_surface, eps_bands)
+    np.testing.assert_allclose(enclosures.band_emissivities(f, T, bands), eps_bands)
+
+    # bands without emission take the emissivity at their nearest edge
+    np.testing.assert_allclose(eps_bands[0, :, 0], [.2, .38])
+    np.testing.assert_allclose(eps_bands[-1, :, 0], [.5, .7])
+    assert np.all((eps_bands[1:-1, :, 0] >= table.min(axis=1)) & (eps_bands[1:-1, :, 0] <= table.max(axis=1)))
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import enclosures, hierarchical, viewfactors
+
+CUBE = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'cube.vs3')
+
+
+def _plates(n):
+    # two facing unit squares a unit apart, each split into n x n patches
+    vertices, shapes = {}, {}
+    g = np.linspace(0., 1., n + 1)
+    for z, flip in ((0., False), (1., True)):
+        first = len(vertices) + 1
+        for a in range(n + 1):
+            for b in range(n + 1):
+                vertices[first + a * (n + 1) + b] = (g[a], g[b], z)
+        for a in range(n):
+            for b in range(n):
+                v = first + a * (n + 1) + b
+                loop = (v, v + n + 1, v + n + 2, v + 1)
+                loop = loop[::-1] if flip else loop
+                shapes[len(shapes) + 1] = loop + loop[:1]
+    return vertices, shapes
+
+
+def test_matvec_approximates_dense():
+    vertices, shapes = _plates(8)
+    A, Fij = viewfactors.unobstructed_view_factors(vertices, shapes)
+    J = np.random.default_rng(0).uniform(1., 2., (128, 1))
+
+    exact = hierarchical.HierarchicalEnclosure(vertices, shapes, tol=0.)
+    assert len(exact.far_R) == 0
+    np.testing.assert_allclose(exact.matvec(J), Fij @ J, rtol=1e-12)
+
+    enclosure = hierarchical.HierarchicalEnclosure(vertices, shapes, tol=.05)
+    assert len(enclosure.far_R) > 0
+    np.testing.assert_allclose(enclosure.matvec(J), Fij @ J, rtol=2e-2)
+    np.testing.assert_allclose(enclosure.matvec(J[:, 0]), enclosure.matvec(J)[:, 0])
+    np.testing.assert_allclose(enclosure.row_sums(), Fij.sum(axis=1, keepdims=True), rtol=2e-2)
+
+
+@pytest.mark.parametrize('method', ['gmres', 'jacobi'])
+def test_solve_approximates_dense(method):
+    vertices, shapes = _plates(8)
+    A, Fij = viewfactors.unobstructed_view_factors(vertices, shapes)
+    eps = np.full((128, 1), .6)
+    eb = np.vstack([np.full((64, 1), 5e4), np.full((64, 1), 1e4)])
+    enclosure = hierarchical.HierarchicalEnclosure(vertices, shapes, tol=.05)
+
+    J, q, Q, info = enclosure.solve(eb, eps=eps, method=method, tol=1e-10)
+
+    assert info['converged']
+    np.testing.assert_allclose(J, np.linalg.solve(enclosures.F_matrix(Fij, eps), eb), rtol=2e-2)
+    np.testing.assert_allclose(Q, q * A)
+    with pytest.raises(ValueError):
+        enclosure.solve(eb)
+
+
+@pytest.fixture
+def shuffled_cube(tmp_path):
+    # the cube with distinct emissivities and its S lines out of shape number order
+    with open(CUBE) as file:
+        lines = file.read().splitlines()
+    s_lines = [line for line in lines if line.startswith('S')]
+    other = [line for line in lines if not line.startswith('S') and not line.startswith('End')]
+    emissivities = {1: .2, 2: .3, 3: .4, 4: .5, 5: .6, 6: .9}
+    shuffled = []
+    for line in [s_lines[k] for k in (4, 0, 5, 2, 1, 3)]:
+        fields = line.split()
+        fields[8] = str(emissivities[int(fields[1])])
+        shuffled.append(' '.join(fields))
+    path = tmp_path / 'cube.vs3'
+    path.write_text('\n'.join(other + shuffled + ['End of data']) + '\n')
+    return str(path), emissivities
+
+
+def test_from_file_emissivities_follow_surface_order(shuffled_cube):
+    path, emissivities = shuffled_cube
+    enclosure = hierarchical.HierarchicalEnclosure.from_file(path)
+    np.testing.assert_array_equal(enclosure.eps[:, 0], [emissivities[k] for k in sorted(emissivities)])
+
+    A, Fij, eps = viewfactors.read_vs3_view_factors(path)
+    np.testing.assert_array_equal(enclosure.eps, eps)
+
+
+@pytest.mark.parametrize('method', ['gmres', 'bicgstab', 'jacobi'])
+def test_solve_matches_dense(shuffled_cube, method):
+    path, _ = shuffled_cube
+    enclosure = hierarchical.HierarchicalEnclosure.from_file(path)
+    A, Fij, eps = viewfactors.read_vs3_view_factors(path)
+    eb = np.array([[5e4], [1e4], [1e4], [2e4], [1e4], [1e4]])
+
+    J, q, Q, info = enclosure.solve(eb, method=method, tol=1e-10)
+
+    assert info['converged']
+    np.testing.assert_allclose(Q, enclosures.Enclosure(Fij, A, eps).heat_flow(eb), rtol=1e-6, atol=1e-6)
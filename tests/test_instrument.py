@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+
+from RadiationHeatTransfer import enclosures, instrument, zonal
+
+FIJ = np.array([[0., .5, .5],
+                [.5, 0., .5],
+                [.5, .5, 0.]])
+AREAS = np.ones((3, 1))
+
+
+def test_disabled_outside_of_record():
+    assert not instrument.enabled
+    with instrument.record() as recorder:
+        assert instrument.enabled
+        enclosures.F_matrix(FIJ, np.full((3, 1), .5))
+    assert not instrument.enabled
+
+    enclosures.F_matrix(FIJ, np.full((3, 1), .5))
+    assert recorder.timers['enclosures.F_matrix']['calls'] == 1
+
+
+def test_factorization_reuse_is_counted():
+    eb = np.array([[1e4], [2e4], [3e4]])
+    with instrument.record() as recorder:
+        enclosure = enclosures.Enclosure(FIJ, AREAS, np.full((3, 1), .8))
+        for k in range(5):
+            enclosure.radiosity(k * eb)
+
+    assert recorder.counters['enclosures.factorizations'] == 1
+    assert recorder.counters['enclosures.lu_solves'] == 5
+    assert recorder.timers['enclosures.Enclosure.factorize']['calls'] == 1
+
+
+def test_zonal_iterations_and_callbacks(tmp_path):
+    SS = enclosures.Enclosure(FIJ, AREAS, np.full((3, 1), .8)).SS
+    emitted = []
+    callback = instrument.register(lambda kind, name, value: emitted.append((kind, name)))
+    try:
+        with instrument.record() as outer, instrument.record() as inner:
+            Ts, Ta, info = zonal.solve(SS, AREAS, qf_in=np.array([[500.], [0.], [0.]]))
+    finally:
+        instrument.unregister(callback)
+    assert not instrument.enabled
+
+    iterations = inner.events['zonal.iteration']
+    assert len(iterations) == info['iterations']
+    assert [e['residual'] for e in iterations] == info['residuals']
+    assert outer.to_dict() == inner.to_dict()
+    assert ('time', 'zonal.solve') in emitted
+    assert emitted.count(('event', 'zonal.iteration')) == info['iterations']
+
+    path = tmp_path / 'run.json'
+    text = inner.to_json(str(path))
+    assert json.loads(path.read_text()) == json.loads(text) == json.loads(json.dumps(inner.to_dict()))
+    inner.clear()
+    assert inner.to_dict() == {'counters': {}, 'timers': {}, 'events': {}}
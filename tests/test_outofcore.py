@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import enclosures, instrument, outofcore, view3d
+
+OUTPUT = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'oven_output.txt')
+
+
+def _reciprocal(N, seed=0):
+    rng = np.random.default_rng(seed)
+    G = rng.random((N, N))
+    G = G + G.T
+    np.fill_diagonal(G, 0.)
+    A = G.sum(axis=1, keepdims=True)
+    return G / A, A
+
+
+def test_blocked_products_match_dense():
+    Fij, A = _reciprocal(40)
+    x = np.random.default_rng(1).random((40, 3))
+    # a few rows per block
+    blocked = outofcore.BlockedMatrix(Fij, memory=8 * 40 * 12)
+
+    with instrument.record() as recorder:
+        np.testing.assert_allclose(blocked @ x[:, 0], Fij @ x[:, 0])
+    assert recorder.counters['outofcore.blocks'] > 1
+    np.testing.assert_allclose(blocked.matvec(x), Fij @ x)
+    np.testing.assert_allclose(blocked.rmatvec(x), Fij.T @ x)
+    np.testing.assert_allclose(blocked.row_sums(), 1.)
+    np.testing.assert_array_equal(blocked.diagonal(), 0.)
+    np.testing.assert_allclose(blocked.aslinearoperator().rmatvec(x[:, 0]), Fij.T @ x[:, 0])
+    with pytest.raises(ValueError):
+        outofcore.BlockedMatrix(Fij[:10])
+
+
+def test_matrices_out_of_core(tmp_path):
+    Fij, A = _reciprocal(30)
+    eps = np.random.default_rng(2).uniform(.2, .9, (30, 1))
+    memory = 8 * 30 * 10
+
+    F = outofcore.F_matrix(Fij, eps, out=str(tmp_path / 'F.npy'), memory=memory)
+    assert isinstance(F, outofcore.BlockedMatrix)
+    np.testing.assert_allclose(np.asarray(F.a), enclosures.F_matrix(Fij, eps))
+    np.testing.assert_allclose(outofcore.T_matrix(Fij, eps, A, memory=memory), enclosures.T_matrix(Fij, eps, A))
+    np.testing.assert_allclose(outofcore.S_matrix(Fij, eps, A, memory=memory), enclosures.S_matrix(Fij, eps, A))
+
+    assert outofcore.check_reciprocity(Fij, A, memory=memory)
+    assert not outofcore.check_reciprocity(Fij, A[::-1], memory=memory)
+    assert outofcore.allclose_transpose(Fij * A, memory=memory)
+
+
+def test_read_output_and_solve(tmp_path):
+    A, Fij, eps = outofcore.read_output(OUTPUT, str(tmp_path / 'Fij.npy'), memory=8 * 6 * 4)
+    expected = view3d.read_output(OUTPUT)
+
+    np.testing.assert_array_equal(A, expected[0])
+    np.testing.assert_array_equal(np.asarray(Fij.a), expected[1])
+    np.testing.assert_array_equal(eps, expected[2])
+
+    eps = np.full((6, 1), .7)
+    eb = np.array([[5e4], [1e4], [1e4], [2e4], [1e4], [1e4]])
+    J, info = enclosures.solve_radiosity(Fij, eps, eb, tol=1e-12)
+    assert info['converged']
+    np.testing.assert_allclose(J, np.linalg.solve(enclosures.F_matrix(expected[1], eps), eb), rtol=1e-10)
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import RadiationHeatTransfer
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+@pytest.mark.parametrize('module', ['', '.blackbody', '.enclosures', '.viewgr', '.zonal'])
+def test_import_does_not_load_heavy_dependencies(module):
+    code = ('import sys; import RadiationHeatTransfer{}; '
+            'print(" ".join(m for m in ("scipy", "matplotlib", "plotly") if m in sys.modules))').format(module)
+    loaded = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True,
+                            text=True).stdout.split()
+    assert loaded == []
+
+
+def test_submodules_load_on_attribute_access():
+    assert set(RadiationHeatTransfer.__all__) <= set(dir(RadiationHeatTransfer))
+    from RadiationHeatTransfer import blackbody
+
+    assert RadiationHeatTransfer.blackbody is blackbody
+    with pytest.raises(AttributeError):
+        RadiationHeatTransfer.spectral
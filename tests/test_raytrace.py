@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import raytrace, viewgr
+
+CUBE = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'cube.vs3')
+
+# the unit cube with its top face z = 1 split in two, the second half combined into the first
+SPLIT_CUBE_VS3 = """T The unit cube, top face in two
+C encl=1 list=3
+F 3
+V 1 0. 0. 0.
+V 2 1. 0. 0.
+V 3 1. 1. 0.
+V 4 0. 1. 0.
+V 5 0. 0. 1.
+V 6 1. 0. 1.
+V 7 1. 1. 1.
+V 8 0. 1. 1.
+V 9 .5 0. 1.
+V 10 .5 1. 1.
+S 1 1 2 3 4 0 0 0.5 zeq0
+S 2 1 4 8 5 0 0 0.5 xeq0
+S 3 1 5 6 2 0 0 0.5 yeq0
+S 4 10 9 5 8 0 0 0.6 zeq1_a
+S 5 7 3 2 6 0 0 0.5 xeq1
+S 6 7 8 4 3 0 0 0.5 yeq1
+S 7 7 6 9 10 {} {} 0.6 zeq1_b
+End of data
+"""
+
+
+def test_obstructed_view_factors_of_the_cube():
+    vertices, shapes = viewgr.read_vs3_file(CUBE, delimiter=' ')
+
+    A, Fij, error, n_rays = raytrace.obstructed_view_factors(vertices, shapes, tol=5e-3)
+
+    np.testing.assert_allclose(A[:, 0], 1.)
+    # every ray leaving a face of a closed cube hits one of the other faces
+    np.testing.assert_allclose(Fij.sum(axis=1), 1.)
+    np.testing.assert_array_equal(np.diag(Fij), 0.)
+    assert np.all(error <= 5e-3)
+    assert np.all(np.abs(Fij - (1 - np.eye(6)) * .2) <= 5 * error + 1e-12)
+    assert np.all(n_rays >= 10000)
+
+    _, Fij_2, error_2, n_rays_2 = raytrace.obstructed_view_factors(vertices, shapes, tol=5e-3, n_workers=2)
+    np.testing.assert_array_equal(Fij_2, Fij)
+    np.testing.assert_array_equal(n_rays_2, n_rays)
+
+
+def test_blocker_between_parallel_plates():
+    # two facing unit squares a unit apart, then a larger plate half way between them
+    vertices = {1: (0., 0., 0.), 2: (1., 0., 0.), 3: (1., 1., 0.), 4: (0., 1., 0.),
+                5: (0., 0., 1.), 6: (0., 1., 1.), 7: (1., 1., 1.), 8: (1., 0., 1.),
+                9: (-1., -1., .5), 10: (2., -1., .5), 11: (2., 2., .5), 12: (-1., 2., .5)}
+    shapes = {1: (1, 2, 3, 4, 1), 2: (5, 6, 7, 8, 5)}
+
+    A, Fij, error, n_rays = raytrace.obstructed_view_factors(vertices, shapes, tol=2e-3)
+    # 0.199825 for parallel unit squares a unit apart
+    assert abs(Fij[0, 1] - .199825) <= 5 * error[0, 1]
+    assert abs(Fij[1, 0] - .199825) <= 5 * error[1, 0]
+
+    shapes[3] = (9, 10, 11, 12, 9)
+    A, Fij, error, n_rays = raytrace.obstructed_view_factors(vertices, shapes, tol=2e-3)
+    assert Fij[0, 1] == Fij[1, 0] == 0.
+    assert Fij[1, 2] > .9
+
+
+def test_read_vs3_view_factors_combines_surfaces(tmp_path):
+    path = tmp_path / 'cube.vs3'
+    path.write_text(SPLIT_CUBE_VS3.format(0, 4))
+
+    A, Fij, eps, error, n_rays = raytrace.read_vs3_view_factors(str(path), tol=5e-3)
+
+    np.testing.assert_allclose(A[:, 0], 1.)
+    np.testing.assert_allclose(eps[:, 0], [.5, .5, .5, .6, .5, .5])
+    np.testing.assert_allclose(Fij.sum(axis=1), 1.)
+    # the opposite face 0.199825 and the 4 adjacent ones 0.200044 of the whole cube
+    assert np.all(np.abs(Fij - (1 - np.eye(6)) * .2) <= 5 * error + 1e-12)
+    assert Fij.shape == error.shape == (6, 6) and n_rays.shape == (6,)
+
+
+@pytest.mark.parametrize('base, cmb, message', [(1, 0, 'subsurface'), (0, 9, 'unknown surface 9'),
+                                                (0, 7, 'cycle')])
+def test_read_vs3_view_factors_rejects(tmp_path, base, cmb, message):
+    path = tmp_path / 'cube.vs3'
+    path.write_text(SPLIT_CUBE_VS3.format(base, cmb))
+    with pytest.raises(ValueError, match=message):
+        raytrace.read_vs3_view_factors(str(path), tol=5e-3)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import blackbody, enclosures, sweep, zonal
+
+FIJ = np.array([[0., .5, .5],
+                [.5, 0., .5],
+                [.5, .5, 0.]])
+AREAS = np.ones((3, 1))
+
+
+def test_gray_sweep_matches_enclosure():
+    rng = np.random.default_rng(0)
+    scenarios = {'eps': rng.uniform(.2, .9, (7, 3)), 'T': rng.uniform(300., 1000., (7, 3))}
+    done = []
+
+    result = sweep.sweep(FIJ, AREAS, scenarios, model='gray', n_workers=1, chunk_size=3,
+                         progress=lambda n, total: done.append((n, total)))
+
+    assert result['Q'].shape == (7, 3)
+    for c in range(7):
+        enclosure = enclosures.Enclosure(FIJ, AREAS, scenarios['eps'][c])
+        Q = enclosure.heat_flow(blackbody.Eb_vectorized(scenarios['T'][c][:, np.newaxis]))
+        np.testing.assert_allclose(result['Q'][c], Q[:, 0], rtol=1e-10)
+    assert done[-1] == (7, 7)
+
+
+def test_zonal_sweep_workers(tmp_path):
+    scenarios = {'qf_in': np.linspace(0., 1000., 6), 'h': np.linspace(5., 20., 6)}
+
+    serial = sweep.sweep(FIJ, AREAS, scenarios, eps=.8, n_workers=1)
+    parallel = sweep.sweep(FIJ, AREAS, scenarios, eps=.8, n_workers=2, chunk_size=2, path=str(tmp_path / 'sweep'))
+
+    assert serial['converged'].all()
+    for name in ('Ts', 'Ta', 'iterations', 'converged'):
+        np.testing.assert_allclose(parallel[name], serial[name], rtol=1e-12)
+    SS = enclosures.Enclosure(FIJ, AREAS, np.full((3, 1), .8)).SS
+    Ts, Ta, info = zonal.solve(SS, AREAS, qf_in=scenarios['qf_in'][4], h=scenarios['h'][4])
+    np.testing.assert_allclose(serial['Ts'][4], Ts[:, 0])
+
+
+def test_unknown_model_or_input():
+    with pytest.raises(ValueError):
+        sweep.sweep(FIJ, AREAS, {'T': np.ones(2)}, model='grey', n_workers=1)
+    with pytest.raises(ValueError):
+        sweep.sweep(FIJ, AREAS, {'qf_in': np.ones(2)}, model='gray', n_workers=1)
+
+
+def test_zonal_sweep_per_surface_TOS():
+    TOS = np.array([[300., 320., 340.],
+                    [280., 300., 360.]])
+    result = sweep.sweep(FIJ, AREAS, {'TOS': TOS}, model='zonal', eps=.8, qf_in=100., n_workers=1)
+
+    SS = enclosures.Enclosure(FIJ, AREAS, np.full((3, 1), .8)).SS
+    for c in range(len(TOS)):
+        Ts, Ta, info = zonal.solve(SS, AREAS, TOS=TOS[c], qf_in=100.)
+        np.testing.assert_allclose(result['Ts'][c], Ts[:, 0])
+        assert result['Ta'][c] == pytest.approx(Ta)
+
+
+def test_resume_refuses_other_scenarios(tmp_path):
+    path = str(tmp_path / 'sweep')
+    T = np.array([300., 400., 500.])
+    first = sweep.sweep(FIJ, AREAS, {'T': T}, model='gray', n_workers=1, path=path)
+    again = sweep.sweep(FIJ, AREAS, {'T': T}, model='gray', n_workers=1, path=path)
+    np.testing.assert_array_equal(first['Q'], again['Q'])
+
+    with pytest.raises(ValueError, match='different sweep'):
+        sweep.sweep(FIJ, AREAS, {'T': T + 100.}, model='gray', n_workers=1, path=path)
+
+
+def test_resume_refuses_other_view_factors(tmp_path):
+    path = str(tmp_path / 'sweep')
+    scenarios = {'T': np.array([300., 400., 500.])}
+    Fij = np.array([[0., .2, .8],
+                    [.2, 0., .8],
+                    [.8, .2, 0.]])
+    sweep.sweep(Fij, AREAS, scenarios, model='gray', n_workers=1, path=path)
+
+    with pytest.raises(ValueError, match='different sweep'):
+        sweep.sweep(Fij[::-1], AREAS, scenarios, model='gray', n_workers=1, path=path)
+    with pytest.raises(ValueError, match='different sweep'):
+        sweep.sweep(Fij, 2 * AREAS, scenarios, model='gray', n_workers=1, path=path)
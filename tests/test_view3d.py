@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import view3d
+
+OUTPUT = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'output.txt')
+
+
+def test_read_output_matches_loadtxt():
+    table = np.loadtxt(OUTPUT, skiprows=1)
+
+    A, Fij, eps = view3d.read_output(OUTPUT)
+
+    np.testing.assert_array_equal(A, table[:1].T)
+    np.testing.assert_array_equal(Fij, table[1:-1])
+    np.testing.assert_array_equal(eps, table[-1:].T)
+    A32, Fij32, eps32 = view3d.read_output(OUTPUT, dtype=np.float32)
+    assert Fij32.dtype == np.float32
+    np.testing.assert_array_equal(Fij32, Fij.astype(np.float32))
+
+
+def test_rows_are_parsed_on_demand(tmp_path):
+    Fij = view3d.read_output(OUTPUT)[1]
+    output = view3d.View3DOutput(OUTPUT)
+
+    assert len(output) == output.N == 6
+    np.testing.assert_array_equal(output[2], Fij[2])
+    np.testing.assert_array_equal(output[-1], Fij[-1])
+    np.testing.assert_array_equal(output[1:4], Fij[1:4])
+    np.testing.assert_array_equal(output.rows(4, 10), Fij[4:])
+    assert output.rows(3, 3).shape == (0, 6)
+    with pytest.raises(IndexError):
+        output[::2]
+
+    blocks = list(output.iter_rows())
+    np.testing.assert_array_equal(np.vstack([block for _, block in blocks]), Fij)
+    out = np.lib.format.open_memmap(str(tmp_path / 'Fij.npy'), mode='w+', dtype=np.float64, shape=(6, 6))
+    assert output.read(out=out) is out
+    np.testing.assert_array_equal(out, Fij)
+
+
+@pytest.mark.parametrize('text', [
+    'View3D 4.0.0 0 1 0\n1\n0\n1\n',
+    'View3D 4.0.0 0 1 0 two\n1 1\n0 1\n1 0\n1 1\n',
+    'View3D 4.0.0 0 1 0 2\n1 1\n0 1\n1 1\n',
+    'View3D 4.0.0 0 1 0 2\n1 1\n0 1\n1\n1 1\n',
+])
+def test_malformed_output(tmp_path, text):
+    path = tmp_path / 'output.txt'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        view3d.read_output(str(path))
+
+
+def test_chunks_follow_the_byte_budget():
+    output = view3d.View3DOutput(OUTPUT)
+    row_bytes = [length for _, length in output._offsets]
+    for chunk_bytes in (1, 2 * row_bytes[0], sum(row_bytes)):
+        chunks = list(output.chunks(chunk_bytes))
+        assert [start for start, _ in chunks] == [0] + [stop for _, stop in chunks[:-1]]
+        assert chunks[-1][1] == output.N
+        for start, stop in chunks:
+            assert stop - start == 1 or sum(row_bytes[start:stop]) <= chunk_bytes
+
+        A, Fij, eps = view3d.read_output(OUTPUT, chunk_bytes=chunk_bytes)
+        np.testing.assert_array_equal(Fij, output.rows(0, output.N))
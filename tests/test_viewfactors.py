@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import viewfactors, viewgr
+
+CUBE = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'cube.vs3')
+
+
+@pytest.mark.parametrize('chunk_size, n_workers', [(1, 1), (4, 2), (4096, 1)])
+def test_unobstructed_view_factors_of_the_cube(chunk_size, n_workers):
+    vertices, shapes = viewgr.read_vs3_file(CUBE, delimiter=' ')
+    A, Fij = viewfactors.unobstructed_view_factors(vertices, shapes, chunk_size=chunk_size, n_workers=n_workers)
+
+    # the opposite face of a unit cube, 0.199825, and the 4 adjacent ones, 0.200044
+    np.testing.assert_allclose(Fij.sum(axis=1), 1., atol=1e-6)
+    np.testing.assert_allclose(np.sort(Fij, axis=1)[:, 1], 0.199825, atol=1e-6)
+    np.testing.assert_allclose(A * Fij, (A * Fij).T)
+
+    A_file, Fij_file, eps = viewfactors.read_vs3_view_factors(CUBE, delimiter=' ')
+    np.testing.assert_array_equal(A_file, A)
+    np.testing.assert_array_equal(Fij_file, Fij)
+
+
+def test_pairs_of_chunk_bounds():
+    N = 7
+    i, j = np.triu_indices(N, k=1)
+    for chunk_size in (1, 4, 21):
+        for start in range(0, len(i), chunk_size):
+            stop = min(start + chunk_size, len(i))
+            chunk_i, chunk_j = viewfactors._pairs(start, stop, N)
+            np.testing.assert_array_equal(chunk_i, i[start:stop])
+            np.testing.assert_array_equal(chunk_j, j[start:stop])
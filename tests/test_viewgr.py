@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import viewgr
+
+CUBE = os.path.join(os.path.dirname(__file__), '..', 'RadiationHeatTransfer', 'examples', 'cube.vs3')
+SQUARE_VS3 = """T Two triangles
+F 3
+V 1 0. 0. 0.
+V 2 1. 0. 0.
+V 3 1. 1. 0.
+V 4 0. 1. 0.
+S 1 1 2 3 0 0 0 0.9 lower
+S 2 1 3 {} 0 0 0 0.8 upper
+End of data
+"""
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / 'square.vs3'
+    path.write_text(SQUARE_VS3.format(4))
+    geometry = viewgr.VS3Geometry.from_file(str(path))
+    np.testing.assert_array_equal(geometry.connectivity, [[0, 1, 2, -1], [0, 2, 3, -1]])
+    np.testing.assert_array_equal(geometry.names, ['lower', 'upper'])
+    np.testing.assert_allclose(geometry.areas, [.5, .5])
+
+
+def test_cube_geometry():
+    geometry = viewgr.VS3Geometry.from_file(CUBE)
+
+    assert geometry.title == 'The unit cube'
+    np.testing.assert_array_equal(geometry.n_vertices, 4)
+    np.testing.assert_allclose(geometry.areas, 1.)
+    # the normals point into the cube
+    np.testing.assert_allclose((geometry.normals * (.5 - geometry.centroids)).sum(axis=1), .5)
+    np.testing.assert_allclose(np.abs(geometry.centroids - .5).max(axis=1), .5)
+    np.testing.assert_allclose(np.abs(geometry.centroids - .5).sum(axis=1), .5)
+    assert geometry.polygons().shape == (6, 4, 3)
+    np.testing.assert_allclose(geometry.emissivity, .5)
+
+    vertices, shapes = viewgr.read_vs3_file(CUBE, delimiter=' ')
+    assert geometry.to_dicts() == (vertices, shapes)
+
+
+def test_from_file_unknown_vertex(tmp_path):
+    path = tmp_path / 'square.vs3'
+    path.write_text(SQUARE_VS3.format(7))
+    with pytest.raises(ValueError, match='line 8: surface 2 refers to the unknown vertex 7'):
+        viewgr.VS3Geometry.from_file(str(path))
+
+
+def test_plot_vs3_geometry_single_collection():
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    geometry = viewgr.VS3Geometry.from_file(CUBE)
+    fig, ax = viewgr.plot_vs3_geometry(geometry)
+    fig.canvas.draw()
+    assert len(ax.collections) == 1
+    assert len(ax.collections[0].get_segments()) == 6 * 4
+
+    fig, ax = viewgr.plot_vs3_geometry(geometry, values=np.arange(6.), labels=True, max_labels=3)
+    assert len(ax.collections) == 1
+    np.testing.assert_array_equal(ax.collections[0].get_array(), np.arange(6.))
+    assert len(ax.texts) <= 3
+    plt.close('all')
+
+
+def test_i_plot_vs3_geometry_single_mesh():
+    pytest.importorskip('plotly')
+
+    geometry = viewgr.VS3Geometry.from_file(CUBE)
+    fig = viewgr.i_plot_vs3_geometry(geometry, values=np.arange(6.))
+
+    mesh, edges = fig.data
+    assert mesh.type == 'mesh3d' and edges.type == 'scatter3d'
+    # two triangles per face, colored by the value of the face
+    assert len(mesh.i) == 12
+    np.testing.assert_array_equal(np.sort(mesh.intensity), np.repeat(np.arange(6.), 2))
+    assert len(viewgr.i_plot_vs3_geometry(geometry, edges=False).data) == 1
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from RadiationHeatTransfer import enclosures, zonal
+
+FIJ = np.array([[0., .5, .5],
+                [.5, 0., .5],
+                [.5, .5, 0.]])
+AREAS = np.ones((3, 1))
+SS = enclosures.Enclosure(FIJ, AREAS, np.full((3, 1), .8)).SS
+QF_IN = np.array([[500.], [0.], [0.]])
+
+
+def test_solve_newton_matches_picard():
+    Ts, Ta, info = zonal.solve(SS, AREAS, qf_in=QF_IN, method='newton', tol=1e-10)
+    Ts_picard, Ta_picard, info_picard = zonal.solve(SS, AREAS, qf_in=QF_IN, method='picard', tol=1e-10)
+
+    assert info['converged'] and info_picard['converged']
+    assert info['iterations'] < info_picard['iterations']
+    assert len(info['residuals']) == info['iterations']
+    np.testing.assert_allclose(Ts, Ts_picard, rtol=1e-8)
+    assert Ta == pytest.approx(Ta_picard, rel=1e-8)
+    # the heat input leaves through the back sides, the air has no other losses
+    assert np.sum(.15 * (Ts - 300.) * AREAS) == pytest.approx(np.sum(QF_IN * AREAS), rel=1e-6)
+    assert Ts.min() < Ta < Ts.max()
+
+
+def test_solve_unknown_method():
+    with pytest.raises(ValueError):
+        zonal.solve(SS, AREAS, qf_in=QF_IN, method='secant')
+
+
+@pytest.mark.parametrize('method', ['explicit', 'semi-implicit', 'implicit'])
+def test_transient_reaches_steady_state(method):
+    Ts, Ta, _ = zonal.solve(SS, AREAS, U=15., qf_in=QF_IN, tol=1e-10)
+
+    steps = list(zonal.transient(SS, AREAS, C=2e3, dt=20., n_steps=2000, U=15., qf_in=QF_IN, Ts=300.,
+                                 C_air=1e3, method=method, output_every=100))
+
+    assert len(steps) == 20
+    assert steps[0][0] == pytest.approx(2000.)
+    t, Ts_end, Ta_end = steps[-1]
+    assert t == pytest.approx(40000.)
+    np.testing.assert_allclose(Ts_end, Ts, rtol=1e-6)
+    assert Ta_end == pytest.approx(Ta, rel=1e-6)
+    # the oven heats up monotonically
+    assert np.all(np.diff([Ts[0, 0] for _, Ts, _ in steps]) >= -1e-9)
+
+
+def test_transient_heater_switched_off():
+    def qf_in(t):
+        return QF_IN if t < 1000. else 0. * QF_IN
+
+    steps = list(zonal.transient(SS, AREAS, C=2e3, dt=10., n_steps=300, qf_in=qf_in, Ts=300., method='implicit'))
+
+    peak = max(range(len(steps)), key=lambda k: steps[k][1][0, 0])
+    assert steps[peak][0] == pytest.approx(1000., abs=10.)
+    assert steps[-1][1][0, 0] < steps[peak][1][0, 0]
+
+
+def test_gradient_matches_finite_differences():
+    w = np.array([[1.], [-2.], [.5]])
+    Ts, Ta, _ = zonal.solve(SS, AREAS, qf_in=QF_IN, tol=1e-12)
+
+    grad = zonal.gradient(SS, AREAS, Ts, Ta, w, dTa=3.)
+
+    def f(**kwargs):
+        Ts, Ta, _ = zonal.solve(SS, AREAS, **dict(dict(qf_in=QF_IN, tol=1e-12), **kwargs))
+        return (w.T @ Ts).item() + 3. * Ta
+
+    for i in range(3):
+        dq = np.zeros((3, 1))
+        dq[i] = 1.
+        expected = (f(qf_in=QF_IN + dq) - f(qf_in=QF_IN - dq)) / 2.
+        assert grad['qf_in'][i, 0] == pytest.approx(expected, rel=1e-5)
+        dh = np.zeros(3)
+        dh[i] = 1e-3
+        expected = (f(h=10. + dh) - f(h=10. - dh)) / 2e-3
+        assert grad['h'][i, 0] == pytest.approx(expected, rel=1e-4, abs=1e-6)
+    expected = (f(TOS=301.) - f(TOS=299.)) / 2.
+    assert grad['TOS'][0] == pytest.approx(expected, rel=1e-5)
+
+
+@pytest.mark.parametrize('method', ['explicit', 'semi-implicit', 'implicit'])
+def test_transient_without_convection_or_air_capacitance(method):
+    kwargs = dict(C=2e4, dt=10., n_steps=20, h=0., qf_in=np.array([[500.], [0.], [0.]]), Ts=300.,
+                  method=method)
+    steps = list(zonal.transient(SS, AREAS, C_air=0., **kwargs))
+    # with a capacitance the decoupled air only adds a constant unknown
+    reference = list(zonal.transient(SS, AREAS, C_air=1e3, **kwargs))
+
+    for (t, Ts, Ta), (_, Ts_ref, Ta_ref) in zip(steps, reference):
+        assert np.all(np.isfinite(Ts))
+        assert Ta == Ta_ref == 300.
+        np.testing.assert_allclose(Ts, Ts_ref, rtol=1e-12)
+    assert steps[-1][1][0, 0] > steps[-1][1][1, 0] > 300.
+
+
+@pytest.mark.parametrize('method', ['newton', 'picard'])
+def test_solve_without_convection(method):
+    qf_in = np.array([[500.], [0.], [0.]])
+    Ts, Ta, info = zonal.solve(SS, AREAS, h=0., qf_in=qf_in, method=method)
+
+    assert info['converged']
+    assert Ta == 300.
+    # radiation only moves heat between the surfaces, the input leaves through the back sides
+    assert np.sum(.15 * (Ts - 300.) * AREAS) == pytest.approx(np.sum(qf_in * AREAS), rel=1e-6)
+    assert Ts[0, 0] > Ts[1, 0] > 300.